@@ -0,0 +1,321 @@
+"""Micro-benchmarks for the backend hot paths.
+
+Usage: python bench.py [dashboard|login|smtp|templates|json|metriques ...]
+
+The smtp benchmark needs aiosmtpd (local SMTP sink).
+"""
+import asyncio
+import logging
+import os
+import sys
+import random
+import socket
+import statistics
+import time
+import tracemalloc
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'cagnotte_bench')
+
+import server  # noqa: E402
+import passwords  # noqa: E402
+import email_service  # noqa: E402
+import email_templates  # noqa: E402
+import kpi_matrice  # noqa: E402
+import metriques  # noqa: E402
+import reponses  # noqa: E402
+
+
+def generer_donnees(nb_participants: int, annee: int, seed: int = 42):
+    """Synthetic active participants with a year of paiements each"""
+    rnd = random.Random(seed)
+    participants = []
+    paiements = []
+    for i in range(nb_participants):
+        pid = f"p{i}"
+        participants.append({"id": pid, "nom": f"Participant {i}", "mois_debut": f"{annee}-{rnd.randint(1, 12):02d}"})
+        for mois_num in range(1, 13):
+            if rnd.random() < 0.9:
+                paiements.append({
+                    "participant_id": pid,
+                    "mois": f"{annee}-{mois_num:02d}",
+                    "montant": 50.0,
+                    "statut": "confirme" if rnd.random() < 0.9 else "en_attente"
+                })
+    return participants, paiements
+
+
+def a_jour_liste(participants, paiements, annee, mois_actuel_num):
+    """Previous implementation: filter the whole list per participant, next() per month"""
+    on_time_count = 0
+    for participant in participants:
+        participant_paiements = [p for p in paiements if p['participant_id'] == participant['id']]
+        mois_debut_year, mois_debut_month = map(int, participant['mois_debut'].split('-'))
+        start_month = mois_debut_month if mois_debut_year == annee else 1
+        is_on_time = True
+        for mois_num in range(start_month, mois_actuel_num):
+            mois_str = f"{annee}-{mois_num:02d}"
+            paiement_mois = next((p for p in participant_paiements if p['mois'] == mois_str), None)
+            if not paiement_mois or paiement_mois['statut'] != 'confirme':
+                is_on_time = False
+                break
+        if is_on_time:
+            on_time_count += 1
+    return on_time_count
+
+
+def a_jour_matrice(participants, paiements, annee, mois_actuel_num):
+    """Current implementation: monthly rollups into the participant × month matrix"""
+    docs = {}
+    for p in paiements:
+        doc = docs.setdefault((p['participant_id'], p['mois']), {
+            "participant_id": p['participant_id'], "mois": p['mois'], "montants": {}, "nombres": {}
+        })
+        doc['montants'][p['statut']] = doc['montants'].get(p['statut'], 0) + p['montant']
+        doc['nombres'][p['statut']] = doc['nombres'].get(p['statut'], 0) + 1
+    matrice = kpi_matrice.Matrice(participants, kpi_matrice.premier_mois(participants, f"{annee}-01"),
+                                  f"{annee}-12", docs.values())
+    return int((~matrice.en_retard(f"{annee}-{mois_actuel_num:02d}")).sum())
+
+
+def chronometrer(fn, *args, repetitions: int = 3) -> float:
+    meilleur = float('inf')
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fn(*args)
+        meilleur = min(meilleur, time.perf_counter() - debut)
+    return meilleur
+
+
+def bench_dashboard():
+    annee, mois_actuel_num = 2026, 12
+    print(f"{'participants':>12} {'paiements':>10} {'liste (ms)':>12} {'matrice (ms)':>12}")
+    for nb in (10, 100, 1000, 5000):
+        participants, paiements = generer_donnees(nb, annee)
+        assert a_jour_liste(participants, paiements, annee, mois_actuel_num) == \
+            a_jour_matrice(participants, paiements, annee, mois_actuel_num)
+        # The quadratic version is only timed once at the largest sizes
+        t_liste = chronometrer(a_jour_liste, participants, paiements, annee, mois_actuel_num,
+                               repetitions=1 if nb >= 1000 else 3)
+        t_matrice = chronometrer(a_jour_matrice, participants, paiements, annee, mois_actuel_num)
+        print(f"{nb:>12} {len(paiements):>10} {t_liste * 1000:>12.2f} {t_matrice * 1000:>12.2f}")
+
+
+async def _tempete_logins(nb_logins: int, hashed: str, hors_boucle: bool):
+    """Event loop lag seen by a 5 ms ticker while nb_logins verifications run"""
+    retards = []
+    en_cours = True
+
+    async def sonde():
+        while en_cours:
+            debut = time.perf_counter()
+            await asyncio.sleep(0.005)
+            retards.append(time.perf_counter() - debut - 0.005)
+
+    async def login():
+        if hors_boucle:
+            await passwords.verify_password("motdepasse", hashed)
+        else:
+            passwords.verify_password_sync("motdepasse", hashed)
+            await asyncio.sleep(0)
+
+    tache = asyncio.create_task(sonde())
+    await asyncio.sleep(0.02)
+    debut = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(nb_logins)))
+    duree = time.perf_counter() - debut
+    en_cours = False
+    await tache
+    return duree, retards
+
+
+def bench_login():
+    hashed = passwords.hash_password_sync("motdepasse")
+    nb_logins = 20
+    print(f"{nb_logins} logins simultanés, bcrypt rounds={passwords.BCRYPT_ROUNDS}, "
+          f"pool={passwords.BCRYPT_MAX_CONCURRENCY}")
+    print(f"{'mode':>12} {'durée (s)':>10} {'lag p50 (ms)':>13} {'lag max (ms)':>13}")
+    for libelle, hors_boucle in (("synchrone", False), ("executor", True)):
+        duree, retards = asyncio.run(_tempete_logins(nb_logins, hashed, hors_boucle))
+        print(f"{libelle:>12} {duree:>10.2f} {statistics.median(retards) * 1000:>13.1f} "
+              f"{max(retards) * 1000:>13.1f}")
+
+
+class _SinkLent:
+    """aiosmtpd handler that accepts everything after a fixed delay"""
+
+    def __init__(self, delai: float):
+        self.delai = delai
+        self.recus = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.delai)
+        self.recus += 1
+        return '250 OK'
+
+
+def bench_smtp():
+    import smtplib
+    from aiosmtpd.controller import Controller
+
+    logging.getLogger('mail.log').setLevel(logging.WARNING)
+    logging.getLogger('email_service').setLevel(logging.WARNING)
+    nb_messages, delai = 200, 0.005
+    handler = _SinkLent(delai)
+    with socket.socket() as libre:
+        libre.bind(('127.0.0.1', 0))
+        host, port = libre.getsockname()
+    controller = Controller(handler, hostname=host, port=port)
+    controller.start()
+    try:
+        messages = [
+            email_service.build_payment_reminder(f"P{i}", f"p{i}@example.com", "2026-01", 50.0, "CHF")
+            for i in range(nb_messages)
+        ]
+        print(f"{nb_messages} rappels, sink local avec {delai * 1000:.0f} ms par message")
+        print(f"{'mode':>24} {'durée (s)':>10} {'messages/s':>11}")
+
+        # Previous behaviour: one connection per message, sent serially
+        debut = time.perf_counter()
+        for msg in messages:
+            with smtplib.SMTP(host, port) as connexion:
+                connexion.sendmail(email_service.FROM_EMAIL, [msg.to], msg.data)
+        duree = time.perf_counter() - debut
+        print(f"{'connexion par message':>24} {duree:>10.2f} {nb_messages / duree:>11.0f}")
+
+        for taille in (1, 3, 8):
+            pool = email_service.SMTPPool(host, port, None, None, starttls=False, size=taille)
+            debut = time.perf_counter()
+            resultats = asyncio.run(pool.send_many(messages))
+            duree = time.perf_counter() - debut
+            pool.close()
+            assert all(resultats)
+            print(f"{'pool de ' + str(taille):>24} {duree:>10.2f} {nb_messages / duree:>11.0f}")
+    finally:
+        controller.stop()
+
+
+def _rappel_mime(params):
+    """Previous construction: a MIMEMultipart/MIMEText tree serialised per message"""
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = email_templates.RAPPEL_SUJET.render(params)
+    msg['From'] = email_service.FROM_EMAIL
+    msg['To'] = params['participant_email']
+    msg.attach(MIMEText(email_templates.RAPPEL.render(params), 'html', 'utf-8'))
+    return msg.as_bytes()
+
+
+def bench_templates():
+    nb = 10_000
+    destinataires = [
+        {"participant_name": f"Participant <{i}> & Co", "participant_email": f"p{i}@example.com",
+         "mois": "2026-01", "montant": 50.0, "devise": "CHF"}
+        for i in range(nb)
+    ]
+    print(f"{nb} rappels")
+    print(f"{'étape':>28} {'durée (ms)':>11} {'µs/message':>11}")
+    mesures = (
+        ("rendu HTML seul", lambda: email_templates.RAPPEL.render_many(destinataires)),
+        ("MIMEMultipart par message", lambda: [_rappel_mime(d) for d in destinataires]),
+        ("en-têtes précalculés", lambda: email_service.build_payment_reminders(destinataires)),
+    )
+    for libelle, fn in mesures:
+        duree = chronometrer(fn)
+        print(f"{libelle:>28} {duree * 1000:>11.1f} {duree / nb * 1e6:>11.1f}")
+
+
+def _reponse_fastapi(champ, contenu) -> bytes:
+    """Default path of a route with response_model: validate, serialize, json.dumps"""
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    return JSONResponse(asyncio.run(serialize_response(field=champ, response_content=contenu))).body
+
+
+def _memoire_max(fn) -> int:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_json():
+    from fastapi.utils import create_response_field
+    import json
+
+    champ = create_response_field(name="Response", type_=server.PagePaiements)
+    print(f"{'paiements':>10} {'mode':>10} {'durée (ms)':>11} {'pic mémoire (Mo)':>17}")
+    for nb in (10_000, 100_000):
+        items = [{
+            "id": f"00000000-0000-0000-0000-{i:012d}", "participant_id": f"p{i % 500}",
+            "mois": f"2026-{i % 12 + 1:02d}", "montant": 50.0, "methode": "TWINT", "raison": None,
+            "notes_admin": None, "statut": "confirme", "date": "2026-01-03T10:00:00+00:00"
+        } for i in range(nb)]
+        page = {"items": items, "next_cursor": None, "total": nb}
+        modes = (
+            ("fastapi", lambda: _reponse_fastapi(champ, page)),
+            ("adapter", lambda: reponses.encoder(server.PAGE_PAIEMENTS_ADAPTER, page, 'adapter')),
+            ("confiance", lambda: reponses.encoder(server.PAGE_PAIEMENTS_ADAPTER, page, 'confiance')),
+        )
+        reference = json.loads(modes[0][1]())
+        for libelle, fn in modes:
+            assert json.loads(fn()) == reference
+            duree = chronometrer(fn)
+            pic = _memoire_max(fn)
+            print(f"{nb:>10} {libelle:>10} {duree * 1000:>11.1f} {pic / 1e6:>17.1f}")
+
+
+def bench_metriques():
+    """Cost of MetriquesMiddleware per request, on an app that does nothing"""
+    async def application(scope, receive, send):
+        scope["endpoint"] = bench_metriques
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def send(message):
+        pass
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    class App:
+        routes = [type("Route", (), {"endpoint": bench_metriques, "path": "/"})]
+
+    async def boucle(asgi, nb):
+        for _ in range(nb):
+            await asgi({"type": "http", "method": "GET", "path": "/", "app": App}, receive, send)
+
+    nb = 100_000
+    avec = metriques.MetriquesMiddleware(application, metriques.Registre())
+    sans = chronometrer(lambda: asyncio.run(boucle(application, nb)))
+    mesure = chronometrer(lambda: asyncio.run(boucle(avec, nb)))
+    print(f"{nb} requêtes: {sans:.3f}s sans, {mesure:.3f}s avec le middleware "
+          f"({(mesure - sans) / nb * 1e6:.1f} µs par requête)")
+
+
+BENCHMARKS = {
+    "dashboard": bench_dashboard,
+    "login": bench_login,
+    "smtp": bench_smtp,
+    "templates": bench_templates,
+    "json": bench_json,
+    "metriques": bench_metriques,
+}
+
+
+def main():
+    noms = sys.argv[1:] or list(BENCHMARKS)
+    for nom in noms:
+        if nom not in BENCHMARKS:
+            print(f"Benchmark inconnu: {nom} (disponibles: {', '.join(BENCHMARKS)})")
+            return 1
+        print(f"== {nom} ==")
+        BENCHMARKS[nom]()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
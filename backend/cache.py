@@ -0,0 +1,137 @@
+"""In-process caches for data that is read on every request but rarely written."""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigCagnotte(BaseModel):
+    """Typed view of the ``config`` collection"""
+    montant_mensuel: float = 50.0
+    devise: str = 'CHF'
+    titre: str = 'Cagnotte Cadre SIC'
+    items: List[Dict[str, Any]] = []
+
+    @classmethod
+    def depuis_documents(cls, documents: List[Dict[str, Any]]) -> "ConfigCagnotte":
+        valeurs = {d['key']: d.get('value') for d in documents}
+        config = cls(items=documents)
+        if valeurs.get('montant_mensuel') is not None:
+            try:
+                config.montant_mensuel = float(valeurs['montant_mensuel'])
+            except ValueError:
+                logger.warning(f"montant_mensuel invalide: {valeurs['montant_mensuel']!r}")
+        if valeurs.get('devise'):
+            config.devise = valeurs['devise']
+        if valeurs.get('titre'):
+            config.titre = valeurs['titre']
+        return config
+
+
+class _EntreeConfig:
+    __slots__ = ("config", "expire", "generation", "lock")
+
+    def __init__(self):
+        self.config: Optional[ConfigCagnotte] = None
+        self.expire = 0.0
+        self.generation = 0
+        self.lock = asyncio.Lock()
+
+
+class ConfigCache:
+    """``config`` of each cagnotte kept in memory and reloaded after ``ttl`` seconds.
+
+    Writes in this process call :meth:`invalidate`; other workers pick the
+    change up when their TTL expires. Each cagnotte has its own entry and
+    lock, so a reload never waits for another pot.
+    """
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self._entrees: Dict[str, _EntreeConfig] = {}
+
+    async def get(self, db, cagnotte_id: str) -> ConfigCagnotte:
+        entree = self._entrees.get(cagnotte_id)
+        if entree is None:
+            entree = self._entrees.setdefault(cagnotte_id, _EntreeConfig())
+        if entree.config is not None and time.monotonic() < entree.expire:
+            return entree.config
+        async with entree.lock:
+            if entree.config is not None and time.monotonic() < entree.expire:
+                return entree.config
+            generation = entree.generation
+            documents = await db.config.find({"cagnotte_id": cagnotte_id}, {"_id": 0, "cagnotte_id": 0}).to_list(None)
+            config = ConfigCagnotte.depuis_documents(documents)
+            if not documents:
+                # Unknown cagnotte (e.g. a made-up path prefix): not worth an entry
+                self._entrees.pop(cagnotte_id, None)
+            # Do not keep a value loaded before a concurrent invalidation
+            elif generation == entree.generation:
+                entree.config = config
+                entree.expire = time.monotonic() + self.ttl
+            return config
+
+    def invalidate(self, cagnotte_id: str) -> None:
+        entree = self._entrees.get(cagnotte_id)
+        if entree is not None:
+            entree.generation += 1
+            entree.config = None
+            entree.expire = 0.0
+
+
+class Principal(NamedTuple):
+    user: Dict[str, Any]
+    is_admin: bool
+
+
+class PrincipalCache:
+    """Bounded LRU of authenticated users per cagnotte, with a short TTL.
+
+    ``maxsize`` applies to each cagnotte, so a busy pot cannot evict the
+    users of the others. Routes that change a participant must
+    :meth:`evict` it; other workers see the change once the TTL has expired.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._cagnottes: "Dict[str, OrderedDict[str, Tuple[float, Principal]]]" = {}
+        self.generation = 0
+
+    def get(self, cagnotte_id: str, user_id: str) -> Optional[Principal]:
+        entries = self._cagnottes.get(cagnotte_id)
+        entry = entries.get(user_id) if entries is not None else None
+        if entry is None:
+            return None
+        expire, principal = entry
+        if time.monotonic() >= expire:
+            del entries[user_id]
+            return None
+        entries.move_to_end(user_id)
+        return principal
+
+    def put(self, cagnotte_id: str, user_id: str, principal: Principal, generation: Optional[int] = None) -> None:
+        """Store a principal; pass the ``generation`` read before loading it so
+        that a value loaded before a concurrent eviction is dropped."""
+        if generation is not None and generation != self.generation:
+            return
+        entries = self._cagnottes.setdefault(cagnotte_id, OrderedDict())
+        entries[user_id] = (time.monotonic() + self.ttl, principal)
+        entries.move_to_end(user_id)
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def evict(self, cagnotte_id: str, user_id: str) -> None:
+        self.generation += 1
+        entries = self._cagnottes.get(cagnotte_id)
+        if entries is not None:
+            entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._cagnottes.clear()
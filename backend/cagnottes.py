@@ -0,0 +1,146 @@
+"""Several pots ("cagnottes") served by one process.
+
+Every document of the per-pot collections (``COLLECTIONS``) carries a
+``cagnotte_id``, every query filters on it and the indexes of those
+collections start with it. The cagnotte of a request is:
+
+* when authenticated, the cagnotte of the user: a JWT claim, checked
+  against the participant document, so a token never reads another pot;
+* otherwise the ``/api/c/<cagnotte_id>/...`` prefix, which
+  ``PrefixeMiddleware`` rewrites to ``/api/...`` so that all pots share the
+  same routes, or ``CAGNOTTE_DEFAUT``.
+
+A prefix naming another cagnotte than the token is refused. Documents
+written before multi-tenancy belong to ``CAGNOTTE_DEFAUT`` (``migrer``).
+
+``python cagnottes.py creer <id> <titre> <admin_email> <mot_de_passe>``
+creates a pot with its config and its first admin.
+"""
+import asyncio
+import logging
+import os
+import re
+import sys
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import Request
+
+import passwords
+
+logger = logging.getLogger(__name__)
+
+CAGNOTTE_DEFAUT = os.environ.get('CAGNOTTE_DEFAUT', 'defaut')
+
+FORMAT_ID = r"[a-z0-9][a-z0-9_-]{0,63}"
+_PREFIXE = re.compile(rf"^/api/c/({FORMAT_ID})(/.*)$")
+
+COLLECTIONS = (
+    "participants", "paiements", "paiements_archive", "paiement_rollups",
+    "config", "clotures", "cloture_participants", "jobs",
+)
+
+CONFIG_DEFAUT = {"montant_mensuel": "50", "devise": "CHF", "titre": "Cagnotte Cadre SIC"}
+
+
+class PrefixeMiddleware:
+    """Rewrites ``/api/c/<cagnotte_id>/...`` to ``/api/...`` and keeps the id in the scope"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            correspondance = _PREFIXE.match(scope["path"])
+            if correspondance:
+                chemin = "/api" + correspondance.group(2)
+                scope = {**scope, "path": chemin, "raw_path": chemin.encode(), "cagnotte_id": correspondance.group(1)}
+        await self.app(scope, receive, send)
+
+
+def du_chemin(request: Request) -> Optional[str]:
+    """Cagnotte named by the path prefix, if any"""
+    return request.scope.get("cagnotte_id")
+
+
+def anonyme(request: Request) -> str:
+    """Cagnotte of a request without token"""
+    return du_chemin(request) or CAGNOTTE_DEFAUT
+
+
+async def migrer(db) -> None:
+    """Attach the documents written before multi-tenancy to CAGNOTTE_DEFAUT"""
+    for collection in COLLECTIONS:
+        resultat = await db[collection].update_many(
+            {"cagnotte_id": {"$exists": False}}, {"$set": {"cagnotte_id": CAGNOTTE_DEFAUT}}
+        )
+        if resultat.modified_count:
+            logger.info(f"{resultat.modified_count} document(s) de {collection} rattaché(s) à {CAGNOTTE_DEFAUT}")
+
+
+async def initialiser_config(db, cagnotte_id: str, **valeurs: str) -> None:
+    """Default config entries of a cagnotte, existing values are kept"""
+    for cle, valeur in {**CONFIG_DEFAUT, **valeurs}.items():
+        await db.config.update_one(
+            {"cagnotte_id": cagnotte_id, "key": cle},
+            {"$setOnInsert": {"value": valeur}},
+            upsert=True
+        )
+
+
+async def lister(db) -> List[str]:
+    return sorted(await db.participants.distinct("cagnotte_id"))
+
+
+async def creer(db, cagnotte_id: str, titre: str, admin_email: str, mot_de_passe: str) -> None:
+    if not re.fullmatch(FORMAT_ID, cagnotte_id):
+        raise ValueError(f"Identifiant de cagnotte invalide: {cagnotte_id!r} (minuscules, chiffres, - et _)")
+    if await db.participants.find_one({"cagnotte_id": cagnotte_id}, {"_id": 1}):
+        raise ValueError(f"La cagnotte {cagnotte_id} existe déjà")
+    await initialiser_config(db, cagnotte_id, titre=titre)
+    maintenant = datetime.now(timezone.utc)
+    await db.participants.insert_one({
+        "id": str(uuid.uuid4()),
+        "cagnotte_id": cagnotte_id,
+        "nom": "Administrateur",
+        "email": admin_email,
+        "password": await passwords.hash_password(mot_de_passe),
+        "actif": True,
+        "admin": True,
+        "mois_debut": maintenant.strftime("%Y-%m"),
+        "created_at": maintenant.isoformat()
+    })
+
+
+async def _main(argv: List[str]) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        if argv[:1] == ["creer"] and len(argv) == 5:
+            try:
+                await creer(db, *argv[1:])
+            except ValueError as e:
+                print(e)
+                return 1
+            print(f"Cagnotte {argv[1]} créée, connexion via /api/c/{argv[1]}/auth/login")
+            return 0
+        if argv == ["liste"]:
+            for cagnotte_id in await lister(db):
+                print(cagnotte_id)
+            return 0
+        print("Usage: python cagnottes.py creer <id> <titre> <admin_email> <mot_de_passe> | liste")
+        return 2
+    finally:
+        client.close()
+        passwords.shutdown()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -0,0 +1,238 @@
+"""Year-end close: immutable snapshots, archived paiements, read-only years.
+
+Closing a year that is over (``cloturer``):
+
+1. a ``clotures`` document ``{cagnotte_id, annee, statut: "en_cours"}`` is
+   inserted (unique on both): from then on the year is read-only. The
+   pending paiements are counted only then; a declaration checks the
+   closed years again after its insert and withdraws itself when it sees
+   the marker, so none slips in after the count. When there are some, the
+   document is removed again and the close refused;
+2. the per-participant figures of the year are written to
+   ``cloture_participants`` and the per-month totals to the ``clotures``
+   document, from ``paiement_rollups``; neither is modified afterwards;
+3. the year's paiements are copied to ``paiements_archive`` and removed
+   from ``paiements`` by batches, so the hot collection only holds the
+   open years;
+4. the statut becomes ``cloturee``.
+
+A close interrupted at any step is resumed by running it again. The
+rollups of closed years are kept, so the matrix and the late-month checks
+still see previous years; ``rollups.recalculer`` leaves them alone. Each
+cagnotte closes its years on its own.
+
+``python clotures.py 2025 [CAGNOTTE]`` closes a year from the command line.
+"""
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+import cagnottes
+import kpi_matrice
+import versions
+from indexes import filtre_annee
+
+logger = logging.getLogger(__name__)
+
+LOT_ARCHIVE = 1000
+EN_COURS, CLOTUREE = "en_cours", "cloturee"
+
+
+async def annees_cloturees(db, cagnotte_id: str, terminees: bool = False) -> List[int]:
+    """Closed years of a cagnotte; a close in progress counts unless ``terminees``"""
+    filtre: Dict[str, Any] = {"cagnotte_id": cagnotte_id}
+    if terminees:
+        filtre["statut"] = CLOTUREE
+    return sorted([c['annee'] async for c in db.clotures.find(filtre, {"_id": 0, "annee": 1})])
+
+
+def filtre_ouvert(annees: List[int]) -> Dict[str, Any]:
+    """Filter excluding the paiements of ``annees`` (empty when none)"""
+    return {"$nor": [{"mois": filtre_annee(a)} for a in annees]} if annees else {}
+
+
+def annee_du_mois(mois: str) -> int:
+    return int(mois[:4])
+
+
+async def verifier_ouvert(db, cagnotte_id: str, *mois: str) -> None:
+    """400 when one of the months belongs to a closed year"""
+    annees = set(await annees_cloturees(db, cagnotte_id))
+    for m in mois:
+        if annee_du_mois(m) in annees:
+            raise HTTPException(status_code=400, detail=f"L'année {annee_du_mois(m)} est clôturée, ses paiements ne sont plus modifiables")
+
+
+async def instantane(db, cagnotte_id: str, annee: int, montant_mensuel: float) -> Dict[str, Any]:
+    """Per-participant and per-month figures of ``annee`` from the rollups"""
+    debut, fin = f"{annee}-01", f"{annee}-12"
+    participants = await db.participants.find(
+        {"cagnotte_id": cagnotte_id}, {"_id": 0, "id": 1, "nom": 1, "actif": 1, "mois_debut": 1}
+    ).sort([("nom", 1), ("id", 1)]).to_list(None)
+    docs = await db.paiement_rollups.find(
+        {"cagnotte_id": cagnotte_id, "mois": filtre_annee(annee)}, {"_id": 0, "participant_id": 1, "mois": 1, "montants": 1, "nombres": 1}
+    ).to_list(None)
+    matrice = kpi_matrice.Matrice(participants, debut, fin, docs, defaut_debut=debut)
+
+    mois_attendus = matrice.nb_mois_attendus()
+    confirme = matrice.total_confirme()
+    en_attente = matrice.total_en_attente()
+    mois_regles = matrice.regle.sum(axis=1)
+    mois_en_retard = matrice.retards(f"{annee + 1}-01")
+    lignes = []
+    for i, p in enumerate(participants):
+        if not mois_attendus[i] and not matrice.paye[i].any():
+            continue
+        attendu = round(float(mois_attendus[i]) * montant_mensuel, 2)
+        lignes.append({
+            "cagnotte_id": cagnotte_id,
+            "annee": annee,
+            "participant_id": p['id'],
+            "nom": p['nom'],
+            "actif": p.get('actif', True),
+            "confirme": round(float(confirme[i]), 2),
+            "en_attente": round(float(en_attente[i]), 2),
+            "attendu": attendu,
+            "manquant": round(max(0.0, attendu - float(confirme[i])), 2),
+            "progression": float(confirme[i]) * 100 / attendu if attendu > 0 else 0.0,
+            "mois_attendus": int(mois_attendus[i]),
+            "mois_regles": int(mois_regles[i]),
+            "mois_en_retard": int(mois_en_retard[i]),
+        })
+
+    nombres: Dict[str, int] = {}
+    for r in docs:
+        nombres[r['mois']] = nombres.get(r['mois'], 0) + sum(r.get('nombres', {}).values())
+    par_mois = [
+        {
+            "mois": m,
+            "confirme": round(float(matrice.confirme[:, j].sum()), 2),
+            "en_attente": round(float(matrice.en_attente[:, j].sum()), 2),
+            "paiements": nombres.get(m, 0),
+            "participants_regles": int(matrice.regle[:, j].sum()),
+        }
+        for j, m in enumerate(matrice.mois)
+    ]
+    totaux = {
+        "confirme": round(sum(m['confirme'] for m in par_mois), 2),
+        "en_attente": round(sum(m['en_attente'] for m in par_mois), 2),
+        "paiements": sum(m['paiements'] for m in par_mois),
+        "participants": len(lignes),
+        "montant_mensuel": montant_mensuel,
+    }
+    return {"participants": lignes, "mois": par_mois, "totaux": totaux}
+
+
+async def figures_participants(db, cagnotte_id: str, annee: int,
+                               participant_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Snapshot rows of a closed year (one participant, or all sorted by name)"""
+    if not await db.clotures.find_one(
+        {"cagnotte_id": cagnotte_id, "annee": annee, "totaux": {"$exists": True}}, {"_id": 1}
+    ):
+        raise HTTPException(status_code=400, detail=f"L'année {annee} n'est pas clôturée")
+    filtre: Dict[str, Any] = {"cagnotte_id": cagnotte_id, "annee": annee}
+    if participant_id:
+        filtre["participant_id"] = participant_id
+    return await db.cloture_participants.find(filtre, {"_id": 0, "cagnotte_id": 0}).sort([("nom", 1), ("participant_id", 1)]).to_list(None)
+
+
+async def _archiver(db, cagnotte_id: str, annee: int) -> int:
+    """Move the paiements of ``annee`` to ``paiements_archive``; returns how many were moved"""
+    deplaces = 0
+    while True:
+        lot = await db.paiements.find({"cagnotte_id": cagnotte_id, "mois": filtre_annee(annee)}).sort("id", 1).to_list(LOT_ARCHIVE)
+        if not lot:
+            return deplaces
+        try:
+            await db.paiements_archive.insert_many(lot, ordered=False)
+        except BulkWriteError as e:
+            # Already copied by an interrupted close
+            if any(err['code'] != 11000 for err in e.details.get('writeErrors', [])):
+                raise
+        await db.paiements.delete_many({"_id": {"$in": [p['_id'] for p in lot]}})
+        await versions.bump_paiements(db, cagnotte_id, lot)
+        deplaces += len(lot)
+
+
+async def cloturer(db, cagnotte_id: str, annee: int, montant_mensuel: float,
+                   par: Optional[str] = None) -> Dict[str, Any]:
+    """Close ``annee`` (or resume an interrupted close); returns the ``clotures`` document"""
+    if annee >= datetime.now(timezone.utc).year:
+        raise HTTPException(status_code=400, detail="Seules les années écoulées peuvent être clôturées")
+    cle = {"cagnotte_id": cagnotte_id, "annee": annee}
+    cloture = await db.clotures.find_one(cle, {"_id": 0})
+    if cloture and cloture['statut'] == CLOTUREE:
+        raise HTTPException(status_code=400, detail=f"L'année {annee} est déjà clôturée")
+
+    if not cloture:
+        cloture = {**cle, "statut": EN_COURS, "debut": datetime.now(timezone.utc).isoformat(), "par": par}
+        try:
+            # The year is read-only from here on, so the figures cannot change under us
+            await db.clotures.insert_one(dict(cloture))
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail=f"Une clôture de {annee} est déjà en cours")
+        # Counted after the marker: a declaration accepted before it is seen here
+        nb_en_attente = await db.paiements.count_documents(
+            {"cagnotte_id": cagnotte_id, "mois": filtre_annee(annee), "statut": "en_attente"}
+        )
+        if nb_en_attente:
+            await db.clotures.delete_one({**cle, "statut": EN_COURS, "debut": cloture['debut']})
+            await versions.bump(db, cagnotte_id, versions.CLOTURES)
+            raise HTTPException(
+                status_code=400,
+                detail=f"{nb_en_attente} paiement(s) en attente en {annee}: confirmez-les ou supprimez-les avant la clôture"
+            )
+
+    if 'totaux' not in cloture:
+        figures = await instantane(db, cagnotte_id, annee, montant_mensuel)
+        await db.cloture_participants.delete_many(cle)
+        if figures['participants']:
+            await db.cloture_participants.insert_many(figures['participants'])
+        await db.clotures.update_one(cle, {"$set": {"mois": figures['mois'], "totaux": figures['totaux']}})
+        await versions.bump(db, cagnotte_id, versions.CLOTURES)
+
+    deplaces = await _archiver(db, cagnotte_id, annee)
+    logger.info(f"Clôture {cagnotte_id} {annee}: {deplaces} paiement(s) archivé(s)")
+    await db.clotures.update_one(
+        cle,
+        {"$set": {"statut": CLOTUREE, "fin": datetime.now(timezone.utc).isoformat()}}
+    )
+    await versions.bump(db, cagnotte_id, versions.CLOTURES, versions.PAIEMENTS)
+    return await db.clotures.find_one(cle, {"_id": 0, "cagnotte_id": 0})
+
+
+async def _main(argv: List[str]) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    if len(argv) not in (1, 2) or not argv[0].isdigit():
+        print("Usage: python clotures.py ANNEE [CAGNOTTE]")
+        return 2
+    cagnotte_id = argv[1] if len(argv) == 2 else cagnottes.CAGNOTTE_DEFAUT
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        config = await db.config.find_one({"cagnotte_id": cagnotte_id, "key": "montant_mensuel"})
+        cloture = await cloturer(db, cagnotte_id, int(argv[0]), float(config['value']) if config else 50.0, par="cli")
+    except HTTPException as e:
+        print(e.detail)
+        return 1
+    finally:
+        client.close()
+    totaux = cloture['totaux']
+    print(f"{cloture['annee']} clôturée: {totaux['participants']} participants, "
+          f"{totaux['paiements']} paiements, {totaux['confirme']:.2f} confirmés")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
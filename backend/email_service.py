@@ -1,162 +1,227 @@
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import queue
+import threading
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import base64
+import uuid
+from email.header import Header
+from functools import lru_cache
 from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
 import os
 import logging
 
+import email_templates
+
 logger = logging.getLogger(__name__)
 
 # Email configuration
-SMTP_HOST = "smtp.wizardaring.ch"
-SMTP_PORT = 587
-SMTP_USER = "cagnotte@wizardaring.ch"
-SMTP_PASSWORD = "Q15~s3v3x"
-FROM_EMAIL = "cagnotte@wizardaring.ch"
-
-def send_email(to_email: str, subject: str, html_content: str) -> bool:
-    """Send email using SMTP"""
-    try:
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = FROM_EMAIL
-        msg['To'] = to_email
-        
-        html_part = MIMEText(html_content, 'html', 'utf-8')
-        msg.attach(html_part)
-        
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            server.send_message(msg)
-        
-        logger.info(f"Email envoyé à {to_email}")
-        return True
-    except Exception as e:
-        logger.error(f"Erreur envoi email à {to_email}: {str(e)}")
-        return False
-
-def send_payment_reminder(participant_name: str, participant_email: str, mois: str, montant: float, devise: str) -> bool:
-    """Send payment reminder email"""
-    subject = f"Rappel - Paiement Cagnotte Cadre SIC ({mois})"
-    
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="utf-8">
-        <style>
-            body {{ font-family: 'Inter', Arial, sans-serif; line-height: 1.6; color: #333; }}
-            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-            .header {{ background: linear-gradient(135deg, #0F5C4C 0%, #0a4739 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-            .content {{ background: #f8f9fa; padding: 30px; border-radius: 0 0 10px 10px; }}
-            .amount {{ font-size: 28px; font-weight: bold; color: #0F5C4C; text-align: center; margin: 20px 0; }}
-            .button {{ display: inline-block; background: #0F5C4C; color: white; padding: 12px 30px; text-decoration: none; border-radius: 5px; margin: 20px 0; }}
-            .footer {{ text-align: center; margin-top: 20px; color: #666; font-size: 12px; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>Rappel de Paiement</h1>
-                <p>Cagnotte Cadre SIC</p>
-            </div>
-            <div class="content">
-                <p>Bonjour {participant_name},</p>
-                
-                <p>Nous vous rappelons que votre contribution pour le mois de <strong>{mois}</strong> n'a pas encore été enregistrée.</p>
-                
-                <div class="amount">{montant:.2f} {devise}</div>
-                
-                <p><strong>Méthodes de paiement :</strong></p>
-                <ul>
-                    <li>TWINT</li>
-                    <li>Virement bancaire</li>
-                </ul>
-                
-                <p>Une fois le versement effectué, pensez à le déclarer sur la plateforme.</p>
-                
-                <div style="text-align: center;">
-                    <a href="https://wizardaring.ch" class="button">Accéder à la plateforme</a>
-                </div>
-                
-                <p>Merci pour votre participation !</p>
-            </div>
-            <div class="footer">
-                <p>Cagnotte Cadre SIC - wizardaring.ch</p>
-                <p>Cet email a été envoyé automatiquement, merci de ne pas y répondre.</p>
-            </div>
-        </div>
-    </body>
-    </html>
+SMTP_HOST = os.environ.get('SMTP_HOST', "smtp.wizardaring.ch")
+SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
+SMTP_USER = os.environ.get('SMTP_USER', "cagnotte@wizardaring.ch")
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', "Q15~s3v3x")
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', 'true').lower() == 'true'
+SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', '3'))
+SMTP_BATCH_SIZE = int(os.environ.get('SMTP_BATCH_SIZE', '20'))
+FROM_EMAIL = os.environ.get('FROM_EMAIL', "cagnotte@wizardaring.ch")
+
+class OutgoingMessage(NamedTuple):
+    """A message ready for ``sendmail``: recipient and RFC 5322 bytes"""
+    to: str
+    data: bytes
+
+def _est_transitoire(e: Exception) -> bool:
+    """Failures worth retrying on a fresh connection"""
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in e.recipients.values())
+    if isinstance(e, smtplib.SMTPResponseException):
+        return 400 <= e.smtp_code < 500
+    return isinstance(e, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError))
+
+class SMTPPool:
+    """Small pool of authenticated SMTP connections used from worker threads.
+
+    At most ``size`` connections exist and at most ``size`` batches are sent
+    concurrently; each batch reuses one connection for all its messages.
+    Transient failures are retried on a new connection with exponential
+    backoff.
     """
-    
-    return send_email(participant_email, subject, html_content)
-
-def send_admin_monthly_summary(admin_email: str, stats: dict) -> bool:
-    """Send monthly summary to admin"""
-    subject = f"Résumé Mensuel - Cagnotte Cadre SIC ({datetime.now().strftime('%B %Y')})"
-    
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="utf-8">
-        <style>
-            body {{ font-family: 'Inter', Arial, sans-serif; line-height: 1.6; color: #333; }}
-            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-            .header {{ background: linear-gradient(135deg, #0F5C4C 0%, #0a4739 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-            .content {{ background: #f8f9fa; padding: 30px; border-radius: 0 0 10px 10px; }}
-            .stat-box {{ background: white; padding: 15px; margin: 10px 0; border-radius: 8px; border-left: 4px solid #0F5C4C; }}
-            .stat-label {{ font-size: 12px; color: #666; text-transform: uppercase; }}
-            .stat-value {{ font-size: 24px; font-weight: bold; color: #0F5C4C; }}
-            table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
-            th {{ background: #0F5C4C; color: white; padding: 10px; text-align: left; }}
-            td {{ padding: 10px; border-bottom: 1px solid #ddd; }}
-            .footer {{ text-align: center; margin-top: 20px; color: #666; font-size: 12px; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>Résumé Mensuel</h1>
-                <p>Cagnotte Cadre SIC</p>
-            </div>
-            <div class="content">
-                <div class="stat-box">
-                    <div class="stat-label">Total Confirmé</div>
-                    <div class="stat-value">{stats.get('total_confirme', 0):.2f} CHF</div>
-                </div>
-                
-                <div class="stat-box">
-                    <div class="stat-label">En Attente</div>
-                    <div class="stat-value">{stats.get('total_en_attente', 0):.2f} CHF</div>
-                </div>
-                
-                <div class="stat-box">
-                    <div class="stat-label">Participants en Retard</div>
-                    <div class="stat-value">{stats.get('nb_retards', 0)}</div>
-                </div>
-                
-                <h3>Détail par Participant</h3>
-                <table>
-                    <thead>
-                        <tr>
-                            <th>Nom</th>
-                            <th>Statut</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-                        {stats.get('details_html', '')}
-                    </tbody>
-                </table>
-            </div>
-            <div class="footer">
-                <p>Cagnotte Cadre SIC - wizardaring.ch</p>
-            </div>
-        </div>
-    </body>
-    </html>
+
+    def __init__(self, host: str, port: int, user: Optional[str], password: Optional[str],
+                 starttls: bool = True, size: int = 3, max_retries: int = 3, backoff: float = 0.5,
+                 timeout: float = 30.0):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.size = size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[smtplib.SMTP]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="smtp")
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.user:
+                server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def _acquire(self) -> smtplib.SMTP:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    @staticmethod
+    def _discard(server: Optional[smtplib.SMTP]) -> None:
+        if server is not None:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def send_batch_sync(self, messages: List[OutgoingMessage]) -> List[bool]:
+        """Send messages over one pooled connection; blocking, run it in a thread"""
+        results = []
+        with self._slots:
+            server = None
+            for msg in messages:
+                sent = False
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        if server is None:
+                            server = self._acquire()
+                        server.sendmail(FROM_EMAIL, [msg.to], msg.data)
+                        sent = True
+                        break
+                    except Exception as e:
+                        self._discard(server)
+                        server = None
+                        if not _est_transitoire(e) or attempt == self.max_retries:
+                            logger.error(f"Erreur envoi email à {msg.to}: {str(e)}")
+                            break
+                        time.sleep(self.backoff * 2 ** attempt)
+                if sent:
+                    logger.info(f"Email envoyé à {msg.to}")
+                results.append(sent)
+            if server is not None:
+                self._idle.put(server)
+        return results
+
+    async def send_many(self, messages: List[OutgoingMessage], batch_size: int = SMTP_BATCH_SIZE) -> List[bool]:
+        """Send messages concurrently from the thread pool, in batches; one result per message"""
+        loop = asyncio.get_running_loop()
+        batches = [messages[i:i + batch_size] for i in range(0, len(messages), batch_size)]
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self._executor, self.send_batch_sync, batch) for batch in batches
+        ))
+        return [sent for batch_results in results for sent in batch_results]
+
+    def close(self) -> None:
+        while True:
+            try:
+                server = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                server.quit()
+            except Exception:
+                self._discard(server)
+        self._executor.shutdown(wait=False)
+
+smtp_pool = SMTPPool(SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, starttls=SMTP_STARTTLS, size=SMTP_POOL_SIZE)
+
+# Everything but the Subject, the To and the body is the same for every
+# message, so the MIME headers are built once here.
+_BOUNDARY = f"==cagnotte_{uuid.uuid4().hex}=="
+_ENTETE = (
+    "MIME-Version: 1.0\r\n"
+    f'Content-Type: multipart/alternative; boundary="{_BOUNDARY}"\r\n'
+    f"From: {FROM_EMAIL}\r\n"
+).encode('ascii')
+_PARTIE_HTML = (
+    f"\r\n--{_BOUNDARY}\r\n"
+    'Content-Type: text/html; charset="utf-8"\r\n'
+    "MIME-Version: 1.0\r\n"
+    "Content-Transfer-Encoding: base64\r\n\r\n"
+).encode('ascii')
+_FIN = f"--{_BOUNDARY}--\r\n".encode('ascii')
+
+@lru_cache(maxsize=256)
+def _entete_sujet(subject: str) -> bytes:
+    return b"Subject: " + Header(subject, 'utf-8').encode(linesep='\r\n').encode('ascii') + b"\r\n"
+
+def build_message(to_email: str, subject: str, html_content: str) -> OutgoingMessage:
+    """ValueError for an address that cannot go in a plain ASCII ``To`` header"""
+    if '\r' in to_email or '\n' in to_email or not to_email.isascii():
+        raise ValueError(f"Adresse email invalide: {to_email!r}")
+    corps = base64.encodebytes(html_content.encode('utf-8')).replace(b"\n", b"\r\n")
+    data = b"".join((
+        _ENTETE, _entete_sujet(subject), b"To: ", to_email.encode('ascii'), b"\r\n",
+        _PARTIE_HTML, corps, _FIN
+    ))
+    return OutgoingMessage(to_email, data)
+
+async def send_emails(messages: List[OutgoingMessage]) -> List[bool]:
+    """Send many emails through the connection pool, off the event loop"""
+    return await smtp_pool.send_many(messages)
+
+def _construire(to_email: str, construire: Callable[[], OutgoingMessage]) -> Optional[OutgoingMessage]:
+    """Message of one recipient, None when it cannot be built; the other recipients are not affected"""
+    try:
+        return construire()
+    except ValueError as e:
+        logger.error(f"Email pour {to_email!r} non construit: {e}")
+        return None
+
+def build_payment_reminders(destinataires: List[Dict[str, Any]]) -> List[Optional[OutgoingMessage]]:
+    """Build one reminder per dict of ``build_payment_reminder`` arguments; None for an invalid address"""
+    corps = email_templates.RAPPEL.render_many(destinataires)
+    return [
+        _construire(d['participant_email'], lambda d=d, html=html: build_message(
+            d['participant_email'], email_templates.RAPPEL_SUJET.render(d), html
+        ))
+        for d, html in zip(destinataires, corps)
+    ]
+
+def build_payment_reminder(participant_name: str, participant_email: str, mois: str, montant: float, devise: str) -> Optional[OutgoingMessage]:
+    """Build payment reminder email"""
+    return build_payment_reminders([{
+        "participant_name": participant_name,
+        "participant_email": participant_email,
+        "mois": mois,
+        "montant": montant,
+        "devise": devise
+    }])[0]
+
+def build_admin_monthly_summary(admin_email: str, stats: dict) -> OutgoingMessage:
+    """Build monthly summary email for admin.
+
+    ``stats['details']`` lists ``{"nom", "en_retard"}`` per participant.
     """
-    
-    return send_email(admin_email, subject, html_content)
+    lignes = email_templates.RESUME_LIGNE.render_many(
+        {"nom": d['nom'], "statut": "⚠️ En retard" if d['en_retard'] else "✅ À jour"}
+        for d in stats.get('details', [])
+    )
+    subject = email_templates.RESUME_SUJET.render({"periode": datetime.now().strftime('%B %Y')})
+    html_content = email_templates.RESUME.render({
+        "total_confirme": stats.get('total_confirme', 0),
+        "total_en_attente": stats.get('total_en_attente', 0),
+        "nb_retards": stats.get('nb_retards', 0),
+        "lignes": "\n".join(lignes)
+    })
+    return build_message(admin_email, subject, html_content)
+
+def build_admin_monthly_summaries(destinataires: List[Dict[str, Any]]) -> List[Optional[OutgoingMessage]]:
+    return [_construire(d['admin_email'], lambda d=d: build_admin_monthly_summary(**d)) for d in destinataires]
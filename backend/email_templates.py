@@ -0,0 +1,158 @@
+"""HTML email templates, compiled once at import.
+
+Placeholders are written ``{{ nom }}`` or ``{{ nom:format }}`` (a
+``format()`` spec, e.g. ``{{ montant:.2f }}``). Values are HTML-escaped
+when rendered; ``{{ nom|safe }}`` inserts a value as is and is only used
+for fragments rendered by another template. Templates of plain-text
+headers (subjects) are built with ``html=False`` and never escape.
+
+A compiled template is a list of static strings interleaved with fields,
+so rendering is a single ``str.join`` and the static parts (CSS included)
+are shared by every message.
+"""
+import re
+from html import escape
+from typing import Any, Dict, Iterable, List, Tuple
+
+_PLACEHOLDER = re.compile(r"\{\{\s*(\w+)(?::([^}|\s]*))?\s*(\|safe)?\s*\}\}")
+
+
+class Template:
+    def __init__(self, source: str, html: bool = True):
+        self.html = html
+        self.statiques: List[str] = []
+        self.champs: List[Tuple[str, str, bool]] = []
+        position = 0
+        for m in _PLACEHOLDER.finditer(source):
+            self.statiques.append(source[position:m.start()])
+            self.champs.append((m.group(1), m.group(2) or '', bool(m.group(3))))
+            position = m.end()
+        self.statiques.append(source[position:])
+
+    def render(self, valeurs: Dict[str, Any]) -> str:
+        morceaux = [self.statiques[0]]
+        for (nom, spec, safe), statique in zip(self.champs, self.statiques[1:]):
+            texte = format(valeurs[nom], spec)
+            morceaux.append(escape(texte) if self.html and not safe else texte)
+            morceaux.append(statique)
+        return ''.join(morceaux)
+
+    def render_many(self, lignes: Iterable[Dict[str, Any]]) -> List[str]:
+        return [self.render(valeurs) for valeurs in lignes]
+
+
+_STYLE_BASE = """
+            body { font-family: 'Inter', Arial, sans-serif; line-height: 1.6; color: #333; }
+            .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+            .header { background: linear-gradient(135deg, #0F5C4C 0%, #0a4739 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }
+            .content { background: #f8f9fa; padding: 30px; border-radius: 0 0 10px 10px; }
+            .footer { text-align: center; margin-top: 20px; color: #666; font-size: 12px; }"""
+
+RAPPEL_SUJET = Template("Rappel - Paiement Cagnotte Cadre SIC ({{ mois }})", html=False)
+
+RAPPEL = Template("""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <style>""" + _STYLE_BASE + """
+            .amount { font-size: 28px; font-weight: bold; color: #0F5C4C; text-align: center; margin: 20px 0; }
+            .button { display: inline-block; background: #0F5C4C; color: white; padding: 12px 30px; text-decoration: none; border-radius: 5px; margin: 20px 0; }
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <h1>Rappel de Paiement</h1>
+                <p>Cagnotte Cadre SIC</p>
+            </div>
+            <div class="content">
+                <p>Bonjour {{ participant_name }},</p>
+
+                <p>Nous vous rappelons que votre contribution pour le mois de <strong>{{ mois }}</strong> n'a pas encore été enregistrée.</p>
+
+                <div class="amount">{{ montant:.2f }} {{ devise }}</div>
+
+                <p><strong>Méthodes de paiement :</strong></p>
+                <ul>
+                    <li>TWINT</li>
+                    <li>Virement bancaire</li>
+                </ul>
+
+                <p>Une fois le versement effectué, pensez à le déclarer sur la plateforme.</p>
+
+                <div style="text-align: center;">
+                    <a href="https://wizardaring.ch" class="button">Accéder à la plateforme</a>
+                </div>
+
+                <p>Merci pour votre participation !</p>
+            </div>
+            <div class="footer">
+                <p>Cagnotte Cadre SIC - wizardaring.ch</p>
+                <p>Cet email a été envoyé automatiquement, merci de ne pas y répondre.</p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """)
+
+RESUME_SUJET = Template("Résumé Mensuel - Cagnotte Cadre SIC ({{ periode }})", html=False)
+
+RESUME_LIGNE = Template("<tr><td>{{ nom }}</td><td>{{ statut }}</td></tr>")
+
+RESUME = Template("""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <style>""" + _STYLE_BASE + """
+            .stat-box { background: white; padding: 15px; margin: 10px 0; border-radius: 8px; border-left: 4px solid #0F5C4C; }
+            .stat-label { font-size: 12px; color: #666; text-transform: uppercase; }
+            .stat-value { font-size: 24px; font-weight: bold; color: #0F5C4C; }
+            table { width: 100%; border-collapse: collapse; margin: 20px 0; }
+            th { background: #0F5C4C; color: white; padding: 10px; text-align: left; }
+            td { padding: 10px; border-bottom: 1px solid #ddd; }
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <h1>Résumé Mensuel</h1>
+                <p>Cagnotte Cadre SIC</p>
+            </div>
+            <div class="content">
+                <div class="stat-box">
+                    <div class="stat-label">Total Confirmé</div>
+                    <div class="stat-value">{{ total_confirme:.2f }} CHF</div>
+                </div>
+
+                <div class="stat-box">
+                    <div class="stat-label">En Attente</div>
+                    <div class="stat-value">{{ total_en_attente:.2f }} CHF</div>
+                </div>
+
+                <div class="stat-box">
+                    <div class="stat-label">Participants en Retard</div>
+                    <div class="stat-value">{{ nb_retards }}</div>
+                </div>
+
+                <h3>Détail par Participant</h3>
+                <table>
+                    <thead>
+                        <tr>
+                            <th>Nom</th>
+                            <th>Statut</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+                        {{ lignes|safe }}
+                    </tbody>
+                </table>
+            </div>
+            <div class="footer">
+                <p>Cagnotte Cadre SIC - wizardaring.ch</p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """)
@@ -0,0 +1,295 @@
+"""Live events pushed to the browser with server-sent events (SSE).
+
+Mutating routes publish compact deltas on an in-process ``EventBus``:
+``paiement.created`` / ``updated`` / ``confirmed`` / ``deleted`` and a
+``kpi`` event per participant whose figures changed. Admins receive every
+event of their cagnotte, participants only the events about their own
+records.
+
+Each connected client has a bounded queue (``EVENTS_QUEUE_SIZE``). When a
+slow client lets it fill up, its queued events are dropped and replaced by
+a single ``resync`` event telling it to reload, so memory per client stays
+bounded whatever the client does. A cagnotte holds at most
+``EVENTS_MAX_CLIENTS_CAGNOTTE`` of the ``EVENTS_MAX_CLIENTS`` streams, so
+one busy pot cannot take all of them.
+
+With several workers, set ``EVENTS_SOURCE=change_stream``: every worker
+then feeds its bus from a MongoDB change stream on ``paiements`` instead
+of its own routes. Change streams need a replica set; a local single-node
+one is enough::
+
+    mongod --replSet rs0 --dbpath /tmp/rs0 && mongosh --eval "rs.initiate()"
+    MONGO_URL=mongodb://localhost:27017/?replicaSet=rs0 python events.py
+
+A deletion only carries the ``_id`` of the paiement. Pre-images (MongoDB
+6+) are enabled on ``paiements`` so the deleted document is known; without
+them the cagnotte is looked up among the paiements the stream has already
+seen, and the admins of that cagnotte get a ``resync``. A change that
+cannot be tied to a cagnotte is logged and dropped, never sent to every pot.
+The same task watches ``clotures``: when a year close ends, the admins of
+the cagnotte get a ``resync`` from every worker, not only from the one
+that ran the close.
+
+``python events.py`` prints the events read from the change stream.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+from fastapi import Request
+from pymongo.errors import OperationFailure
+
+import clotures
+
+logger = logging.getLogger(__name__)
+
+EVENTS_SOURCE = os.environ.get('EVENTS_SOURCE', 'local')
+EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', '100'))
+EVENTS_MAX_CLIENTS = int(os.environ.get('EVENTS_MAX_CLIENTS', '200'))
+EVENTS_MAX_CLIENTS_CAGNOTTE = int(os.environ.get('EVENTS_MAX_CLIENTS_CAGNOTTE', '50'))
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('EVENTS_HEARTBEAT_SECONDS', '15'))
+EVENTS_RETRY_MS = 5000
+# Paiements whose cagnotte the change stream remembers, for deletions without pre-image
+EVENTS_CAGNOTTES_CONNUES = 10000
+
+CHAMPS_PAIEMENT = ("id", "participant_id", "mois", "montant", "statut", "methode")
+
+
+class Evenement(NamedTuple):
+    id: int
+    type: str
+    data: Dict[str, Any]
+    cagnotte_id: Optional[str]  # None: every cagnotte
+    participant_id: Optional[str]  # None: admins only
+
+
+class Abonne:
+    """One connected client and its bounded queue"""
+
+    def __init__(self, cagnotte_id: Optional[str], user_id: str, is_admin: bool, taille: int):
+        self.cagnotte_id = cagnotte_id
+        self.user_id = user_id
+        self.is_admin = is_admin
+        self.file: "asyncio.Queue[Optional[Evenement]]" = asyncio.Queue(maxsize=taille)
+
+    def accepte(self, evenement: Evenement) -> bool:
+        if None not in (evenement.cagnotte_id, self.cagnotte_id) and evenement.cagnotte_id != self.cagnotte_id:
+            return False
+        return self.is_admin or evenement.participant_id == self.user_id
+
+    def pousser(self, evenement: Optional[Evenement]) -> None:
+        try:
+            self.file.put_nowait(evenement)
+        except asyncio.QueueFull:
+            # Slow client: drop its backlog and ask it to reload instead
+            while not self.file.empty():
+                self.file.get_nowait()
+            resync = Evenement(evenement.id, "resync", {}, None, None) if evenement else None
+            self.file.put_nowait(resync)
+
+
+class EventBus:
+    def __init__(self, taille_file: int = EVENTS_QUEUE_SIZE, max_abonnes: int = EVENTS_MAX_CLIENTS,
+                 max_par_cagnotte: int = EVENTS_MAX_CLIENTS_CAGNOTTE):
+        self.taille_file = taille_file
+        self.max_abonnes = max_abonnes
+        self.max_par_cagnotte = max_par_cagnotte
+        self._abonnes: Set[Abonne] = set()
+        self._par_cagnotte: Dict[Optional[str], int] = {}
+        self._sequence = itertools.count(1)
+
+    def __len__(self) -> int:
+        return len(self._abonnes)
+
+    def abonner(self, cagnotte_id: Optional[str], user_id: str, is_admin: bool) -> Optional[Abonne]:
+        """New subscriber (of every cagnotte when None), or None when the global or per-cagnotte limit is reached"""
+        if len(self._abonnes) >= self.max_abonnes:
+            return None
+        if self._par_cagnotte.get(cagnotte_id, 0) >= self.max_par_cagnotte:
+            return None
+        abonne = Abonne(cagnotte_id, user_id, is_admin, self.taille_file)
+        self._abonnes.add(abonne)
+        self._par_cagnotte[cagnotte_id] = self._par_cagnotte.get(cagnotte_id, 0) + 1
+        return abonne
+
+    def desabonner(self, abonne: Abonne) -> None:
+        if abonne in self._abonnes:
+            self._abonnes.discard(abonne)
+            self._par_cagnotte[abonne.cagnotte_id] -= 1
+            if not self._par_cagnotte[abonne.cagnotte_id]:
+                del self._par_cagnotte[abonne.cagnotte_id]
+
+    def publier(self, type_evenement: str, data: Dict[str, Any], cagnotte_id: Optional[str] = None,
+                participant_id: Optional[str] = None) -> None:
+        """Queue an event for every interested subscriber of ``cagnotte_id`` (all when None); never blocks"""
+        evenement = Evenement(next(self._sequence), type_evenement, data, cagnotte_id, participant_id)
+        for abonne in self._abonnes:
+            if abonne.accepte(evenement):
+                abonne.pousser(evenement)
+
+    def fermer(self) -> None:
+        """End every open stream (server shutdown)"""
+        for abonne in self._abonnes:
+            abonne.pousser(None)
+
+
+def publier_paiements(bus: EventBus, action: str, paiements: Iterable[Dict[str, Any]]) -> None:
+    """``paiement.<action>`` for each paiement, then one ``kpi`` event per participant"""
+    mois_par_participant: Dict[Tuple[str, str], Set[str]] = {}
+    for p in paiements:
+        bus.publier(f"paiement.{action}", {k: p.get(k) for k in CHAMPS_PAIEMENT if k in p},
+                    p['cagnotte_id'], p['participant_id'])
+        mois_par_participant.setdefault((p['cagnotte_id'], p['participant_id']), set()).add(p['mois'])
+    for (cagnotte_id, participant_id), mois in mois_par_participant.items():
+        bus.publier("kpi", {"participant_id": participant_id, "mois": sorted(mois)}, cagnotte_id, participant_id)
+
+
+def formater(evenement: Evenement) -> str:
+    data = json.dumps({"type": evenement.type, **evenement.data}, separators=(',', ':'), ensure_ascii=False)
+    return f"id: {evenement.id}\ndata: {data}\n\n"
+
+
+async def flux_sse(request: Request, bus: EventBus, abonne: Abonne) -> AsyncIterator[str]:
+    """Body of the ``text/event-stream`` response; a comment line is sent as heartbeat"""
+    try:
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+        while True:
+            try:
+                evenement = await asyncio.wait_for(abonne.file.get(), timeout=EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": ping\n\n"
+                continue
+            if evenement is None:
+                break
+            yield formater(evenement)
+    finally:
+        bus.desabonner(abonne)
+
+
+def _depuis_changement(change: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """(action, paiement) for a change stream event, None when it cannot be attributed"""
+    operation = change['operationType']
+    if operation == 'insert':
+        return "created", change['fullDocument']
+    if operation in ('update', 'replace'):
+        document = change.get('fullDocument')
+        if not document:
+            return None
+        champs = change.get('updateDescription', {}).get('updatedFields', {})
+        return ("confirmed" if champs.get('statut') == 'confirme' else "updated"), document
+    if operation == 'delete':
+        # Needs pre-images (MongoDB 6+, changeStreamPreAndPostImages on the collection)
+        document = change.get('fullDocumentBeforeChange')
+        return ("deleted", document) if document else None
+    return None
+
+
+def _cagnotte_cloturee(change: Dict[str, Any]) -> Optional[str]:
+    """Cagnotte whose year close just ended, None for any other change on ``clotures``"""
+    if change['operationType'] != 'update':
+        return None
+    if change.get('updateDescription', {}).get('updatedFields', {}).get('statut') != clotures.CLOTUREE:
+        return None
+    return (change.get('fullDocument') or {}).get('cagnotte_id')
+
+
+async def suivre_change_stream(db, bus: EventBus) -> None:
+    """Feed ``bus`` from change streams on ``paiements`` and ``clotures`` until cancelled"""
+    await asyncio.gather(_suivre_paiements(db, bus), _suivre_clotures(db, bus))
+
+
+async def _suivre_clotures(db, bus: EventBus) -> None:
+    pipeline = [{"$match": {"operationType": "update"}}]
+    reprise = None
+    while True:
+        try:
+            async with db.clotures.watch(pipeline, resume_after=reprise, full_document="updateLookup") as flux:
+                async for change in flux:
+                    reprise = flux.resume_token
+                    cagnotte_id = _cagnotte_cloturee(change)
+                    if cagnotte_id:
+                        # Every admin view of the cagnotte may have changed
+                        bus.publier("resync", {}, cagnotte_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Erreur du change stream clotures")
+            await asyncio.sleep(5)
+
+
+async def _suivre_paiements(db, bus: EventBus) -> None:
+    pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+    options: Dict[str, Any] = {"full_document": "updateLookup", "full_document_before_change": "whenAvailable"}
+    try:
+        await db.command("collMod", "paiements", changeStreamPreAndPostImages={"enabled": True})
+    except OperationFailure as e:
+        logger.info(f"Pré-images non activées sur paiements: {e}")
+    connues: "OrderedDict[Any, str]" = OrderedDict()  # _id -> cagnotte_id
+    reprise = None
+    while True:
+        try:
+            async with db.paiements.watch(pipeline, resume_after=reprise, **options) as flux:
+                async for change in flux:
+                    reprise = flux.resume_token
+                    _id = change.get('documentKey', {}).get('_id')
+                    resultat = _depuis_changement(change)
+                    if resultat:
+                        action, paiement = resultat
+                        publier_paiements(bus, action, [paiement])
+                        connues[_id] = paiement['cagnotte_id']
+                        connues.move_to_end(_id)
+                        while len(connues) > EVENTS_CAGNOTTES_CONNUES:
+                            connues.popitem(last=False)
+                    elif change['operationType'] == 'delete' and _id in connues:
+                        # Deleted paiement of a known cagnotte: its admins reload
+                        bus.publier("resync", {}, connues[_id])
+                    elif change['operationType'] == 'delete':
+                        logger.warning(f"Suppression du paiement {_id} non attribuable à une cagnotte, non signalée")
+                    # An update whose document is already gone is followed by its delete
+                    if change['operationType'] == 'delete':
+                        connues.pop(_id, None)
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as e:
+            if "full_document_before_change" in options:
+                logger.warning(f"Pré-images indisponibles, suppressions signalées par resync: {e}")
+                options.pop("full_document_before_change")
+                continue
+            logger.exception("Erreur du change stream paiements")
+            await asyncio.sleep(5)
+        except Exception:
+            logger.exception("Erreur du change stream paiements")
+            await asyncio.sleep(5)
+
+
+async def _main() -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    bus = EventBus()
+    abonne = bus.abonner(None, "cli", is_admin=True)
+    tache = asyncio.create_task(suivre_change_stream(client[os.environ['DB_NAME']], bus))
+    try:
+        while True:
+            print(formater(await abonne.file.get()), end="", flush=True)
+    finally:
+        tache.cancel()
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    try:
+        sys.exit(asyncio.run(_main()))
+    except KeyboardInterrupt:
+        pass
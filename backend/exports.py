@@ -0,0 +1,59 @@
+"""Streaming CSV responses.
+
+Rows are read from an async iterator (typically a Motor cursor), written
+through the ``csv`` module and sent in chunks, optionally gzip-compressed,
+so memory use does not depend on the number of rows.
+"""
+import csv
+import io
+import zlib
+from typing import Any, AsyncIterator, Iterable, List, Optional
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+LIGNES_PAR_CHUNK = 500
+
+
+async def iter_csv(entete: List[str], lignes: AsyncIterator[Iterable[Any]]) -> AsyncIterator[bytes]:
+    """Encode rows as UTF-8 CSV, yielding one chunk every LIGNES_PAR_CHUNK rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(entete)
+    nb = 0
+    async for ligne in lignes:
+        writer.writerow(ligne)
+        nb += 1
+        if nb % LIGNES_PAR_CHUNK == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+async def iter_gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compresseur = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    async for chunk in chunks:
+        compresse = compresseur.compress(chunk)
+        if compresse:
+            yield compresse
+    yield compresseur.flush()
+
+
+def accepte_gzip(request: Request) -> bool:
+    encodages = request.headers.get('accept-encoding', '')
+    return any(e.split(';')[0].strip() == 'gzip' for e in encodages.split(','))
+
+
+def csv_response(request: Request, entete: List[str], lignes: AsyncIterator[Iterable[Any]],
+                 filename: Optional[str] = None) -> StreamingResponse:
+    """Chunked ``text/csv`` response, gzip-encoded when the client accepts it"""
+    chunks = iter_csv(entete, lignes)
+    headers = {"Vary": "Accept-Encoding"}
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    if accepte_gzip(request):
+        chunks = iter_gzip(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type="text/csv; charset=utf-8", headers=headers)
@@ -0,0 +1,111 @@
+"""Replay of retried requests carrying an ``Idempotency-Key`` header.
+
+A client that does not know whether its request went through (timeout,
+double click, network retry) sends it again with the same key and gets the
+first result back, without the route touching the database again. Keys are
+scoped per cagnotte and participant, remembered for ``IDEMPOTENCE_TTL``
+seconds, and at most ``IDEMPOTENCE_MAX_CLES`` of them are kept (the oldest
+are forgotten first).
+
+Only successful results are remembered: a retry after an error runs the
+route again. Requests with the same key that arrive while the first one is
+still running wait for it instead of running in parallel. A key reused with
+a different body is refused with a 400.
+
+The keys are kept in memory per worker process; a retry landing on another
+worker runs the route again, where the unique constraints still apply.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional
+
+from fastapi import HTTPException
+
+IDEMPOTENCE_TTL = float(os.environ.get('IDEMPOTENCE_TTL', '3600'))
+IDEMPOTENCE_MAX_CLES = int(os.environ.get('IDEMPOTENCE_MAX_CLES', '10000'))
+IDEMPOTENCE_LONGUEUR_MAX = 255
+
+
+class _Resultat(NamedTuple):
+    empreinte: str
+    valeur: Any
+    expire: float
+
+
+class _Verrou:
+    __slots__ = ("lock", "attentes")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.attentes = 0
+
+
+class Idempotence:
+    def __init__(self, ttl: float = IDEMPOTENCE_TTL, max_cles: int = IDEMPOTENCE_MAX_CLES):
+        self.ttl = ttl
+        self.max_cles = max_cles
+        self._resultats: "OrderedDict[str, _Resultat]" = OrderedDict()
+        self._verrous: Dict[str, _Verrou] = {}
+        self.rejoues = 0
+
+    def __len__(self) -> int:
+        return len(self._resultats)
+
+    @staticmethod
+    def cle(cagnotte_id: str, user_id: str, valeur: str) -> str:
+        if not valeur or len(valeur) > IDEMPOTENCE_LONGUEUR_MAX:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key invalide (1 à {IDEMPOTENCE_LONGUEUR_MAX} caractères)")
+        return f"{cagnotte_id}:{user_id}:{valeur}"
+
+    def _lire(self, cle: str, empreinte: str) -> Optional[_Resultat]:
+        resultat = self._resultats.get(cle)
+        if resultat is None:
+            return None
+        if resultat.expire <= time.monotonic():
+            del self._resultats[cle]
+            return None
+        if resultat.empreinte != empreinte:
+            raise HTTPException(status_code=400, detail="Idempotency-Key déjà utilisée pour une autre requête")
+        return resultat
+
+    def _retenir(self, cle: str, empreinte: str, valeur: Any) -> None:
+        self._resultats[cle] = _Resultat(empreinte, valeur, time.monotonic() + self.ttl)
+        self._resultats.move_to_end(cle)
+        while len(self._resultats) > self.max_cles:
+            self._resultats.popitem(last=False)
+
+    async def executer(self, cle: Optional[str], empreinte: str, fonction: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of ``fonction()``, or the one remembered for ``cle`` (no key: always run)"""
+        if cle is None:
+            return await fonction()
+        verrou = self._verrous.setdefault(cle, _Verrou())
+        verrou.attentes += 1
+        try:
+            async with verrou.lock:
+                resultat = self._lire(cle, empreinte)
+                if resultat is not None:
+                    self.rejoues += 1
+                    return resultat.valeur
+                valeur = await fonction()
+                self._retenir(cle, empreinte, valeur)
+                return valeur
+        finally:
+            verrou.attentes -= 1
+            if not verrou.attentes:
+                del self._verrous[cle]
+
+    def exposer(self) -> str:
+        """Counters in the Prometheus text format, appended to /metrics"""
+        return "\n".join([
+            "# HELP idempotency_replays_total Requêtes rejouées depuis leur Idempotency-Key.",
+            "# TYPE idempotency_replays_total counter",
+            f"idempotency_replays_total {self.rejoues}",
+            "# HELP idempotency_keys Idempotency-Key retenues.",
+            "# TYPE idempotency_keys gauge",
+            f"idempotency_keys {len(self)}",
+        ]) + "\n"
+
+
+memoire = Idempotence()
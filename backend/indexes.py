@@ -0,0 +1,213 @@
+"""MongoDB index bootstrap and query plan checks.
+
+Run ``python indexes.py`` to create the indexes and verify that none of the
+hot queries falls back to a collection scan. The indexes of the per-cagnotte
+collections start with ``cagnotte_id`` (see cagnottes.py).
+"""
+import asyncio
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# collection -> [(name, keys, options)]
+C = ("cagnotte_id", ASCENDING)
+
+INDEXES: Dict[str, List[Tuple[str, List[Tuple[str, int]], Dict[str, Any]]]] = {
+    "participants": [
+        ("participants_cagnotte_email", [C, ("email", ASCENDING)], {"unique": True}),
+        ("participants_id", [("id", ASCENDING)], {"unique": True}),
+        ("participants_cagnotte_actifs", [C, ("actif", ASCENDING)], {"partialFilterExpression": {"actif": True}}),
+        ("participants_cagnotte_nom_id", [C, ("nom", ASCENDING), ("id", ASCENDING)], {}),
+    ],
+    "paiements": [
+        ("paiements_id", [("id", ASCENDING)], {"unique": True}),
+        ("paiements_cagnotte_participant_mois", [C, ("participant_id", ASCENDING), ("mois", ASCENDING)], {}),
+        # One declaration per participant and month; DEPENSE shares are not flagged ``versement``.
+        # Keys in another order than the index above, which has the same fields without the filter.
+        ("paiements_cagnotte_mois_participant_versement", [C, ("mois", ASCENDING), ("participant_id", ASCENDING)],
+         {"unique": True, "partialFilterExpression": {"versement": True}}),
+        ("paiements_cagnotte_mois_statut", [C, ("mois", ASCENDING), ("statut", ASCENDING)], {}),
+        ("paiements_cagnotte_mois_date_id", [C, ("mois", ASCENDING), ("date", ASCENDING), ("id", ASCENDING)], {}),
+    ],
+    "paiements_archive": [
+        ("archive_id", [("id", ASCENDING)], {"unique": True}),
+        ("archive_cagnotte_participant_mois", [C, ("participant_id", ASCENDING), ("mois", ASCENDING)], {}),
+        ("archive_cagnotte_mois_date_id", [C, ("mois", ASCENDING), ("date", ASCENDING), ("id", ASCENDING)], {}),
+    ],
+    "clotures": [
+        ("clotures_cagnotte_annee", [C, ("annee", ASCENDING)], {"unique": True}),
+    ],
+    "cloture_participants": [
+        ("cloture_participants_cagnotte_annee_participant",
+         [C, ("annee", ASCENDING), ("participant_id", ASCENDING)], {"unique": True}),
+    ],
+    "paiement_rollups": [
+        ("rollups_cagnotte_participant_mois", [C, ("participant_id", ASCENDING), ("mois", ASCENDING)], {"unique": True}),
+        ("rollups_cagnotte_mois", [C, ("mois", ASCENDING)], {}),
+    ],
+    "jobs": [
+        ("jobs_id", [("id", ASCENDING)], {"unique": True}),
+        ("jobs_statut_created", [("statut", ASCENDING), ("created_at", ASCENDING)], {}),
+    ],
+    "config": [
+        ("config_cagnotte_key", [C, ("key", ASCENDING)], {"unique": True}),
+    ],
+    "versions": [
+        ("versions_key", [("key", ASCENDING)], {"unique": True}),
+    ],
+}
+
+
+# Indexes replaced by the ones above: the unique ones would reject a second cagnotte
+OBSOLETES: Dict[str, List[str]] = {
+    "participants": ["participants_email", "participants_actifs", "participants_nom_id"],
+    "paiements": ["paiements_participant_mois", "paiements_mois_statut", "paiements_mois_date_id"],
+    "paiements_archive": ["archive_participant_mois", "archive_mois_date_id"],
+    "clotures": ["clotures_annee"],
+    "cloture_participants": ["cloture_participants_annee_participant"],
+    "paiement_rollups": ["rollups_participant_mois", "rollups_mois"],
+    "config": ["config_key"],
+}
+
+
+async def marquer_versements(db) -> None:
+    """Flag the declarations written before the ``versement`` field, so the unique index covers them"""
+    resultat = await db.paiements.update_many(
+        {"versement": {"$exists": False}, "methode": {"$ne": "DEPENSE"}}, {"$set": {"versement": True}}
+    )
+    if resultat.modified_count:
+        logger.info(f"{resultat.modified_count} versement(s) marqué(s)")
+
+
+def filtre_annee(annee: int) -> Dict[str, str]:
+    """Range predicate on ``mois`` (YYYY-MM) covering a whole year"""
+    return {"$gte": f"{annee}-01", "$lt": f"{annee + 1}-01"}
+
+
+async def ensure_indexes(db) -> bool:
+    """Create the indexes (idempotent) and check they are all present.
+
+    Failures are logged rather than raised so the API still starts, e.g.
+    when legacy data contains duplicate emails or two declarations of the
+    same month.
+    """
+    ok = True
+    try:
+        await marquer_versements(db)
+    except OperationFailure as e:
+        ok = False
+        logger.error(f"Versements non marqués: {e}")
+    for collection, noms in OBSOLETES.items():
+        existing = await db[collection].index_information()
+        for name in noms:
+            if name in existing:
+                await db[collection].drop_index(name)
+                logger.info(f"Index obsolète supprimé: {collection}.{name}")
+    for collection, specs in INDEXES.items():
+        for name, keys, options in specs:
+            try:
+                await db[collection].create_index(keys, name=name, **options)
+            except OperationFailure as e:
+                ok = False
+                logger.error(f"Index {collection}.{name} non créé: {e}")
+        existing = await db[collection].index_information()
+        for name, keys, _ in specs:
+            if name not in existing or list(existing[name]['key']) != keys:
+                ok = False
+                logger.error(f"Index manquant ou différent: {collection}.{name}")
+    return ok
+
+
+def requetes_critiques(annee: int) -> List[Tuple[str, str, Any]]:
+    """Filters and pipelines issued by the hot routes: (label, collection, filter or pipeline)"""
+    mois = f"{annee}-01"
+    c = "bench"
+    return [
+        ("login", "participants", {"cagnotte_id": c, "email": "bench@example.com"}),
+        ("get_current_user", "participants", {"id": "x"}),
+        ("participants actifs", "participants", {"cagnotte_id": c, "actif": True}),
+        ("paiements d'un participant", "paiements", {"cagnotte_id": c, "participant_id": "x"}),
+        ("paiement par id", "paiements", {"id": "x", "cagnotte_id": c}),
+        ("confirmation du mois", "paiements", {"cagnotte_id": c, "mois": mois, "statut": "en_attente"}),
+        ("page de paiements", "paiements", {"cagnotte_id": c, "mois": filtre_annee(annee), "statut": "confirme"}),
+        ("kpi participant", "paiement_rollups", {"cagnotte_id": c, "participant_id": "x", "mois": filtre_annee(annee)}),
+        ("kpi admin", "paiement_rollups",
+         {"cagnotte_id": c, "participant_id": {"$in": ["x", "y"]}, "mois": filtre_annee(annee)}),
+        ("kpi dashboard", "paiement_rollups", {"cagnotte_id": c, "mois": filtre_annee(annee)}),
+        ("evolution mensuelle", "paiement_rollups", [
+            {"$match": {"cagnotte_id": c, "mois": {"$in": [mois, f"{annee}-02"]}}},
+            {"$group": {"_id": "$mois", "total": {"$sum": "$montants.confirme"}}},
+        ]),
+        ("rappels", "participants", {"cagnotte_id": c, "actif": True, "id": {"$nin": ["x"]},
+                                     "$or": [{"mois_debut": {"$lte": mois}}, {"mois_debut": None}]}),
+        ("config", "config", {"cagnotte_id": c, "key": "montant_mensuel"}),
+    ]
+
+
+def _contient_collscan(plan: Any) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(_contient_collscan(v) for v in plan.values())
+    if isinstance(plan, list):
+        return any(_contient_collscan(v) for v in plan)
+    return False
+
+
+def _plans_retenus(explain: Any) -> List[Any]:
+    """Winning plans found anywhere in an explain output (find or aggregate)"""
+    if isinstance(explain, dict):
+        plans = [explain["winningPlan"]] if "winningPlan" in explain else []
+        for key, value in explain.items():
+            if key != "winningPlan":
+                plans.extend(_plans_retenus(value))
+        return plans
+    if isinstance(explain, list):
+        return [p for v in explain for p in _plans_retenus(v)]
+    return []
+
+
+async def verifier_plans(db, annee: int) -> List[str]:
+    """Explain every hot query and return the labels of those doing a COLLSCAN"""
+    scans = []
+    for label, collection, requete in requetes_critiques(annee):
+        if isinstance(requete, list):
+            explain = await db.command("aggregate", collection, pipeline=requete, explain=True)
+        else:
+            explain = await db[collection].find(requete).explain()
+        if any(_contient_collscan(plan) for plan in _plans_retenus(explain)):
+            scans.append(f"{label} ({collection})")
+    return scans
+
+
+async def _main() -> int:
+    from datetime import datetime, timezone
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        if not await ensure_indexes(db):
+            return 1
+        scans = await verifier_plans(db, datetime.now(timezone.utc).year)
+        for scan in scans:
+            print(f"COLLSCAN: {scan}")
+        if not scans:
+            print("Aucune requête critique ne parcourt une collection entière")
+        return 1 if scans else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main()))
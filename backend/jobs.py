@@ -0,0 +1,235 @@
+"""Mongo-backed queue for notification jobs.
+
+A job document lists its recipients, each with its own state::
+
+    {"id", "cagnotte_id", "type", "statut": "en_attente" | "en_cours" | "termine",
+     "destinataires": [{"email", "params", "statut", "tentatives", "erreur"}],
+     "lease_until", "worker_id", "created_at", "updated_at"}
+
+Recipient states are ``en_attente`` -> ``envoi`` -> ``envoye`` / ``echoue``.
+A recipient is marked ``envoi`` before its message is handed to SMTP, so a
+job resumed after a crash never resends it: recipients still in ``envoi``
+are marked ``echoue`` instead, since the message may already have left.
+Workers claim jobs with a lease, so a job left ``en_cours`` by a dead
+process is picked up again once the lease has expired. The lease is renewed
+every ``JOB_LEASE_SECONDS / 3`` while a round is in SMTP, which can take
+longer than the lease itself; a worker whose write matches nothing has lost
+the job to another one and stops at once.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from email_service import build_payment_reminders, build_admin_monthly_summaries, send_emails, smtp_pool
+
+logger = logging.getLogger(__name__)
+
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '120'))
+JOB_MAX_TENTATIVES = int(os.environ.get('JOB_MAX_TENTATIVES', '3'))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', '5'))
+JOB_RETRY_SECONDS = float(os.environ.get('JOB_RETRY_SECONDS', '30'))
+
+# Job type -> batch message builder, called with the params of a round of recipients;
+# it returns one message per recipient, None for those that cannot be built
+BUILDERS: Dict[str, Callable[[List[Dict[str, Any]]], List[Any]]] = {
+    "rappels": build_payment_reminders,
+    "resume_admin": build_admin_monthly_summaries,
+}
+
+
+def _maintenant() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def enqueue(db, cagnotte_id: str, type_job: str, destinataires: List[Dict[str, Any]],
+                  cree_par: Optional[str] = None) -> Dict[str, Any]:
+    """Store a job; ``destinataires`` are ``{"email", "params"}`` dicts"""
+    if type_job not in BUILDERS:
+        raise ValueError(f"Type de job inconnu: {type_job}")
+    maintenant = _maintenant()
+    job = {
+        "id": str(uuid.uuid4()),
+        "cagnotte_id": cagnotte_id,
+        "type": type_job,
+        "statut": "en_attente",
+        "destinataires": [
+            {"email": d['email'], "params": d['params'], "statut": "en_attente", "tentatives": 0, "erreur": None}
+            for d in destinataires
+        ],
+        "cree_par": cree_par,
+        "lease_until": None,
+        "worker_id": None,
+        "created_at": maintenant.isoformat(),
+        "updated_at": maintenant.isoformat()
+    }
+    await db.jobs.insert_one(job)
+    job.pop('_id', None)
+    return job
+
+
+def resume_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a job: counts per recipient state"""
+    destinataires = job.get('destinataires', [])
+    compte = {"envoye": 0, "echoue": 0}
+    for d in destinataires:
+        if d['statut'] in compte:
+            compte[d['statut']] += 1
+    return {
+        "id": job['id'],
+        "type": job['type'],
+        "statut": job['statut'],
+        "total": len(destinataires),
+        "sent": compte['envoye'],
+        "failed": compte['echoue'],
+        "pending": len(destinataires) - compte['envoye'] - compte['echoue'],
+        "errors": [d['email'] for d in destinataires if d['statut'] == 'echoue'],
+        "created_at": job['created_at'],
+        "updated_at": job['updated_at']
+    }
+
+
+class JobWorker:
+    """Claims and processes jobs from the ``jobs`` collection in the background"""
+
+    def __init__(self, db, lot: Optional[int] = None):
+        self.db = db
+        self.worker_id = str(uuid.uuid4())
+        # Enough recipients per round to keep every pooled connection busy
+        self.lot = lot or smtp_pool.size * 20
+        self._reveil = asyncio.Event()
+        self._tache: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        """Wake the worker up after an enqueue"""
+        self._reveil.set()
+
+    def start(self) -> None:
+        self._tache = asyncio.create_task(self._boucle())
+
+    async def stop(self) -> None:
+        if self._tache:
+            self._tache.cancel()
+            try:
+                await self._tache
+            except asyncio.CancelledError:
+                pass
+
+    async def _boucle(self) -> None:
+        while True:
+            try:
+                job = await self._reclamer()
+                if job:
+                    await self.traiter(job)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Erreur du worker de jobs")
+            try:
+                await asyncio.wait_for(self._reveil.wait(), timeout=JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._reveil.clear()
+
+    async def _reclamer(self) -> Optional[Dict[str, Any]]:
+        maintenant = _maintenant()
+        return await self.db.jobs.find_one_and_update(
+            {"$or": [
+                {"statut": "en_attente"},
+                {"statut": "en_cours", "lease_until": {"$lt": maintenant.isoformat()}}
+            ]},
+            {"$set": {
+                "statut": "en_cours",
+                "worker_id": self.worker_id,
+                "lease_until": (maintenant + timedelta(seconds=JOB_LEASE_SECONDS)).isoformat(),
+                "updated_at": maintenant.isoformat()
+            }},
+            projection={"_id": 0},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _maj(self, job_id: str, champs: Dict[str, Any]) -> bool:
+        """Write ``champs`` and renew the lease; False when another worker holds the job"""
+        maintenant = _maintenant()
+        champs = {
+            "updated_at": maintenant.isoformat(),
+            "lease_until": (maintenant + timedelta(seconds=JOB_LEASE_SECONDS)).isoformat(),
+            **champs
+        }
+        resultat = await self.db.jobs.update_one({"id": job_id, "worker_id": self.worker_id}, {"$set": champs})
+        if resultat.matched_count:
+            return True
+        logger.warning(f"Job {job_id}: bail perdu, le job est laissé à l'autre worker")
+        return False
+
+    async def _entretenir_bail(self, job_id: str) -> None:
+        """Renew the lease until cancelled or lost"""
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            try:
+                if not await self._maj(job_id, {}):
+                    return
+            except Exception:
+                logger.exception(f"Job {job_id}: renouvellement du bail impossible")
+
+    async def traiter(self, job: Dict[str, Any]) -> None:
+        destinataires = job['destinataires']
+        builder = BUILDERS[job['type']]
+
+        # Recipients caught mid-send by a previous worker may have been sent already
+        interrompus = {}
+        for i, d in enumerate(destinataires):
+            if d['statut'] == 'envoi':
+                d['statut'] = 'echoue'
+                d['erreur'] = "Envoi interrompu, non renvoyé"
+                interrompus[f"destinataires.{i}"] = d
+        if interrompus and not await self._maj(job['id'], interrompus):
+            return
+
+        while True:
+            indices = [i for i, d in enumerate(destinataires) if d['statut'] == 'en_attente'][:self.lot]
+            if not indices:
+                break
+            if not await self._maj(job['id'], {f"destinataires.{i}.statut": "envoi" for i in indices}):
+                return
+
+            bail = asyncio.create_task(self._entretenir_bail(job['id']))
+            try:
+                messages = builder([destinataires[i]['params'] for i in indices])
+                envois = iter(await send_emails([m for m in messages if m is not None]))
+                # None: the message could not be built (invalid address)
+                resultats = [next(envois) if m is not None else None for m in messages]
+            finally:
+                bail.cancel()
+
+            champs = {}
+            a_reessayer = False
+            for i, envoye in zip(indices, resultats):
+                d = destinataires[i]
+                d['tentatives'] += 1
+                if envoye is None:
+                    d['statut'] = 'echoue'
+                    d['erreur'] = "Adresse email invalide"
+                elif envoye:
+                    d['statut'] = 'envoye'
+                    d['erreur'] = None
+                elif d['tentatives'] >= JOB_MAX_TENTATIVES:
+                    d['statut'] = 'echoue'
+                    d['erreur'] = "Échec SMTP"
+                else:
+                    d['statut'] = 'en_attente'
+                    a_reessayer = True
+                champs[f"destinataires.{i}"] = d
+            if not await self._maj(job['id'], champs):
+                return
+            if a_reessayer:
+                await asyncio.sleep(JOB_RETRY_SECONDS)
+
+        await self._maj(job['id'], {"statut": "termine", "lease_until": None})
+        logger.info(f"Job {job['id']} ({job['type']}) terminé")
@@ -0,0 +1,126 @@
+"""Participant × month contribution matrix built from ``paiement_rollups``.
+
+Rows are participants and columns the consecutive months of a ``debut`` ..
+``fin`` range (YYYY-MM, any number of years). Amounts and statuts live in
+numpy arrays, so expected, paid, missing and late figures are computed for
+every participant at once, across year boundaries.
+
+A month is *attendu* (expected) for a participant from their ``mois_debut``
+on. It is *réglé* when it has paiements and all of them are confirmed (see
+``rollups.est_regle``), and *en retard* when it is expected, before the
+reference month and not settled.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+import rollups
+
+# Cell codes of ``Matrice.codes()``
+NON_ATTENDU, MANQUANT, EN_ATTENTE, REGLE = 0, 1, 2, 3
+LEGENDE = ["non_attendu", "manquant", "en_attente", "regle"]
+
+
+def index_mois(mois: str) -> int:
+    """Months since year 0 for a YYYY-MM string"""
+    annee, num = mois[:7].split('-')
+    return int(annee) * 12 + int(num) - 1
+
+
+def mois_depuis_index(index: int) -> str:
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+class Matrice:
+    """Contribution matrix of ``participants`` over the months ``debut``..``fin``"""
+
+    def __init__(self, participants: List[Dict[str, Any]], debut: str, fin: str,
+                 rollups_docs: Iterable[Dict[str, Any]], defaut_debut: Optional[str] = None):
+        self.participants = participants
+        self.origine = index_mois(debut)
+        nb_mois = max(0, index_mois(fin) - self.origine + 1)
+        self.mois = [mois_depuis_index(self.origine + j) for j in range(nb_mois)]
+        lignes = {p['id']: i for i, p in enumerate(participants)}
+        forme = (len(participants), nb_mois)
+
+        self.confirme = np.zeros(forme)
+        self.en_attente = np.zeros(forme)
+        self.regle = np.zeros(forme, dtype=bool)
+        self.paye = np.zeros(forme, dtype=bool)  # any paiement declared for the month
+
+        ii, jj, confirme, en_attente, regle, paye = [], [], [], [], [], []
+        for r in rollups_docs:
+            i = lignes.get(r['participant_id'])
+            j = index_mois(r['mois']) - self.origine
+            if i is None or not 0 <= j < nb_mois:
+                continue
+            montants = r.get('montants', {})
+            ii.append(i)
+            jj.append(j)
+            confirme.append(montants.get('confirme', 0))
+            en_attente.append(montants.get('en_attente', 0))
+            regle.append(rollups.est_regle(r))
+            paye.append(sum(r.get('nombres', {}).values()) > 0)
+        if ii:
+            # (participant_id, mois) is unique in the rollups, so plain assignment is enough
+            self.confirme[ii, jj] = confirme
+            self.en_attente[ii, jj] = en_attente
+            self.regle[ii, jj] = regle
+            self.paye[ii, jj] = paye
+
+        defaut = defaut_debut or debut
+        debuts = np.array([index_mois(p.get('mois_debut') or defaut) for p in participants], dtype=np.int64)
+        self.attendu = np.arange(nb_mois)[None, :] >= (debuts - self.origine)[:, None]
+
+    def colonnes(self, debut: Optional[str] = None, fin: Optional[str] = None) -> slice:
+        """Column slice for the months ``debut``..``fin`` (inclusive), clipped to the matrix"""
+        j0 = 0 if debut is None else max(0, index_mois(debut) - self.origine)
+        j1 = len(self.mois) if fin is None else max(0, index_mois(fin) - self.origine + 1)
+        return slice(j0, j1)
+
+    def nb_mois_attendus(self, debut: Optional[str] = None, fin: Optional[str] = None) -> np.ndarray:
+        return self.attendu[:, self.colonnes(debut, fin)].sum(axis=1)
+
+    def total_confirme(self, debut: Optional[str] = None, fin: Optional[str] = None) -> np.ndarray:
+        return self.confirme[:, self.colonnes(debut, fin)].sum(axis=1)
+
+    def total_en_attente(self, debut: Optional[str] = None, fin: Optional[str] = None) -> np.ndarray:
+        return self.en_attente[:, self.colonnes(debut, fin)].sum(axis=1)
+
+    def retards(self, avant: str) -> np.ndarray:
+        """Per participant, expected months before ``avant`` that are not settled"""
+        colonnes = self.colonnes(fin=mois_depuis_index(index_mois(avant) - 1))
+        return (self.attendu[:, colonnes] & ~self.regle[:, colonnes]).sum(axis=1)
+
+    def en_retard(self, avant: str) -> np.ndarray:
+        return self.retards(avant) > 0
+
+    def codes(self, jusqu_a: Optional[str] = None) -> np.ndarray:
+        """Cell statuts as NON_ATTENDU / MANQUANT / EN_ATTENTE / REGLE.
+
+        Months after ``jusqu_a`` are not expected yet and only show paiements.
+        """
+        codes = np.full(self.regle.shape, NON_ATTENDU, dtype=np.int8)
+        colonnes = self.colonnes(fin=jusqu_a)
+        codes[:, colonnes][self.attendu[:, colonnes]] = MANQUANT
+        codes[self.paye & ~self.regle] = EN_ATTENTE
+        codes[self.regle] = REGLE
+        return codes
+
+
+async def charger(db, cagnotte_id: str, participants: List[Dict[str, Any]], debut: str, fin: str,
+                  defaut_debut: Optional[str] = None) -> Matrice:
+    """Read the rollups of ``participants`` for ``debut``..``fin`` and build the matrix"""
+    filtre = {
+        "cagnotte_id": cagnotte_id,
+        "participant_id": {"$in": [p['id'] for p in participants]},
+        "mois": {"$gte": debut, "$lte": fin}
+    }
+    projection = {"_id": 0, "participant_id": 1, "mois": 1, "montants": 1, "nombres": 1}
+    docs = await db.paiement_rollups.find(filtre, projection).to_list(None)
+    return Matrice(participants, debut, fin, docs, defaut_debut=defaut_debut)
+
+
+def premier_mois(participants: List[Dict[str, Any]], defaut: str) -> str:
+    """Earliest ``mois_debut`` of the participants, at most ``defaut``"""
+    return min([p.get('mois_debut') or defaut for p in participants] + [defaut])
@@ -0,0 +1,173 @@
+"""Login throttling and a cap on concurrent bcrypt verifications.
+
+Every login attempt goes through ``Limiteur.verifier`` before the
+participant is read or any bcrypt work is done. It is refused with a 429
+and a ``Retry-After`` header when:
+
+* the client IP has no token left in its bucket (``LOGIN_IP_RAFALE``
+  attempts at once, refilled at ``LOGIN_IP_PAR_MINUTE``);
+* the email has no token left (``LOGIN_EMAIL_RAFALE`` /
+  ``LOGIN_EMAIL_PAR_MINUTE``), emails being counted per cagnotte;
+* the email is locked after failures: each consecutive failure doubles the
+  wait before the next attempt, from ``LOGIN_DELAI_BASE`` up to
+  ``LOGIN_DELAI_MAX`` seconds, until a successful login. The wait is
+  imposed by refusing early attempts, not by holding the connection.
+
+A rate of 0 disables the corresponding bucket. Buckets are kept in memory
+per worker process, at most ``LOGIN_MAX_CLES`` of each kind (the least
+recently used are forgotten first). The client IP is the one seen by
+uvicorn: behind a reverse proxy, run it with ``--proxy-headers``.
+
+``verification`` bounds the number of bcrypt verifications queued or
+running in the process to ``LOGIN_MAX_VERIFICATIONS``; beyond that the
+request gets a 503 at once instead of waiting behind the others.
+"""
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+import passwords
+
+LOGIN_IP_RAFALE = int(os.environ.get('LOGIN_IP_RAFALE', '50'))
+LOGIN_IP_PAR_MINUTE = float(os.environ.get('LOGIN_IP_PAR_MINUTE', '60'))
+LOGIN_EMAIL_RAFALE = int(os.environ.get('LOGIN_EMAIL_RAFALE', '5'))
+LOGIN_EMAIL_PAR_MINUTE = float(os.environ.get('LOGIN_EMAIL_PAR_MINUTE', '3'))
+LOGIN_DELAI_BASE = float(os.environ.get('LOGIN_DELAI_BASE', '1'))
+LOGIN_DELAI_MAX = float(os.environ.get('LOGIN_DELAI_MAX', '300'))
+LOGIN_MAX_CLES = int(os.environ.get('LOGIN_MAX_CLES', '50000'))
+LOGIN_MAX_VERIFICATIONS = int(os.environ.get('LOGIN_MAX_VERIFICATIONS', str(passwords.BCRYPT_MAX_CONCURRENCY * 4)))
+
+MOTIFS = ("ip", "email", "delai", "sature")
+
+
+class SeauxJetons:
+    """One token bucket per key; a key not seen for a while is a full bucket"""
+
+    def __init__(self, capacite: int, par_minute: float, max_cles: int = LOGIN_MAX_CLES):
+        self.capacite = capacite
+        self.par_seconde = par_minute / 60
+        self.max_cles = max_cles
+        self._seaux: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # cle -> (jetons, instant)
+
+    def __len__(self) -> int:
+        return len(self._seaux)
+
+    def actif(self) -> bool:
+        return self.par_seconde > 0
+
+    def prendre(self, cle: str, maintenant: float) -> float:
+        """Take a token for ``cle``: 0 when allowed, else the seconds until one is available"""
+        if not self.actif():
+            return 0.0
+        jetons, instant = self._seaux.get(cle, (self.capacite, maintenant))
+        jetons = min(self.capacite, jetons + (maintenant - instant) * self.par_seconde)
+        attente = 0.0
+        if jetons >= 1:
+            jetons -= 1
+        else:
+            attente = (1 - jetons) / self.par_seconde
+        self._seaux[cle] = (jetons, maintenant)
+        self._seaux.move_to_end(cle)
+        while len(self._seaux) > self.max_cles:
+            self._seaux.popitem(last=False)
+        return attente
+
+
+class Limiteur:
+    def __init__(self):
+        self.ips = SeauxJetons(LOGIN_IP_RAFALE, LOGIN_IP_PAR_MINUTE)
+        self.emails = SeauxJetons(LOGIN_EMAIL_RAFALE, LOGIN_EMAIL_PAR_MINUTE)
+        self._echecs: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()  # cle -> (echecs, bloque jusqu'à)
+        self.refus: Dict[str, int] = dict.fromkeys(MOTIFS, 0)
+        self.echecs_total = 0
+        self.verifications_total = 0
+        self.verifications_en_cours = 0
+
+    @staticmethod
+    def cle_email(cagnotte_id: str, email: str) -> str:
+        return f"{cagnotte_id}:{email.strip().lower()}"
+
+    def _refuser(self, motif: str, attente: float) -> None:
+        self.refus[motif] += 1
+        raise HTTPException(
+            status_code=429,
+            detail="Trop de tentatives de connexion, réessayez plus tard",
+            headers={"Retry-After": str(max(1, math.ceil(attente)))}
+        )
+
+    def verifier(self, cle_email: str, ip: Optional[str]) -> None:
+        """429 when this attempt must be refused; to call before any password work"""
+        maintenant = time.monotonic()
+        echec = self._echecs.get(cle_email)
+        if echec and echec[1] > maintenant:
+            self._refuser("delai", echec[1] - maintenant)
+        if ip:
+            attente = self.ips.prendre(ip, maintenant)
+            if attente:
+                self._refuser("ip", attente)
+        attente = self.emails.prendre(cle_email, maintenant)
+        if attente:
+            self._refuser("email", attente)
+
+    def echec(self, cle_email: str) -> None:
+        """Failed attempt: lock the email for a delay doubling with each consecutive failure"""
+        self.echecs_total += 1
+        if LOGIN_DELAI_BASE <= 0:
+            return
+        nombre = self._echecs.get(cle_email, (0, 0.0))[0] + 1
+        delai = min(LOGIN_DELAI_MAX, LOGIN_DELAI_BASE * 2 ** min(nombre - 1, 32))
+        self._echecs[cle_email] = (nombre, time.monotonic() + delai)
+        self._echecs.move_to_end(cle_email)
+        while len(self._echecs) > LOGIN_MAX_CLES:
+            self._echecs.popitem(last=False)
+
+    def succes(self, cle_email: str) -> None:
+        self._echecs.pop(cle_email, None)
+
+    @asynccontextmanager
+    async def verification(self) -> AsyncIterator[None]:
+        """Admission of one bcrypt verification; 503 when too many are already queued or running"""
+        if self.verifications_en_cours >= LOGIN_MAX_VERIFICATIONS:
+            self.refus["sature"] += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Trop de connexions simultanées, réessayez dans un instant",
+                headers={"Retry-After": "1"}
+            )
+        self.verifications_en_cours += 1
+        self.verifications_total += 1
+        try:
+            yield
+        finally:
+            self.verifications_en_cours -= 1
+
+    def exposer(self) -> str:
+        """Counters in the Prometheus text format, appended to /metrics"""
+        lignes = ["# HELP login_rejections_total Tentatives de connexion refusées avant bcrypt.",
+                  "# TYPE login_rejections_total counter"]
+        lignes += [f'login_rejections_total{{reason="{motif}"}} {n}' for motif, n in self.refus.items()]
+        lignes += [
+            "# HELP login_failures_total Connexions échouées (email inconnu ou mot de passe incorrect).",
+            "# TYPE login_failures_total counter",
+            f"login_failures_total {self.echecs_total}",
+            "# HELP login_password_checks_total Vérifications bcrypt admises.",
+            "# TYPE login_password_checks_total counter",
+            f"login_password_checks_total {self.verifications_total}",
+            "# HELP login_password_checks_in_flight Vérifications bcrypt en attente ou en cours.",
+            "# TYPE login_password_checks_in_flight gauge",
+            f"login_password_checks_in_flight {self.verifications_en_cours}",
+            "# HELP login_tracked_keys Clés suivies par le limiteur.",
+            "# TYPE login_tracked_keys gauge",
+            f'login_tracked_keys{{kind="ip"}} {len(self.ips)}',
+            f'login_tracked_keys{{kind="email"}} {len(self.emails)}',
+            f'login_tracked_keys{{kind="echec"}} {len(self._echecs)}',
+        ]
+        return "\n".join(lignes) + "\n"
+
+
+limiteur = Limiteur()
@@ -0,0 +1,532 @@
+"""Local load test: throwaway mongod, synthetic data, concurrent traffic.
+
+Usage::
+
+    python loadtest.py [--taille petit|moyen|grand] [--participants N] [--mois M]
+                       [--duree S] [--sortie resultats.json] [--reference ancien.json]
+                       [--cagnottes N]
+
+By default a temporary ``mongod`` (from PATH, or ``--mongod``) and
+``uvicorn server:app`` are started on free local ports, the database is
+seeded with ``participants × mois`` paiements (``grand``: 10,000 × 100 =
+1M) and three traffic patterns run at the same time:
+
+* rentrée: a month-start spike where ``--logins`` participants log in,
+  declare the current month and look at their KPIs;
+* dashboard: ``--admins`` admins polling the admin page datasets, sending
+  back the ETags they received like a browser does;
+* exports: ``--exports`` admins downloading the full CSV export in a loop.
+
+p50/p95/p99 latency, throughput and errors per endpoint are printed and
+written as JSON. With ``--reference`` the run is compared with a previous
+result and the exit code is 1 when a p95 regressed by more than
+``--tolerance``. ``--mongo-url`` reuses an existing MongoDB, ``--serveur``
+an already running API (seeded by an earlier run, see ``--sans-seed``).
+
+With ``--cagnottes N`` the traffic above hits the default cagnotte while
+N-1 small quiet cagnottes are seeded next to it, each polled by one admin.
+Their latency is measured alone first, then during the spike, and the
+exit code is 1 when a quiet pot's p95 grows by more than
+``--isolation-tolerance`` times: one noisy pot must not degrade the others.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+import cagnottes
+import passwords
+
+TAILLES = {"petit": (100, 12), "moyen": (1000, 36), "grand": (10_000, 100)}
+DB_NAME = "cagnotte_loadtest"
+ADMIN_EMAIL = "admin@loadtest.example.org"
+MOT_DE_PASSE = "loadtest"
+LOT_INSERTION = 10_000
+
+
+def port_libre() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def attendre(condition, delai: float, message: str) -> None:
+    limite = time.monotonic() + delai
+    while time.monotonic() < limite:
+        try:
+            if condition():
+                return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(message)
+
+
+def est_actif(index: int) -> bool:
+    """One seeded participant in 20 is inactive"""
+    return index % 20 != 19
+
+
+def mois_decales(mois: str, decalage: int) -> str:
+    annee, num = map(int, mois.split('-'))
+    index = annee * 12 + num - 1 + decalage
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+# ============ DATASET ============
+
+def seed(db, nb_participants: int, nb_mois: int, mois_actuel: str, seed_aleatoire: int = 42,
+         cagnotte_id: str = cagnottes.CAGNOTTE_DEFAUT) -> Dict[str, int]:
+    """Participants of ``cagnotte_id`` with ``nb_mois`` months of paiements before ``mois_actuel``, and their rollups.
+
+    ``db`` is a synchronous pymongo database; everyone shares one password
+    so seeding does not spend minutes in bcrypt. Other cagnottes are left alone.
+    """
+    rnd = random.Random(seed_aleatoire)
+    for collection in ("participants", "paiements", "paiement_rollups", "jobs", "config"):
+        db[collection].delete_many({"cagnotte_id": cagnotte_id})
+    db.versions.delete_many({"key": {"$regex": f"^{cagnotte_id}:"}})
+    db.config.insert_many([{"cagnotte_id": cagnotte_id, "key": k, "value": v} for k, v in cagnottes.CONFIG_DEFAUT.items()])
+    hashed = passwords.hash_password_sync(MOT_DE_PASSE)
+    maintenant = datetime.now(timezone.utc).isoformat()
+    premier_mois = mois_decales(mois_actuel, -nb_mois)
+
+    participants = [{
+        "id": str(uuid.uuid4()), "cagnotte_id": cagnotte_id, "nom": "Admin Loadtest", "email": ADMIN_EMAIL,
+        "password": hashed, "actif": True, "admin": True, "mois_debut": premier_mois, "created_at": maintenant
+    }]
+    for i in range(nb_participants):
+        participants.append({
+            "id": str(uuid.uuid4()), "cagnotte_id": cagnotte_id, "nom": f"Participant {i:05d}",
+            "email": f"participant{i}@loadtest.example.org", "password": hashed, "actif": est_actif(i),
+            "mois_debut": mois_decales(premier_mois, rnd.randint(0, nb_mois // 2)), "created_at": maintenant
+        })
+    db.participants.insert_many(participants)
+
+    nb_paiements = 0
+    paiements, rollups_docs = [], []
+
+    def vider():
+        nonlocal paiements, rollups_docs
+        if paiements:
+            db.paiements.insert_many(paiements, ordered=False)
+            db.paiement_rollups.insert_many(rollups_docs, ordered=False)
+        paiements, rollups_docs = [], []
+
+    for participant in participants[1:]:
+        for decalage in range(nb_mois):
+            mois = mois_decales(premier_mois, decalage)
+            statut = "confirme" if rnd.random() < 0.9 else "en_attente"
+            montant = 50.0
+            paiements.append({
+                "id": str(uuid.uuid4()), "cagnotte_id": cagnotte_id, "participant_id": participant['id'],
+                "mois": mois, "montant": montant,
+                "methode": rnd.choice(("TWINT", "VIREMENT")), "versement": True, "raison": None, "statut": statut,
+                "date": f"{mois}-{rnd.randint(1, 28):02d}T12:00:00+00:00"
+            })
+            rollups_docs.append({
+                "cagnotte_id": cagnotte_id, "participant_id": participant['id'], "mois": mois,
+                "montants": {statut: montant}, "nombres": {statut: 1}
+            })
+            nb_paiements += 1
+            if len(paiements) >= LOT_INSERTION:
+                vider()
+    vider()
+    return {"participants": len(participants), "paiements": nb_paiements}
+
+
+# ============ PROCESSES ============
+
+class Environnement:
+    """Throwaway mongod and uvicorn processes, stopped on exit"""
+
+    def __init__(self):
+        self.processus: List[subprocess.Popen] = []
+        self.dossiers: List[str] = []
+
+    def demarrer_mongod(self, executable: str) -> str:
+        dossier = tempfile.mkdtemp(prefix="cagnotte-loadtest-")
+        self.dossiers.append(dossier)
+        port = port_libre()
+        self.processus.append(subprocess.Popen(
+            [executable, "--dbpath", dossier, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+        url = f"mongodb://127.0.0.1:{port}"
+        from pymongo import MongoClient
+        client = MongoClient(url, serverSelectionTimeoutMS=500)
+        try:
+            attendre(lambda: client.admin.command('ping'), 30, "mongod n'a pas démarré")
+        finally:
+            client.close()
+        return url
+
+    def demarrer_serveur(self, mongo_url: str, db_name: str) -> str:
+        port = port_libre()
+        env = {
+            **os.environ,
+            "MONGO_URL": mongo_url, "DB_NAME": db_name, "ADMIN_EMAILS": ADMIN_EMAIL,
+            "JWT_SECRET": uuid.uuid4().hex, "CORS_ORIGINS": "*",
+            # Every simulated participant logs in from 127.0.0.1
+            "LOGIN_IP_PAR_MINUTE": "0",
+        }
+        self.processus.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning"],
+            cwd=Path(__file__).parent, env=env
+        ))
+        url = f"http://127.0.0.1:{port}"
+        attendre(lambda: httpx.get(f"{url}/api/config").status_code == 200, 120, "le serveur n'a pas démarré")
+        return url
+
+    def arreter(self) -> None:
+        for p in reversed(self.processus):
+            p.terminate()
+            try:
+                p.wait(10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        for dossier in self.dossiers:
+            shutil.rmtree(dossier, ignore_errors=True)
+
+
+# ============ TRAFFIC ============
+
+class Mesures:
+    def __init__(self):
+        self.latences: Dict[str, List[float]] = {}
+        self.erreurs: Dict[str, int] = {}
+
+    async def requete(self, client: httpx.AsyncClient, libelle: str, methode: str, url: str,
+                      streaming: bool = False, **kwargs) -> Optional[httpx.Response]:
+        """Time one request (body fully read) under ``libelle``; None on transport error"""
+        debut = time.perf_counter()
+        try:
+            if streaming:
+                async with client.stream(methode, url, **kwargs) as reponse:
+                    async for _ in reponse.aiter_bytes():
+                        pass
+            else:
+                reponse = await client.request(methode, url, **kwargs)
+        except httpx.HTTPError:
+            reponse = None
+        self.latences.setdefault(libelle, []).append(time.perf_counter() - debut)
+        if reponse is None or reponse.status_code >= 400:
+            self.erreurs[libelle] = self.erreurs.get(libelle, 0) + 1
+        return reponse
+
+    def rapport(self, duree: float) -> Dict[str, Dict[str, float]]:
+        resultats = {}
+        for libelle, latences in sorted(self.latences.items()):
+            if len(latences) >= 2:
+                centiles = statistics.quantiles(latences, n=100, method='inclusive')
+                p50, p95, p99 = centiles[49], centiles[94], centiles[98]
+            else:
+                p50 = p95 = p99 = latences[0]
+            resultats[libelle] = {
+                "requetes": len(latences),
+                "erreurs": self.erreurs.get(libelle, 0),
+                "p50_ms": round(p50 * 1000, 2),
+                "p95_ms": round(p95 * 1000, 2),
+                "p99_ms": round(p99 * 1000, 2),
+                "max_ms": round(max(latences) * 1000, 2),
+                "debit_rps": round(len(latences) / duree, 2),
+            }
+        return resultats
+
+
+async def login(client: httpx.AsyncClient, mesures: Mesures, email: str, mot_de_passe: str,
+                cagnotte_id: Optional[str] = None) -> Optional[str]:
+    """Token of ``email``; the other routes need no prefix, the token names the cagnotte"""
+    chemin = f"/api/c/{cagnotte_id}/auth/login" if cagnotte_id else "/api/auth/login"
+    reponse = await mesures.requete(client, "POST /api/auth/login", "POST", chemin,
+                                    json={"email": email, "password": mot_de_passe})
+    return reponse.json()['token'] if reponse is not None and reponse.status_code == 200 else None
+
+
+async def rentree(client: httpx.AsyncClient, mesures: Mesures, emails: List[str], mois: str, concurrence: int) -> None:
+    """Month-start spike: log in, declare the month, look at the KPIs"""
+    limite = asyncio.Semaphore(concurrence)
+
+    async def participant(email: str) -> None:
+        async with limite:
+            token = await login(client, mesures, email, MOT_DE_PASSE)
+            if not token:
+                return
+            headers = {"Authorization": f"Bearer {token}"}
+            await mesures.requete(client, "POST /api/paiements", "POST", "/api/paiements", headers=headers,
+                                  json={"mois": mois, "montant": 50.0, "methode": "TWINT"})
+            await mesures.requete(client, "GET /api/kpi/participant", "GET", "/api/kpi/participant", headers=headers)
+            await mesures.requete(client, "GET /api/paiements", "GET", "/api/paiements", headers=headers)
+
+    await asyncio.gather(*(participant(email) for email in emails))
+
+
+async def dashboard(client: httpx.AsyncClient, mesures: Mesures, token: str, annee: str,
+                    intervalle: float, arret: asyncio.Event) -> None:
+    """Admin page polling, with If-None-Match like a browser cache"""
+    headers = {"Authorization": f"Bearer {token}"}
+    etags: Dict[str, str] = {}
+
+    async def get(libelle: str, url: str, params: Optional[Dict[str, Any]] = None) -> Optional[httpx.Response]:
+        cle = f"{url}?{params}"
+        entetes = {**headers, **({"If-None-Match": etags[cle]} if cle in etags else {})}
+        reponse = await mesures.requete(client, libelle, "GET", url, headers=entetes, params=params)
+        if reponse is not None and 'etag' in reponse.headers:
+            etags[cle] = reponse.headers['etag']
+        return reponse
+
+    async def pages(libelle: str, url: str, params: Dict[str, Any]) -> None:
+        after = None
+        while not arret.is_set():
+            reponse = await get(libelle, url, {**params, "limit": 1000, **({"after": after} if after else {})})
+            if reponse is None or reponse.status_code != 200:
+                return
+            after = reponse.json()['next_cursor']
+            if not after:
+                return
+
+    while not arret.is_set():
+        await asyncio.gather(
+            pages("GET /api/participants", "/api/participants", {}),
+            pages("GET /api/paiements/all", "/api/paiements/all", {"mois": annee}),
+            get("GET /api/kpi/admin", "/api/kpi/admin"),
+            get("GET /api/kpi/dashboard", "/api/kpi/dashboard"),
+            get("GET /api/config", "/api/config"),
+        )
+        try:
+            await asyncio.wait_for(arret.wait(), timeout=intervalle)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def exports(client: httpx.AsyncClient, mesures: Mesures, token: str, intervalle: float,
+                  arret: asyncio.Event) -> None:
+    headers = {"Authorization": f"Bearer {token}", "Accept-Encoding": "gzip"}
+    while not arret.is_set():
+        await mesures.requete(client, "GET /api/export/csv-all", "GET", "/api/export/csv-all",
+                              streaming=True, headers=headers)
+        try:
+            await asyncio.wait_for(arret.wait(), timeout=intervalle)
+        except asyncio.TimeoutError:
+            pass
+
+
+def cagnottes_calmes(nb_cagnottes: int) -> List[str]:
+    return [f"calme-{k}" for k in range(1, nb_cagnottes)]
+
+
+async def calmes(client: httpx.AsyncClient, mesures: Mesures, tokens: List[str], annee: str,
+                 intervalle: float, duree: Optional[float] = None, arret: Optional[asyncio.Event] = None) -> float:
+    """One admin polling each quiet cagnotte, for ``duree`` seconds or until ``arret``; returns the time spent"""
+    arret = arret or asyncio.Event()
+    debut = time.perf_counter()
+    taches = [asyncio.create_task(dashboard(client, mesures, token, annee, intervalle, arret)) for token in tokens]
+    if duree is not None:
+        await asyncio.sleep(duree)
+        arret.set()
+    await asyncio.gather(*taches)
+    return time.perf_counter() - debut
+
+
+async def trafic(url: str, args: argparse.Namespace, emails: List[str]) -> Dict[str, Any]:
+    mesures = Mesures()
+    maintenant = datetime.now(timezone.utc)
+    calmes_ids = cagnottes_calmes(args.cagnottes)
+    limites = httpx.Limits(max_connections=args.concurrence + args.admins + args.exports + len(calmes_ids) * 5 + 10)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=120) as client:
+        token_admin = await login(client, mesures, args.admin_email, args.admin_password)
+        if not token_admin:
+            raise RuntimeError("Connexion admin impossible")
+        isolation = None
+        tokens_calmes = []
+        for cagnotte_id in calmes_ids:
+            token = await login(client, Mesures(), ADMIN_EMAIL, MOT_DE_PASSE, cagnotte_id)
+            if not token:
+                raise RuntimeError(f"Connexion admin impossible ({cagnotte_id})")
+            tokens_calmes.append(token)
+        if tokens_calmes:
+            # Reference: the quiet cagnottes alone
+            seules = Mesures()
+            duree_seules = await calmes(client, seules, tokens_calmes, str(maintenant.year), args.intervalle,
+                                        duree=args.duree_reference)
+            isolation = {"seules": seules.rapport(duree_seules)}
+        mesures_calmes = Mesures()
+        arret = asyncio.Event()
+        fond = [
+            *(dashboard(client, mesures, token_admin, str(maintenant.year), args.intervalle, arret)
+              for _ in range(args.admins)),
+            *(exports(client, mesures, token_admin, args.intervalle * 2, arret) for _ in range(args.exports)),
+            calmes(client, mesures_calmes, tokens_calmes, str(maintenant.year), args.intervalle, arret=arret),
+        ]
+        taches = [asyncio.create_task(t) for t in fond]
+        debut = time.perf_counter()
+        await rentree(client, mesures, emails, maintenant.strftime("%Y-%m"), args.concurrence)
+        reste = args.duree - (time.perf_counter() - debut)
+        if reste > 0:
+            await asyncio.sleep(reste)
+        arret.set()
+        await asyncio.gather(*taches)
+        duree = time.perf_counter() - debut
+    if isolation is not None:
+        isolation["sous_charge"] = mesures_calmes.rapport(duree)
+    return {"duree_s": round(duree, 2), "endpoints": mesures.rapport(duree), "isolation": isolation}
+
+
+# ============ REPORT ============
+
+def afficher(resultats: Dict[str, Dict[str, float]]) -> None:
+    print(f"{'endpoint':<28} {'req':>6} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+    for libelle, r in resultats.items():
+        print(f"{libelle:<28} {r['requetes']:>6} {r['erreurs']:>5} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+              f"{r['p99_ms']:>9.1f} {r['debit_rps']:>8.1f}")
+
+
+def comparer(actuels: Dict[str, Dict[str, float]], reference: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """Endpoints whose p95 got worse than the reference by more than ``tolerance``"""
+    regressions = []
+    for libelle, r in actuels.items():
+        avant = reference.get(libelle)
+        if avant and avant['p95_ms'] > 0 and r['p95_ms'] > avant['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{libelle}: p95 {avant['p95_ms']} -> {r['p95_ms']} ms")
+    return regressions
+
+
+def verifier_isolation(isolation: Dict[str, Dict[str, Dict[str, float]]], tolerance: float) -> List[str]:
+    """Quiet-cagnotte endpoints whose p95 under load exceeds ``tolerance`` times their p95 alone"""
+    echecs = []
+    for libelle, seul in isolation['seules'].items():
+        charge = isolation['sous_charge'].get(libelle)
+        if not charge:
+            continue
+        if charge['erreurs']:
+            echecs.append(f"{libelle}: {charge['erreurs']} erreur(s) pendant la charge d'une autre cagnotte")
+        if seul['p95_ms'] > 0 and charge['p95_ms'] > seul['p95_ms'] * tolerance:
+            echecs.append(f"{libelle}: p95 {seul['p95_ms']} ms seule, {charge['p95_ms']} ms sous charge")
+    return echecs
+
+
+def version_git() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def analyser_arguments(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Test de charge local de l'API Cagnotte")
+    parser.add_argument("--taille", choices=TAILLES, default="petit")
+    parser.add_argument("--participants", type=int, help="remplace le nombre de participants de --taille")
+    parser.add_argument("--mois", type=int, help="mois d'historique (un paiement par mois et participant)")
+    parser.add_argument("--duree", type=float, default=30, help="durée minimale du test en secondes")
+    parser.add_argument("--logins", type=int, default=200, help="participants du pic de début de mois")
+    parser.add_argument("--concurrence", type=int, default=50, help="participants simultanés pendant le pic")
+    parser.add_argument("--admins", type=int, default=3, help="admins qui rafraîchissent le tableau de bord")
+    parser.add_argument("--exports", type=int, default=1, help="admins qui exportent le CSV en boucle")
+    parser.add_argument("--intervalle", type=float, default=2, help="secondes entre deux rafraîchissements")
+    parser.add_argument("--mongod", default=shutil.which("mongod"), help="exécutable mongod")
+    parser.add_argument("--mongo-url", help="MongoDB existante au lieu d'un mongod jetable")
+    parser.add_argument("--db-name", default=DB_NAME, help="base utilisée (vidée puis remplie sauf --sans-seed)")
+    parser.add_argument("--serveur", help="API déjà démarrée (URL) au lieu de lancer uvicorn")
+    parser.add_argument("--sans-seed", action="store_true", help="réutiliser les données déjà présentes")
+    parser.add_argument("--admin-email", default=ADMIN_EMAIL)
+    parser.add_argument("--admin-password", default=MOT_DE_PASSE)
+    parser.add_argument("--sortie", help="fichier JSON des résultats (défaut: loadtest-<date>.json)")
+    parser.add_argument("--reference", help="résultats précédents à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="régression de p95 tolérée (0.25 = +25%%)")
+    parser.add_argument("--cagnottes", type=int, default=1, help="cagnottes servies, dont N-1 calmes")
+    parser.add_argument("--participants-calmes", type=int, default=20, help="participants par cagnotte calme")
+    parser.add_argument("--duree-reference", type=float, default=10, help="secondes de mesure des cagnottes calmes seules")
+    parser.add_argument("--isolation-tolerance", type=float, default=3.0,
+                        help="p95 sous charge / p95 seules toléré pour les cagnottes calmes")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = analyser_arguments(argv)
+    nb_participants, nb_mois = TAILLES[args.taille]
+    nb_participants = args.participants or nb_participants
+    nb_mois = args.mois or nb_mois
+    if args.serveur and not args.sans_seed and not args.mongo_url:
+        print("--serveur demande --mongo-url (la base du serveur) ou --sans-seed")
+        return 2
+    environnement = Environnement()
+    try:
+        url = args.serveur
+        jeu = None
+        if not (args.serveur and args.sans_seed):
+            mongo_url = args.mongo_url
+            if not mongo_url:
+                if not args.mongod:
+                    print("mongod introuvable: installez MongoDB ou passez --mongod / --mongo-url")
+                    return 2
+                mongo_url = environnement.demarrer_mongod(args.mongod)
+            if not args.sans_seed:
+                from pymongo import MongoClient
+                client = MongoClient(mongo_url)
+                debut = time.perf_counter()
+                mois_actuel = datetime.now(timezone.utc).strftime("%Y-%m")
+                jeu = seed(client[args.db_name], nb_participants, nb_mois, mois_actuel)
+                for k, cagnotte_id in enumerate(cagnottes_calmes(args.cagnottes)):
+                    seed(client[args.db_name], args.participants_calmes, nb_mois, mois_actuel, k, cagnotte_id)
+                client.close()
+                print(f"Jeu de données: {jeu['participants']} participants, {jeu['paiements']} paiements "
+                      f"({time.perf_counter() - debut:.1f} s)")
+            if not url:
+                url = environnement.demarrer_serveur(mongo_url, args.db_name)
+
+        actifs = [i for i in range(nb_participants) if est_actif(i)]
+        emails = [f"participant{i}@loadtest.example.org" for i in random.Random(0).sample(actifs, min(args.logins, len(actifs)))]
+        resultat = asyncio.run(trafic(url, args, emails))
+    finally:
+        environnement.arreter()
+
+    afficher(resultat['endpoints'])
+    echecs_isolation = []
+    if resultat['isolation']:
+        print(f"Cagnottes calmes ({args.cagnottes - 1}), seules puis pendant la charge:")
+        afficher(resultat['isolation']['seules'])
+        afficher(resultat['isolation']['sous_charge'])
+        echecs_isolation = verifier_isolation(resultat['isolation'], args.isolation_tolerance)
+        for ligne in echecs_isolation:
+            print(f"Isolation: {ligne}")
+    sortie = {
+        "date": datetime.now(timezone.utc).isoformat(),
+        "version": version_git(),
+        "parametres": {k: v for k, v in vars(args).items() if k not in ("admin_password",)},
+        "jeu_de_donnees": jeu,
+        **resultat,
+    }
+    chemin = args.sortie or f"loadtest-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    with open(chemin, "w", encoding="utf-8") as f:
+        json.dump(sortie, f, indent=2, ensure_ascii=False)
+    print(f"Résultats écrits dans {chemin}")
+
+    if args.reference:
+        with open(args.reference, encoding="utf-8") as f:
+            reference = json.load(f)['endpoints']
+        regressions = comparer(resultat['endpoints'], reference, args.tolerance)
+        for ligne in regressions:
+            print(f"Régression: {ligne}")
+        if regressions:
+            return 1
+    return 1 if echecs_isolation else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,183 @@
+"""Per-route request metrics in the Prometheus text format.
+
+``MetriquesMiddleware`` is a plain ASGI middleware: it times every HTTP
+request until its last body chunk is sent, counts bytes sent and records
+the result under the *route template* (``/api/paiements/{paiement_id}``),
+so the number of series stays bounded whatever the clients send. Requests
+that match no route are grouped under ``ROUTE_INCONNUE``.
+
+The route is only known once the router has matched the request: it then
+stores the endpoint in the ASGI scope, which the middleware shares. The
+in-flight gauge is computed at scrape time from the scopes still open, so
+nothing but two clock reads, a few dict lookups and a ``bisect`` run per
+request.
+
+Each worker process keeps its own figures; with several uvicorn workers
+every scrape only sees the worker that answered it.
+"""
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+ROUTE_INCONNUE = "<sans_route>"
+
+SEUILS_DUREE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SEUILS_TAILLE = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogramme:
+    __slots__ = ("seuils", "comptes", "somme")
+
+    def __init__(self, seuils: Tuple[float, ...]):
+        self.seuils = seuils
+        self.comptes = [0] * (len(seuils) + 1)  # last bucket: above every seuil
+        self.somme = 0.0
+
+    def observer(self, valeur: float) -> None:
+        self.comptes[bisect_left(self.seuils, valeur)] += 1
+        self.somme += valeur
+
+    def cumules(self) -> Iterable[Tuple[str, int]]:
+        total = 0
+        for seuil, compte in zip(self.seuils, self.comptes):
+            total += compte
+            yield _nombre(seuil), total
+        yield "+Inf", total + self.comptes[-1]
+
+
+class Serie:
+    """Figures of one (method, route) pair"""
+    __slots__ = ("durees", "tailles", "statuts", "erreurs")
+
+    def __init__(self):
+        self.durees = Histogramme(SEUILS_DUREE)
+        self.tailles = Histogramme(SEUILS_TAILLE)
+        self.statuts: Dict[int, int] = {}
+        self.erreurs = 0
+
+
+class Registre:
+    def __init__(self):
+        self.series: Dict[Tuple[str, str], Serie] = {}
+        self.en_cours: Dict[int, Dict[str, Any]] = {}  # scopes of the requests being served
+        self._routes: Dict[Callable, str] = {}
+
+    def route(self, scope: Dict[str, Any]) -> str:
+        """Template of the route that handled ``scope``"""
+        endpoint = scope.get("endpoint")
+        app = scope.get("app")
+        if endpoint is None or app is None:
+            return ROUTE_INCONNUE
+        route = self._routes.get(endpoint)
+        if route is None:
+            # Built on first use: routes are only complete once the app is set up
+            self._routes = {r.endpoint: r.path for r in app.routes if hasattr(r, "endpoint")}
+            route = self._routes.setdefault(endpoint, ROUTE_INCONNUE)
+        return route
+
+    def enregistrer(self, methode: str, route: str, statut: int, duree: float, taille: int, erreur: bool) -> None:
+        serie = self.series.get((methode, route))
+        if serie is None:
+            serie = self.series[(methode, route)] = Serie()
+        serie.durees.observer(duree)
+        serie.tailles.observer(taille)
+        serie.statuts[statut] = serie.statuts.get(statut, 0) + 1
+        if erreur:
+            serie.erreurs += 1
+
+    def exposer(self) -> str:
+        """All the metrics in the Prometheus text exposition format (0.0.4)"""
+        lignes: List[str] = []
+        series = sorted(self.series.items())
+
+        lignes += ["# HELP http_requests_total Requêtes HTTP traitées.", "# TYPE http_requests_total counter"]
+        for (methode, route), serie in series:
+            for statut, compte in sorted(serie.statuts.items()):
+                lignes.append(f'http_requests_total{_labels(methode, route, status=str(statut))} {compte}')
+
+        lignes += ["# HELP http_request_errors_total Réponses 5xx et exceptions non gérées.",
+                   "# TYPE http_request_errors_total counter"]
+        for (methode, route), serie in series:
+            lignes.append(f'http_request_errors_total{_labels(methode, route)} {serie.erreurs}')
+
+        for nom, aide, attribut in (
+            ("http_request_duration_seconds", "Durée des requêtes, jusqu'au dernier octet envoyé.", "durees"),
+            ("http_response_size_bytes", "Taille du corps des réponses.", "tailles"),
+        ):
+            lignes += [f"# HELP {nom} {aide}", f"# TYPE {nom} histogram"]
+            for (methode, route), serie in series:
+                histogramme: Histogramme = getattr(serie, attribut)
+                for seuil, compte in histogramme.cumules():
+                    lignes.append(f'{nom}_bucket{_labels(methode, route, le=seuil)} {compte}')
+                lignes.append(f'{nom}_sum{_labels(methode, route)} {_nombre(histogramme.somme)}')
+                lignes.append(f'{nom}_count{_labels(methode, route)} {sum(histogramme.comptes)}')
+
+        en_cours: Dict[Tuple[str, str], int] = {}
+        for scope in list(self.en_cours.values()):
+            cle = (scope["method"], self.route(scope))
+            en_cours[cle] = en_cours.get(cle, 0) + 1
+        lignes += ["# HELP http_requests_in_flight Requêtes en cours de traitement.",
+                   "# TYPE http_requests_in_flight gauge"]
+        for (methode, route), nombre in sorted(en_cours.items()):
+            lignes.append(f'http_requests_in_flight{_labels(methode, route)} {nombre}')
+        return "\n".join(lignes) + "\n"
+
+
+def _nombre(valeur: float) -> str:
+    return repr(float(valeur)) if not float(valeur).is_integer() else str(int(valeur))
+
+
+def _echapper(valeur: str) -> str:
+    return valeur.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(methode: str, route: str, **autres: str) -> str:
+    paires = [("method", methode), ("route", route), *autres.items()]
+    return "{" + ",".join(f'{k}="{_echapper(v)}"' for k, v in paires) + "}"
+
+
+registre = Registre()
+
+
+class MetriquesMiddleware:
+    def __init__(self, app, registre: Registre = registre):
+        self.app = app
+        self.registre = registre
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        debut = time.perf_counter()
+        etat = {"statut": 500, "taille": 0, "fini": False}
+        self.registre.en_cours[id(scope)] = scope
+
+        async def send_mesure(message):
+            if message["type"] == "http.response.start":
+                etat["statut"] = message["status"]
+            elif message["type"] == "http.response.body":
+                etat["taille"] += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    etat["fini"] = True
+                    self._terminer(scope, etat, debut, erreur=False)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_mesure)
+        except BaseException:
+            if not etat["fini"]:
+                etat["fini"] = True
+                self._terminer(scope, etat, debut, erreur=True)
+            raise
+        finally:
+            self.registre.en_cours.pop(id(scope), None)
+        if not etat["fini"]:
+            # Client gone before the last chunk (e.g. a closed SSE stream)
+            self._terminer(scope, etat, debut, erreur=False)
+
+    def _terminer(self, scope, etat, debut: float, erreur: bool) -> None:
+        duree = time.perf_counter() - debut
+        self.registre.en_cours.pop(id(scope), None)
+        self.registre.enregistrer(scope["method"], self.registre.route(scope), etat["statut"], duree, etat["taille"],
+                                  erreur or etat["statut"] >= 500)
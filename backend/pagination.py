@@ -0,0 +1,62 @@
+"""Keyset (cursor) pagination helpers.
+
+A cursor is the opaque, URL-safe encoding of the sort key values of the
+last item of a page. The next page is fetched with a range predicate on
+those keys instead of ``skip``, so every page costs the same index scan.
+"""
+import base64
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException
+
+LIMIT_DEFAUT = 100
+LIMIT_MAX = 1000
+
+
+def encode_cursor(valeurs: Sequence[Any]) -> str:
+    brut = json.dumps(list(valeurs), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(brut).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, nb_champs: int) -> List[Any]:
+    try:
+        brut = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        valeurs = json.loads(brut)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+    if not isinstance(valeurs, list) or len(valeurs) != nb_champs:
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+    return valeurs
+
+
+def filtre_apres(champs: Sequence[str], valeurs: Sequence[Any]) -> Dict[str, Any]:
+    """Documents strictly after ``valeurs`` in ascending (champs...) order"""
+    branches = []
+    for i, champ in enumerate(champs):
+        branche = {c: v for c, v in zip(champs[:i], valeurs[:i])}
+        branche[champ] = {"$gt": valeurs[i]}
+        branches.append(branche)
+    return {"$or": branches}
+
+
+async def page(collection, filtre: Dict[str, Any], champs: Sequence[str], projection: Dict[str, Any],
+               limit: int, after: Optional[str]) -> Dict[str, Any]:
+    """One page of ``collection`` sorted on ``champs``.
+
+    Returns ``{"items", "next_cursor", "total"}``; ``total`` is only counted
+    for the first page (no ``after``).
+    """
+    limit = max(1, min(limit, LIMIT_MAX))
+    requete = filtre
+    if after:
+        apres = filtre_apres(champs, decode_cursor(after, len(champs)))
+        requete = {"$and": [filtre, apres]} if filtre else apres
+    cursor = collection.find(requete, projection).sort([(c, 1) for c in champs]).limit(limit + 1)
+    items = await cursor.to_list(limit + 1)
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor([items[-1].get(c) for c in champs])
+    total = None if after else await collection.count_documents(filtre)
+    return {"items": items, "next_cursor": next_cursor, "total": total}
@@ -0,0 +1,51 @@
+"""bcrypt hashing run in a dedicated thread pool, off the event loop.
+
+``BCRYPT_MAX_CONCURRENCY`` caps the number of hashes computed at the same
+time (the pool size) and ``BCRYPT_ROUNDS`` sets the work factor of new
+hashes. bcrypt releases the GIL while hashing, so the pool threads do not
+hold back the event loop.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+BCRYPT_MAX_CONCURRENCY = int(os.environ.get('BCRYPT_MAX_CONCURRENCY', str(min(4, os.cpu_count() or 1))))
+
+_executor = ThreadPoolExecutor(max_workers=BCRYPT_MAX_CONCURRENCY, thread_name_prefix="bcrypt")
+
+
+def hash_password_sync(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def verify_password_sync(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, hash_password_sync, password)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, verify_password_sync, password, hashed)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True if the hash was made with a lower work factor than BCRYPT_ROUNDS.
+
+    A stronger hash is kept when BCRYPT_ROUNDS is lowered, never downgraded.
+    """
+    # Modular crypt format: $2b$<rounds>$<salt+hash>
+    try:
+        return int(hashed.split('$')[2]) < BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False)
@@ -0,0 +1,47 @@
+"""Fast JSON responses for large lists read from MongoDB.
+
+For a route with ``response_model``, FastAPI validates the returned dicts,
+converts the result back to plain Python objects and encodes it with the
+standard ``json`` module. Routes opt into this module by returning
+``reponse_json(ADAPTER, contenu, response)`` instead; the route keeps its
+``response_model`` so the documented schema does not change.
+
+``JSON_RAPIDE`` selects the mode:
+
+* ``adapter`` (default): validate with a pre-built ``TypeAdapter`` and
+  encode straight to bytes with ``dump_json``, both in pydantic-core.
+* ``confiance``: skip validation and encode the documents as read from
+  the database with orjson. Only for queries projected on the fields of
+  the response model (``server.projection_modele``), whose stored values
+  already match the schema; falls back to ``adapter`` without orjson.
+* ``off``: return the content unchanged, i.e. FastAPI's usual path.
+"""
+import os
+from typing import Any
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # optional, only used by the "confiance" mode
+    orjson = None
+
+JSON_RAPIDE = os.environ.get('JSON_RAPIDE', 'adapter')
+
+# Headers set by the route's dependencies (e.g. ETag) are copied, except these
+_ENTETES_CORPS = {'content-length', 'content-type'}
+
+
+def encoder(adapter: TypeAdapter, contenu: Any, mode: str = JSON_RAPIDE) -> bytes:
+    if mode == 'confiance' and orjson is not None:
+        return orjson.dumps(contenu)
+    return adapter.dump_json(adapter.validate_python(contenu))
+
+
+def reponse_json(adapter: TypeAdapter, contenu: Any, response: Response) -> Any:
+    """Encoded ``application/json`` response for ``contenu``, keeping ``response``'s headers"""
+    if JSON_RAPIDE == 'off':
+        return contenu
+    entetes = {k: v for k, v in response.headers.items() if k not in _ENTETES_CORPS}
+    return Response(encoder(adapter, contenu), media_type="application/json", headers=entetes)
@@ -0,0 +1,161 @@
+"""Per participant and month totals of paiements (``paiement_rollups``).
+
+Each document is keyed by ``(cagnotte_id, participant_id, mois)`` and
+holds the amount and number of paiements per statut::
+
+    {"cagnotte_id": ..., "participant_id": ..., "mois": "2026-03",
+     "montants": {"confirme": 50.0, "en_attente": 0.0},
+     "nombres": {"confirme": 1, "en_attente": 0}}
+
+The mutating paiement routes keep it up to date with ``$inc``; KPI routes
+read it instead of the raw paiements. ``python rollups.py [YYYY-MM] [--dry-run]
+[--cagnotte ID]`` rebuilds the collection (or one month, or one cagnotte)
+from scratch and reports the drift.
+"""
+import asyncio
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne, ReplaceOne, DeleteOne
+
+import versions
+from indexes import filtre_annee
+
+logger = logging.getLogger(__name__)
+
+TOLERANCE = 0.005
+
+
+def _inc(paiements: Iterable[Dict[str, Any]], sens: int) -> Dict[Tuple[str, str, str], Dict[str, float]]:
+    """Merge the $inc operations for a set of paiements by rollup key"""
+    incs: Dict[Tuple[str, str, str], Dict[str, float]] = {}
+    for p in paiements:
+        inc = incs.setdefault((p['cagnotte_id'], p['participant_id'], p['mois']), {})
+        montant_key = f"montants.{p['statut']}"
+        nombre_key = f"nombres.{p['statut']}"
+        inc[montant_key] = inc.get(montant_key, 0) + sens * p['montant']
+        inc[nombre_key] = inc.get(nombre_key, 0) + sens
+    return incs
+
+
+async def appliquer(db, ajoutes: Iterable[Dict[str, Any]] = (), retires: Iterable[Dict[str, Any]] = ()) -> None:
+    """Add and remove paiements from the rollups in a single bulk write"""
+    incs = _inc(ajoutes, 1)
+    for key, inc in _inc(retires, -1).items():
+        cumul = incs.setdefault(key, {})
+        for field, value in inc.items():
+            cumul[field] = cumul.get(field, 0) + value
+    operations = [
+        UpdateOne({"cagnotte_id": cagnotte_id, "participant_id": pid, "mois": mois}, {"$inc": inc}, upsert=True)
+        for (cagnotte_id, pid, mois), inc in incs.items() if any(inc.values())
+    ]
+    if operations:
+        await db.paiement_rollups.bulk_write(operations, ordered=False)
+
+
+def est_regle(rollup: Dict[str, Any]) -> bool:
+    """A month is settled when it has paiements and all of them are confirmed"""
+    nombres = rollup.get('nombres', {})
+    total = sum(nombres.values())
+    return total > 0 and nombres.get('confirme', 0) == total
+
+
+async def _attendus(db, filtre: Dict[str, Any]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    attendus: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    async for row in db.paiements.aggregate([
+        {"$match": filtre},
+        {"$group": {
+            "_id": {"participant_id": "$participant_id", "mois": "$mois", "statut": "$statut"},
+            "montant": {"$sum": "$montant"},
+            "nombre": {"$sum": 1}
+        }}
+    ]):
+        key = (row['_id']['participant_id'], row['_id']['mois'])
+        rollup = attendus.setdefault(key, {"montants": {}, "nombres": {}})
+        rollup['montants'][row['_id']['statut']] = row['montant']
+        rollup['nombres'][row['_id']['statut']] = row['nombre']
+    return attendus
+
+
+def _ecarts(attendu: Dict[str, Any], actuel: Dict[str, Any]) -> List[str]:
+    ecarts = []
+    for champ in ('montants', 'nombres'):
+        valeurs_attendues = attendu.get(champ, {})
+        valeurs_actuelles = actuel.get(champ, {})
+        for statut in set(valeurs_attendues) | set(valeurs_actuelles):
+            a = valeurs_attendues.get(statut, 0)
+            b = valeurs_actuelles.get(statut, 0)
+            if abs(a - b) > TOLERANCE:
+                ecarts.append(f"{champ}.{statut}: {b} au lieu de {a}")
+    return ecarts
+
+
+async def recalculer(db, cagnotte_id: str, mois: Optional[str] = None, dry_run: bool = False) -> List[str]:
+    """Recompute the rollups of a cagnotte from the raw paiements (all, or a single month).
+
+    Returns one line per rollup that had drifted; unless ``dry_run`` the
+    drifted rollups are replaced by the recomputed values.
+    """
+    filtre: Dict[str, Any] = {"cagnotte_id": cagnotte_id}
+    if mois:
+        filtre["mois"] = mois
+    # Closed years have no raw paiements left, their rollups are final (see clotures.py)
+    fermees = [c['annee'] async for c in db.clotures.find({"cagnotte_id": cagnotte_id}, {"_id": 0, "annee": 1})]
+    if fermees:
+        filtre["$nor"] = [{"mois": filtre_annee(a)} for a in fermees]
+    attendus = await _attendus(db, filtre)
+    actuels = {
+        (r['participant_id'], r['mois']): r
+        async for r in db.paiement_rollups.find(filtre, {"_id": 0})
+    }
+    derives = []
+    operations = []
+    corriges = []
+    for key in set(attendus) | set(actuels):
+        attendu = attendus.get(key, {"montants": {}, "nombres": {}})
+        ecarts = _ecarts(attendu, actuels.get(key, {}))
+        if not ecarts:
+            continue
+        derives.append(f"{cagnotte_id} {key[0]} {key[1]}: " + ", ".join(ecarts))
+        corriges.append({"participant_id": key[0]})
+        filtre_rollup = {"cagnotte_id": cagnotte_id, "participant_id": key[0], "mois": key[1]}
+        if key in attendus:
+            operations.append(ReplaceOne(filtre_rollup, {**filtre_rollup, **attendu}, upsert=True))
+        else:
+            operations.append(DeleteOne(filtre_rollup))
+    if operations and not dry_run:
+        await db.paiement_rollups.bulk_write(operations, ordered=False)
+        # KPIs served with an ETag depend on the rollups
+        await versions.bump_paiements(db, cagnotte_id, corriges)
+    return derives
+
+
+async def _main(argv: List[str]) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    dry_run = '--dry-run' in argv
+    cagnotte = argv[argv.index('--cagnotte') + 1] if '--cagnotte' in argv[:-1] else None
+    mois = next((a for a in argv if not a.startswith('--') and a != cagnotte), None)
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    derives: List[str] = []
+    try:
+        for cagnotte_id in [cagnotte] if cagnotte else sorted(await db.participants.distinct("cagnotte_id")):
+            derives += await recalculer(db, cagnotte_id, mois, dry_run=dry_run)
+    finally:
+        client.close()
+    for ligne in derives:
+        print(ligne)
+    verbe = "à corriger" if dry_run else "corrigé(s)"
+    print(f"{len(derives)} rollup(s) {verbe}")
+    return 1 if derives and dry_run else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
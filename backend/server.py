@@ -1,37 +1,87 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, BackgroundTasks, Header, Query, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+import asyncio
 import os
+import re
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, TypeAdapter
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import uuid
 from datetime import datetime, timezone
-import bcrypt
 import jwt
 from decimal import Decimal, ROUND_UP
 import math
-from email_service import send_payment_reminder, send_admin_monthly_summary
+import numpy as np
+import email_service
+import jobs
+from indexes import ensure_indexes, filtre_annee
+import rollups
+import kpi_matrice
+import clotures
+import cagnottes
+from cache import ConfigCache, Principal, PrincipalCache
+import passwords
+from passwords import hash_password, verify_password
+from exports import csv_response
+import pagination
+import versions
+import events
+import metriques
+import limitation
+import idempotence
+import traces
+from reponses import reponse_json
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[traces.ecouteur])
 db = client[os.environ['DB_NAME']]
 
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = "HS256"
+# Lifetime of the tickets opening an event stream, which travel in the URL
+EVENTS_TICKET_SECONDS = int(os.environ.get('EVENTS_TICKET_SECONDS', '60'))
+
+# Admin accounts, parsed once
+ADMIN_EMAILS = frozenset(
+    e.strip() for e in os.environ.get('ADMIN_EMAILS', 'eric.savary@lausanne.ch').split(',') if e.strip()
+)
+
+# Clients allowed to read /metrics without an admin token (e.g. the Prometheus scraper)
+METRICS_ALLOWED_IPS = frozenset(
+    ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()
+)
+
+# Background worker for notification jobs
+job_worker = jobs.JobWorker(db)
+
+# Live events (SSE); fed by the routes, or by a change stream with several workers
+event_bus = events.EventBus()
+change_stream_task: Optional[asyncio.Task] = None
+
+# In-process caches
+config_cache = ConfigCache(ttl=float(os.environ.get('CONFIG_CACHE_TTL', '60')))
+principal_cache = PrincipalCache(
+    maxsize=int(os.environ.get('PRINCIPAL_CACHE_SIZE', '1024')),
+    ttl=float(os.environ.get('PRINCIPAL_CACHE_TTL', '30'))
+)
 
 # Create the main app
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
+security_optionnelle = HTTPBearer(auto_error=False)
 
 # ============ MODELS ============
 
@@ -82,6 +132,14 @@ class PaiementUpdate(BaseModel):
     raison: Optional[str] = None
     notes_admin: Optional[str] = None
 
+class OperationPaiement(BaseModel):
+    id: str
+    action: str  # confirm, update, delete
+    champs: Optional[PaiementUpdate] = None  # Pour update
+
+class BulkPaiementsRequest(BaseModel):
+    operations: List[OperationPaiement]
+
 class ConfigItem(BaseModel):
     model_config = ConfigDict(extra="ignore")
     key: str
@@ -99,6 +157,16 @@ class KPIResponse(BaseModel):
     en_attente_annee: float
     reste_mois: float
 
+class PageParticipants(BaseModel):
+    items: List[User]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+
+class PagePaiements(BaseModel):
+    items: List[Paiement]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+
 class KPIParticipant(BaseModel):
     participant_id: str
     nom: str
@@ -108,67 +176,188 @@ class KPIParticipant(BaseModel):
     progression: float
     en_retard: bool
 
+# Pre-built adapters for the large list responses (see reponses.py)
+PAGE_PARTICIPANTS_ADAPTER = TypeAdapter(PageParticipants)
+PAGE_PAIEMENTS_ADAPTER = TypeAdapter(PagePaiements)
+PAIEMENTS_ADAPTER = TypeAdapter(List[Paiement])
+
+def projection_modele(modele: type) -> Dict[str, int]:
+    """Mongo projection of the fields of ``modele`` only.
+
+    Stored fields outside the response model (``cagnotte_id``, ``password``,
+    ``admin``, ``versement``...) never reach a response, including with
+    ``JSON_RAPIDE=confiance``, which encodes the documents unvalidated.
+    """
+    return {"_id": 0, **dict.fromkeys(modele.model_fields, 1)}
+
+PROJECTION_USER = projection_modele(User)
+PROJECTION_PAIEMENT = projection_modele(Paiement)
+
 # ============ UTILITIES ============
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+def est_admin(user: Dict[str, Any]) -> bool:
+    """Admins of a cagnotte are flagged; ADMIN_EMAILS administer the default cagnotte"""
+    if user.get('admin'):
+        return True
+    return user['cagnotte_id'] == cagnottes.CAGNOTTE_DEFAUT and user['email'] in ADMIN_EMAILS
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+def filtre_admins(cagnotte_id: str) -> Dict[str, Any]:
+    """Active admins of a cagnotte, see ``est_admin``"""
+    conditions: List[Dict[str, Any]] = [{"admin": True}]
+    if cagnotte_id == cagnottes.CAGNOTTE_DEFAUT:
+        conditions.append({"email": {"$in": list(ADMIN_EMAILS)}})
+    return {"cagnotte_id": cagnotte_id, "actif": True, "$or": conditions}
 
-def create_token(user_id: str, email: str) -> str:
+def create_token(user_id: str, email: str, cagnotte_id: str) -> str:
     payload = {
         'user_id': user_id,
         'email': email,
+        'cagnotte_id': cagnotte_id,
         'exp': datetime.now(timezone.utc).timestamp() + 86400 * 7  # 7 days
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def create_ticket_evenements(user: Dict[str, Any]) -> str:
+    """Short-lived token only accepted by GET /api/events, unlike the session token"""
+    payload = {
+        'user_id': user['id'],
+        'cagnotte_id': user['cagnotte_id'],
+        'usage': 'events',
+        'exp': datetime.now(timezone.utc).timestamp() + EVENTS_TICKET_SECONDS
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
 def decode_token(token: str) -> Dict[str, Any]:
     try:
         return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
     except:
         raise HTTPException(status_code=401, detail="Token invalide")
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
-    token = credentials.credentials
+async def principal_depuis_token(token: str, cagnotte_chemin: Optional[str] = None,
+                                 usage: Optional[str] = None) -> Principal:
+    """Principal of a session token, or of a ticket issued for ``usage``"""
     payload = decode_token(token)
-    user = await db.participants.find_one({"id": payload['user_id']}, {"_id": 0})
-    if not user or not user.get('actif', True):
-        raise HTTPException(status_code=401, detail="Utilisateur non trouvé ou inactif")
-    return user
-
-async def require_admin(user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
-    admin_emails_str = os.environ.get('ADMIN_EMAILS', 'eric.savary@lausanne.ch')
-    admin_emails = [e.strip() for e in admin_emails_str.split(',')]
-    if user['email'] not in admin_emails:
+    if payload.get('usage') != usage:
+        raise HTTPException(status_code=401, detail="Token invalide")
+    # Tokens issued before multi-tenancy belong to the default cagnotte
+    cagnotte_id = payload.get('cagnotte_id', cagnottes.CAGNOTTE_DEFAUT)
+    if cagnotte_chemin is not None and cagnotte_chemin != cagnotte_id:
+        raise HTTPException(status_code=403, detail="Ce jeton n'est pas valable pour cette cagnotte")
+    principal = principal_cache.get(cagnotte_id, payload['user_id'])
+    if principal is None:
+        generation = principal_cache.generation
+        user = await db.participants.find_one({"id": payload['user_id'], "cagnotte_id": cagnotte_id}, {"_id": 0})
+        if not user or not user.get('actif', True):
+            raise HTTPException(status_code=401, detail="Utilisateur non trouvé ou inactif")
+        principal = Principal(user=user, is_admin=est_admin(user))
+        principal_cache.put(cagnotte_id, user['id'], principal, generation)
+    return principal
+
+async def get_current_principal(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)) -> Principal:
+    return await principal_depuis_token(credentials.credentials, cagnottes.du_chemin(request))
+
+async def get_current_user(principal: Principal = Depends(get_current_principal)) -> Dict[str, Any]:
+    return principal.user
+
+async def require_admin(principal: Principal = Depends(get_current_principal)) -> Dict[str, Any]:
+    if not principal.is_admin:
         raise HTTPException(status_code=403, detail="Accès administrateur requis")
-    return user
+    return principal.user
+
+def conditionnel(*cles: str, auth: Optional[Callable[..., Any]] = None, par_participant: bool = False):
+    """Route dependency answering If-None-Match from the version counters of ``cles``.
+
+    With ``auth`` the user is authenticated first and is part of the ETag;
+    ``par_participant`` adds the counter of the user's own paiements.
+    """
+    if auth is None:
+        async def dependance(request: Request, response: Response):
+            await versions.conditionnel(db, cagnottes.anonyme(request), request, response, list(cles))
+        return dependance
+
+    async def dependance_auth(request: Request, response: Response, user: Dict[str, Any] = Depends(auth)):
+        cles_user = [*cles, versions.cle_participant(user['id'])] if par_participant else list(cles)
+        await versions.conditionnel(db, user['cagnotte_id'], request, response, cles_user, user['id'])
+    return dependance_auth
+
+def publier_paiements(action: str, paiements: List[Dict[str, Any]]) -> None:
+    """Push paiement deltas to SSE clients, unless a change stream already does it"""
+    if events.EVENTS_SOURCE != "change_stream":
+        events.publier_paiements(event_bus, action, paiements)
+
+DOUBLON_VERSEMENT = "Un versement existe déjà pour ce mois"
+
+def marquer_versement(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Flag read by the unique index allowing one declaration per participant and month"""
+    if 'methode' in data:
+        data['versement'] = data['methode'] != "DEPENSE"
+    return data
+
+def filtre_mois(mois: str) -> Any:
+    """Filter on ``mois`` from a month (YYYY-MM) or a whole year (YYYY)"""
+    if re.fullmatch(r"\d{4}", mois):
+        return filtre_annee(int(mois))
+    if re.fullmatch(r"\d{4}-\d{2}", mois):
+        return mois
+    raise HTTPException(status_code=400, detail="Mois invalide (YYYY-MM ou YYYY)")
 
 def arrondir_005(montant: float) -> float:
     """Arrondir au 0.05 supérieur"""
     return math.ceil(montant * 20) / 20
 
+KPI_MATRIX_MAX_MOIS = int(os.environ.get('KPI_MATRIX_MAX_MOIS', '120'))
+PAIEMENTS_BULK_MAX = int(os.environ.get('PAIEMENTS_BULK_MAX', '1000'))
+
+async def matrice_annee(cagnotte_id: str, participants: List[Dict[str, Any]],
+                        maintenant: datetime) -> kpi_matrice.Matrice:
+    """Matrix from the earliest start month to the end of the current year.
+
+    Columns before January are only there for the late-payment check, so
+    arrears from previous years are still reported after New Year.
+    """
+    debut_annee = f"{maintenant.year}-01"
+    return await kpi_matrice.charger(
+        db, cagnotte_id, participants, kpi_matrice.premier_mois(participants, debut_annee), f"{maintenant.year}-12",
+        defaut_debut=debut_annee
+    )
+
 # ============ AUTH ROUTES ============
 
+async def rehash_password(cagnotte_id: str, user_id: str, password: str):
+    """Store the password again with the current bcrypt work factor"""
+    new_hashed = await hash_password(password)
+    await db.participants.update_one({"id": user_id, "cagnotte_id": cagnotte_id}, {"$set": {"password": new_hashed}})
+    principal_cache.evict(cagnotte_id, user_id)
+
 @api_router.post("/auth/login", response_model=LoginResponse)
-async def login(request: LoginRequest):
-    user = await db.participants.find_one({"email": request.email}, {"_id": 0})
+async def login(request: LoginRequest, http_request: Request, background_tasks: BackgroundTasks):
+    cagnotte_id = cagnottes.anonyme(http_request)
+    # Throttled attempts are refused before any database or bcrypt work
+    cle = limitation.limiteur.cle_email(cagnotte_id, request.email)
+    limitation.limiteur.verifier(cle, http_request.client.host if http_request.client else None)
+    
+    user = await db.participants.find_one({"cagnotte_id": cagnotte_id, "email": request.email}, {"_id": 0})
     if not user:
+        limitation.limiteur.echec(cle)
         raise HTTPException(status_code=401, detail="Email ou mot de passe incorrect")
     
     if not user.get('actif', True):
         raise HTTPException(status_code=401, detail="Compte désactivé")
     
-    if not verify_password(request.password, user['password']):
+    async with limitation.limiteur.verification():
+        valide = await verify_password(request.password, user['password'])
+    if not valide:
+        limitation.limiteur.echec(cle)
         raise HTTPException(status_code=401, detail="Email ou mot de passe incorrect")
+    limitation.limiteur.succes(cle)
+    
+    if passwords.needs_rehash(user['password']):
+        background_tasks.add_task(rehash_password, cagnotte_id, user['id'], request.password)
     
     # Check if admin
-    admin_emails_str = os.environ.get('ADMIN_EMAILS', 'eric.savary@lausanne.ch')
-    admin_emails = [e.strip() for e in admin_emails_str.split(',')]
-    is_admin = user['email'] in admin_emails
+    is_admin = est_admin(user)
     
-    token = create_token(user['id'], user['email'])
+    token = create_token(user['id'], user['email'], cagnotte_id)
     user_response = User(**{k: v for k, v in user.items() if k != 'password'})
     
     return LoginResponse(token=token, user=user_response, is_admin=is_admin)
@@ -179,40 +368,52 @@ async def get_me(user: Dict[str, Any] = Depends(get_current_user)):
 
 # ============ CONFIG ROUTES ============
 
-@api_router.get("/config", response_model=List[ConfigItem])
-async def get_config():
-    configs = await db.config.find({}, {"_id": 0}).to_list(100)
-    return configs
+@api_router.get("/config", response_model=List[ConfigItem], dependencies=[Depends(conditionnel(versions.CONFIG))])
+async def get_config(request: Request):
+    return (await config_cache.get(db, cagnottes.anonyme(request))).items
 
 @api_router.put("/config/{key}")
-async def update_config(key: str, value: str, _: Dict[str, Any] = Depends(require_admin)):
+async def update_config(key: str, value: str, user: Dict[str, Any] = Depends(require_admin)):
     await db.config.update_one(
-        {"key": key},
+        {"cagnotte_id": user['cagnotte_id'], "key": key},
         {"$set": {"value": value}},
         upsert=True
     )
+    config_cache.invalidate(user['cagnotte_id'])
+    await versions.bump(db, user['cagnotte_id'], versions.CONFIG)
     return {"success": True}
 
 # ============ PARTICIPANT ROUTES ============
 
-@api_router.get("/participants", response_model=List[User])
-async def get_participants(_: Dict[str, Any] = Depends(require_admin)):
-    participants = await db.participants.find({}, {"_id": 0, "password": 0}).to_list(1000)
-    return participants
+@api_router.get("/participants", response_model=PageParticipants,
+                dependencies=[Depends(conditionnel(versions.PARTICIPANTS, auth=require_admin))])
+async def get_participants(
+    response: Response,
+    limit: int = Query(pagination.LIMIT_DEFAUT, ge=1, le=pagination.LIMIT_MAX),
+    after: Optional[str] = None,
+    actif: Optional[bool] = None,
+    user: Dict[str, Any] = Depends(require_admin)
+):
+    filtre: Dict[str, Any] = {"cagnotte_id": user['cagnotte_id']}
+    if actif is not None:
+        filtre["actif"] = actif
+    page = await pagination.page(db.participants, filtre, ("nom", "id"), PROJECTION_USER, limit, after)
+    return reponse_json(PAGE_PARTICIPANTS_ADAPTER, page, response)
 
 @api_router.post("/participants", response_model=User)
-async def create_participant(participant: UserCreate, _: Dict[str, Any] = Depends(require_admin)):
+async def create_participant(participant: UserCreate, user: Dict[str, Any] = Depends(require_admin)):
     # Check if email exists
-    existing = await db.participants.find_one({"email": participant.email})
+    existing = await db.participants.find_one({"cagnotte_id": user['cagnotte_id'], "email": participant.email})
     if existing:
         raise HTTPException(status_code=400, detail="Cet email existe déjà")
     
     # Generate password if not provided
     password = participant.password or str(uuid.uuid4())[:8]
-    hashed_pw = hash_password(password)
+    hashed_pw = await hash_password(password)
     
     user_data = {
         "id": str(uuid.uuid4()),
+        "cagnotte_id": user['cagnotte_id'],
         "nom": participant.nom,
         "email": participant.email,
         "password": hashed_pw,
@@ -222,25 +423,32 @@ async def create_participant(participant: UserCreate, _: Dict[str, Any] = Depend
     }
     
     await db.participants.insert_one(user_data)
+    await versions.bump(db, user['cagnotte_id'], versions.PARTICIPANTS)
     return User(**{k: v for k, v in user_data.items() if k != 'password'})
 
 @api_router.put("/participants/{participant_id}", response_model=User)
-async def update_participant(participant_id: str, update: UserCreate, _: Dict[str, Any] = Depends(require_admin)):
+async def update_participant(participant_id: str, update: UserCreate, user: Dict[str, Any] = Depends(require_admin)):
     update_data = {"nom": update.nom, "email": update.email, "actif": update.actif, "mois_debut": update.mois_debut}
     
     if update.password:
-        update_data["password"] = hash_password(update.password)
+        update_data["password"] = await hash_password(update.password)
     
-    await db.participants.update_one({"id": participant_id}, {"$set": update_data})
-    updated = await db.participants.find_one({"id": participant_id}, {"_id": 0, "password": 0})
+    updated = await db.participants.find_one_and_update(
+        {"id": participant_id, "cagnotte_id": user['cagnotte_id']},
+        {"$set": update_data},
+        projection={"_id": 0, "password": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated:
+        raise HTTPException(status_code=404, detail="Participant non trouvé")
+    principal_cache.evict(user['cagnotte_id'], participant_id)
+    await versions.bump(db, user['cagnotte_id'], versions.PARTICIPANTS)
     return User(**updated)
 
 @api_router.put("/participants/{participant_id}/password")
 async def change_password(participant_id: str, data: dict, user: Dict[str, Any] = Depends(get_current_user)):
-    # Users can change their own password, or admin can change any password
-    admin_emails_str = os.environ.get('ADMIN_EMAILS', 'eric.savary@lausanne.ch')
-    admin_emails = [e.strip() for e in admin_emails_str.split(',')]
-    is_admin = user['email'] in admin_emails
+    # Users can change their own password, or admin can change any password of the cagnotte
+    is_admin = est_admin(user)
     
     if participant_id != user['id'] and not is_admin:
         raise HTTPException(status_code=403, detail="Vous ne pouvez changer que votre propre mot de passe")
@@ -252,12 +460,19 @@ async def change_password(participant_id: str, data: dict, user: Dict[str, Any]
     if participant_id == user['id'] and not is_admin:
         if not data.get('current_password'):
             raise HTTPException(status_code=400, detail="Mot de passe actuel requis")
-        if not verify_password(data['current_password'], user['password']):
+        async with limitation.limiteur.verification():
+            valide = await verify_password(data['current_password'], user['password'])
+        if not valide:
             raise HTTPException(status_code=400, detail="Mot de passe actuel incorrect")
     
     # Update password
-    new_hashed = hash_password(data['new_password'])
-    await db.participants.update_one({"id": participant_id}, {"$set": {"password": new_hashed}})
+    new_hashed = await hash_password(data['new_password'])
+    result = await db.participants.update_one(
+        {"id": participant_id, "cagnotte_id": user['cagnotte_id']}, {"$set": {"password": new_hashed}}
+    )
+    if not result.matched_count:
+        raise HTTPException(status_code=404, detail="Participant non trouvé")
+    principal_cache.evict(user['cagnotte_id'], participant_id)
     
     return {"success": True, "message": "Mot de passe modifié avec succès"}
 
@@ -268,48 +483,86 @@ async def delete_participant(participant_id: str, user: Dict[str, Any] = Depends
         raise HTTPException(status_code=400, detail="Vous ne pouvez pas vous supprimer vous-même")
     
     # Check if it's the last admin
-    participant = await db.participants.find_one({"id": participant_id}, {"_id": 0})
+    participant = await db.participants.find_one({"id": participant_id, "cagnotte_id": user['cagnotte_id']}, {"_id": 0})
     if not participant:
         raise HTTPException(status_code=404, detail="Participant non trouvé")
     
-    admin_emails_str = os.environ.get('ADMIN_EMAILS', 'eric.savary@lausanne.ch')
-    admin_emails = [e.strip() for e in admin_emails_str.split(',')]
-    
-    if participant['email'] in admin_emails:
-        # Count active admins
-        active_admins = await db.participants.find({"email": {"$in": admin_emails}, "actif": True}).to_list(1000)
-        if len(active_admins) <= 1:
+    if est_admin(participant):
+        # Count active admins of the cagnotte
+        active_admins = await db.participants.count_documents(filtre_admins(user['cagnotte_id']))
+        if active_admins <= 1:
             raise HTTPException(status_code=400, detail="Impossible de supprimer le dernier administrateur")
     
     # Soft delete
-    await db.participants.update_one({"id": participant_id}, {"$set": {"actif": False}})
+    await db.participants.update_one({"id": participant_id, "cagnotte_id": user['cagnotte_id']}, {"$set": {"actif": False}})
+    principal_cache.evict(user['cagnotte_id'], participant_id)
+    await versions.bump(db, user['cagnotte_id'], versions.PARTICIPANTS)
     return {"success": True}
 
 # ============ PAIEMENT ROUTES ============
 
-@api_router.get("/paiements", response_model=List[Paiement])
-async def get_paiements(user: Dict[str, Any] = Depends(get_current_user)):
-    paiements = await db.paiements.find({"participant_id": user['id']}, {"_id": 0}).to_list(1000)
-    return paiements
+async def refuser_si_cloture(cagnotte_id: str, paiement_id: str) -> None:
+    """400 when the paiement exists but belongs to a closed year (archived or being archived)"""
+    filtre = {"id": paiement_id, "cagnotte_id": cagnotte_id}
+    if (await db.paiements.find_one(filtre, {"_id": 1})
+            or await db.paiements_archive.find_one(filtre, {"_id": 1})):
+        raise HTTPException(status_code=400, detail="Ce paiement appartient à une année clôturée")
+
+@api_router.get("/paiements", response_model=List[Paiement],
+                dependencies=[Depends(conditionnel(auth=get_current_user, par_participant=True))])
+async def get_paiements(response: Response, user: Dict[str, Any] = Depends(get_current_user)):
+    paiements = await db.paiements.find(
+        {"cagnotte_id": user['cagnotte_id'], "participant_id": user['id']}, PROJECTION_PAIEMENT
+    ).to_list(1000)
+    return reponse_json(PAIEMENTS_ADAPTER, paiements, response)
 
-@api_router.get("/paiements/all", response_model=List[Paiement])
-async def get_all_paiements(_: Dict[str, Any] = Depends(require_admin)):
-    paiements = await db.paiements.find({}, {"_id": 0}).to_list(10000)
-    return paiements
+@api_router.get("/paiements/all", response_model=PagePaiements,
+                dependencies=[Depends(conditionnel(versions.PAIEMENTS, auth=require_admin))])
+async def get_all_paiements(
+    response: Response,
+    limit: int = Query(pagination.LIMIT_DEFAUT, ge=1, le=pagination.LIMIT_MAX),
+    after: Optional[str] = None,
+    mois: Optional[str] = None,
+    statut: Optional[str] = None,
+    methode: Optional[str] = None,
+    participant_id: Optional[str] = None,
+    user: Dict[str, Any] = Depends(require_admin)
+):
+    filtre: Dict[str, Any] = {"cagnotte_id": user['cagnotte_id']}
+    if mois:
+        filtre["mois"] = filtre_mois(mois)
+    if statut:
+        filtre["statut"] = statut
+    if methode:
+        filtre["methode"] = methode
+    if participant_id:
+        filtre["participant_id"] = participant_id
+    # Paiements of closed years are only in the archive
+    collection = db.paiements
+    if mois and int(mois[:4]) in await clotures.annees_cloturees(db, user['cagnotte_id'], terminees=True):
+        collection = db.paiements_archive
+    page = await pagination.page(collection, filtre, ("mois", "date", "id"), PROJECTION_PAIEMENT, limit, after)
+    return reponse_json(PAGE_PAIEMENTS_ADAPTER, page, response)
 
 @api_router.post("/paiements", response_model=Paiement)
-async def create_paiement(paiement: PaiementCreate, user: Dict[str, Any] = Depends(get_current_user)):
-    # Check for duplicate
-    existing = await db.paiements.find_one({
-        "participant_id": user['id'],
-        "mois": paiement.mois
-    })
-    
-    if existing:
-        raise HTTPException(status_code=400, detail="Un versement existe déjà pour ce mois")
+async def create_paiement(
+    paiement: PaiementCreate,
+    user: Dict[str, Any] = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    cle = None
+    if idempotency_key is not None:
+        cle = idempotence.memoire.cle(user['cagnotte_id'], user['id'], idempotency_key)
+    return await idempotence.memoire.executer(
+        cle, paiement.model_dump_json(), lambda: declarer_paiement(paiement, user)
+    )
+
+async def declarer_paiement(paiement: PaiementCreate, user: Dict[str, Any]) -> Paiement:
+    await clotures.verifier_ouvert(db, user['cagnotte_id'], paiement.mois)
     
-    paiement_data = {
+    paiement_data = marquer_versement({
         "id": str(uuid.uuid4()),
+        "cagnotte_id": user['cagnotte_id'],
         "participant_id": user['id'],
         "mois": paiement.mois,
         "montant": paiement.montant,
@@ -317,36 +570,214 @@ async def create_paiement(paiement: PaiementCreate, user: Dict[str, Any] = Depen
         "raison": paiement.raison,
         "statut": "en_attente",
         "date": datetime.now(timezone.utc).isoformat()
-    }
+    })
     
-    await db.paiements.insert_one(paiement_data)
+    # The unique index on declarations rejects a second one for the month, even concurrent
+    try:
+        await db.paiements.insert_one(paiement_data)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail=DOUBLON_VERSEMENT)
+    # A close may have started since the check. It counts the pending paiements
+    # after writing its marker, so either it sees this one and refuses, or the
+    # marker is seen here and the declaration is withdrawn (archived or not)
+    try:
+        await clotures.verifier_ouvert(db, user['cagnotte_id'], paiement.mois)
+    except HTTPException:
+        await db.paiements.delete_one({"id": paiement_data['id']})
+        await db.paiements_archive.delete_one({"id": paiement_data['id']})
+        raise
+    await rollups.appliquer(db, ajoutes=[paiement_data])
+    await versions.bump_paiements(db, user['cagnotte_id'], [paiement_data])
+    publier_paiements("created", [paiement_data])
     return Paiement(**paiement_data)
 
 @api_router.put("/paiements/{paiement_id}", response_model=Paiement)
-async def update_paiement(paiement_id: str, update: PaiementUpdate, _: Dict[str, Any] = Depends(require_admin)):
-    update_data = {k: v for k, v in update.model_dump().items() if v is not None}
-    
-    await db.paiements.update_one({"id": paiement_id}, {"$set": update_data})
-    updated = await db.paiements.find_one({"id": paiement_id}, {"_id": 0})
+async def update_paiement(paiement_id: str, update: PaiementUpdate, user: Dict[str, Any] = Depends(require_admin)):
+    cagnotte_id = user['cagnotte_id']
+    update_data = marquer_versement({k: v for k, v in update.model_dump().items() if v is not None})
+    filtre = {"id": paiement_id, "cagnotte_id": cagnotte_id,
+              **clotures.filtre_ouvert(await clotures.annees_cloturees(db, cagnotte_id))}
+    
+    if update_data:
+        try:
+            before = await db.paiements.find_one_and_update(
+                filtre,
+                {"$set": update_data},
+                projection={"_id": 0},
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail=DOUBLON_VERSEMENT)
+    else:
+        before = await db.paiements.find_one(filtre, {"_id": 0})
+    if not before:
+        await refuser_si_cloture(cagnotte_id, paiement_id)
+        raise HTTPException(status_code=404, detail="Paiement non trouvé")
+    
+    updated = {**before, **update_data}
+    await rollups.appliquer(db, ajoutes=[updated], retires=[before])
+    await versions.bump_paiements(db, cagnotte_id, [before])
+    publier_paiements("updated", [updated])
     return Paiement(**updated)
 
 @api_router.delete("/paiements/{paiement_id}")
-async def delete_paiement(paiement_id: str, _: Dict[str, Any] = Depends(require_admin)):
-    await db.paiements.delete_one({"id": paiement_id})
+async def delete_paiement(paiement_id: str, user: Dict[str, Any] = Depends(require_admin)):
+    cagnotte_id = user['cagnotte_id']
+    filtre = {"id": paiement_id, "cagnotte_id": cagnotte_id,
+              **clotures.filtre_ouvert(await clotures.annees_cloturees(db, cagnotte_id))}
+    deleted = await db.paiements.find_one_and_delete(filtre, projection={"_id": 0})
+    if deleted:
+        await rollups.appliquer(db, retires=[deleted])
+        await versions.bump_paiements(db, cagnotte_id, [deleted])
+        publier_paiements("deleted", [deleted])
+    else:
+        await refuser_si_cloture(cagnotte_id, paiement_id)
     return {"success": True}
 
 @api_router.post("/paiements/confirm-month")
-async def confirm_month_paiements(mois: str, _: Dict[str, Any] = Depends(require_admin)):
+async def confirm_month_paiements(mois: str, user: Dict[str, Any] = Depends(require_admin)):
+    cagnotte_id = user['cagnotte_id']
+    await clotures.verifier_ouvert(db, cagnotte_id, valider_mois(mois))
+    en_attente = await db.paiements.find(
+        {"cagnotte_id": cagnotte_id, "mois": mois, "statut": "en_attente"},
+        {"_id": 0, "id": 1, "cagnotte_id": 1, "participant_id": 1, "mois": 1, "montant": 1, "statut": 1}
+    ).to_list(None)
     result = await db.paiements.update_many(
-        {"mois": mois, "statut": "en_attente"},
+        {"id": {"$in": [p['id'] for p in en_attente]}, "statut": "en_attente"},
         {"$set": {"statut": "confirme"}}
     )
+    
+    if result.modified_count == len(en_attente):
+        confirmes = [{**p, "statut": "confirme"} for p in en_attente]
+        await rollups.appliquer(db, ajoutes=confirmes, retires=en_attente)
+    else:
+        # Some paiements changed concurrently: recompute the month instead
+        await rollups.recalculer(db, cagnotte_id, mois)
+    await versions.bump_paiements(db, cagnotte_id, en_attente)
+    publier_paiements("confirmed", [{**p, "statut": "confirme"} for p in en_attente])
     return {"success": True, "modified": result.modified_count}
 
+@api_router.post("/paiements/bulk")
+async def bulk_paiements(bulk: BulkPaiementsRequest, user: Dict[str, Any] = Depends(require_admin)):
+    """Confirm, update or delete many paiements in one bulk_write; one result per operation"""
+    cagnotte_id = user['cagnotte_id']
+    if not bulk.operations:
+        raise HTTPException(status_code=400, detail="Aucune opération")
+    if len(bulk.operations) > PAIEMENTS_BULK_MAX:
+        raise HTTPException(status_code=400, detail=f"Au plus {PAIEMENTS_BULK_MAX} opérations par requête")
+    
+    ids = list(dict.fromkeys(op.id for op in bulk.operations))
+    filtre_ouvert = clotures.filtre_ouvert(await clotures.annees_cloturees(db, cagnotte_id))
+    avant = {
+        p['id']: p
+        async for p in db.paiements.find({"cagnotte_id": cagnotte_id, "id": {"$in": ids}, **filtre_ouvert}, {"_id": 0})
+    }
+    manquants = [i for i in ids if i not in avant]
+    clotures_ids = set()
+    if manquants:
+        # Same distinction as refuser_si_cloture: closed year (archived or being archived) or unknown
+        filtre = {"cagnotte_id": cagnotte_id, "id": {"$in": manquants}}
+        clotures_ids.update(await db.paiements.distinct("id", filtre))
+        clotures_ids.update(await db.paiements_archive.distinct("id", filtre))
+    
+    resultats: List[Dict[str, Any]] = []
+    operations, cibles = [], []
+    retires, ajoutes, publies = [], [], {"confirmed": [], "updated": [], "deleted": []}
+    vus = set()
+    for op in bulk.operations:
+        resultat: Dict[str, Any] = {"id": op.id, "action": op.action}
+        resultats.append(resultat)
+        before = avant.get(op.id)
+        erreur = None
+        if op.id in vus:
+            erreur = "Opération en double pour ce paiement"
+        elif op.action not in ("confirm", "update", "delete"):
+            erreur = "Action inconnue (confirm, update ou delete)"
+        elif op.id in clotures_ids:
+            erreur = "Ce paiement appartient à une année clôturée"
+        elif before is None:
+            erreur = "Paiement non trouvé"
+        if erreur:
+            resultat.update(statut="erreur", detail=erreur)
+            continue
+        vus.add(op.id)
+        
+        # The rollups are adjusted from ``before``: only write if it is still current
+        filtre = {"id": op.id, "cagnotte_id": cagnotte_id, "statut": before['statut'], "montant": before['montant']}
+        if op.action == "delete":
+            operations.append(DeleteOne(filtre))
+            cibles.append(op.id)
+            retires.append(before)
+            publies["deleted"].append(before)
+            resultat["statut"] = "ok"
+            continue
+        if op.action == "confirm":
+            update_data = {"statut": "confirme"}
+        else:
+            update_data = marquer_versement(
+                {k: v for k, v in (op.champs.model_dump() if op.champs else {}).items() if v is not None}
+            )
+            if not update_data:
+                resultat.update(statut="erreur", detail="Aucun champ à modifier")
+                continue
+        updated = {**before, **update_data}
+        operations.append(UpdateOne(filtre, {"$set": update_data}))
+        cibles.append(op.id)
+        retires.append(before)
+        ajoutes.append(updated)
+        publies["confirmed" if op.action == "confirm" else "updated"].append(updated)
+        resultat.update(statut="ok", paiement=Paiement(**updated).model_dump())
+    
+    if operations:
+        try:
+            ecrits = (await db.paiements.bulk_write(operations, ordered=False)).bulk_api_result
+        except BulkWriteError as e:
+            # Only a methode changed from DEPENSE can fail: the participant already declared the month
+            if any(erreur['code'] != 11000 for erreur in e.details['writeErrors']):
+                raise
+            ecrits = e.details
+        doublons = {cibles[erreur['index']] for erreur in ecrits['writeErrors']}
+        for resultat in resultats:
+            if resultat['id'] in doublons and resultat['statut'] == "ok":
+                resultat.pop('paiement', None)
+                resultat.update(statut="erreur", detail=DOUBLON_VERSEMENT)
+        if not doublons and ecrits['nMatched'] + ecrits['nRemoved'] == len(operations):
+            await rollups.appliquer(db, ajoutes=ajoutes, retires=retires)
+        else:
+            # Some paiements changed concurrently: their operation was skipped, recompute their months
+            concurrents = {
+                p['id']: p
+                async for p in db.paiements.find({"cagnotte_id": cagnotte_id, "id": {"$in": list(vus)}}, {"_id": 0})
+            }
+            attendus = {p['id']: p for p in ajoutes}
+            for resultat in resultats:
+                if resultat['statut'] != "ok":
+                    continue
+                actuel = concurrents.get(resultat['id'])
+                if resultat['action'] == "delete" and actuel is None:
+                    continue
+                attendu = attendus.get(resultat['id'])
+                if attendu and actuel and all(actuel.get(k) == v for k, v in attendu.items()):
+                    continue
+                resultat.pop('paiement', None)
+                resultat.update(statut="erreur", detail="Paiement modifié entre-temps, réessayez")
+            for mois in sorted({p['mois'] for p in retires}):
+                await rollups.recalculer(db, cagnotte_id, mois)
+        await versions.bump_paiements(db, cagnotte_id, retires)
+        reussis = {r['id'] for r in resultats if r['statut'] == "ok"}
+        for action, paiements in publies.items():
+            paiements = [p for p in paiements if p['id'] in reussis]
+            if paiements:
+                publier_paiements(action, paiements)
+    
+    erreurs = sum(1 for r in resultats if r['statut'] != "ok")
+    return {"success": erreurs == 0, "total": len(resultats), "erreurs": erreurs, "resultats": resultats}
+
 # ============ DEPENSE ROUTES ============
 
 @api_router.post("/depenses")
-async def create_depense(depense: DepenseRequest, _: Dict[str, Any] = Depends(require_admin)):
+async def create_depense(depense: DepenseRequest, user: Dict[str, Any] = Depends(require_admin)):
+    cagnotte_id = user['cagnotte_id']
     if not depense.raison or not depense.raison.strip():
         raise HTTPException(status_code=400, detail="La raison est obligatoire")
     
@@ -354,6 +785,11 @@ async def create_depense(depense: DepenseRequest, _: Dict[str, Any] = Depends(re
     if nb_participants == 0:
         raise HTTPException(status_code=400, detail="Sélectionnez au moins un participant")
     
+    # Only participants of this cagnotte
+    connus = await db.participants.count_documents({"cagnotte_id": cagnotte_id, "id": {"$in": depense.participants}})
+    if connus != len(set(depense.participants)):
+        raise HTTPException(status_code=400, detail="Participant inconnu dans cette cagnotte")
+    
     # Calculate individual shares
     if depense.repartition == "egale":
         montant_par_personne = arrondir_005(depense.montant_total / nb_participants)
@@ -378,43 +814,58 @@ async def create_depense(depense: DepenseRequest, _: Dict[str, Any] = Depends(re
         
         paiement_data = {
             "id": str(uuid.uuid4()),
+            "cagnotte_id": cagnotte_id,
             "participant_id": participant_id,
             "mois": mois_actuel,
             "montant": montant,
             "methode": "DEPENSE",
+            "versement": False,
             "raison": depense.raison,
             "statut": "confirme",
             "date": datetime.now(timezone.utc).isoformat()
         }
         
-        await db.paiements.insert_one(paiement_data)
         created_paiements.append(paiement_data)
     
+    await db.paiements.insert_many(created_paiements)
+    await rollups.appliquer(db, ajoutes=created_paiements)
+    await versions.bump_paiements(db, cagnotte_id, created_paiements)
+    publier_paiements("created", created_paiements)
+    
     return {"success": True, "paiements_created": len(created_paiements)}
 
 # ============ KPI ROUTES ============
 
-@api_router.get("/kpi/participant", response_model=KPIResponse)
-async def get_participant_kpi(user: Dict[str, Any] = Depends(get_current_user)):
+@api_router.get("/kpi/participant", response_model=KPIResponse,
+                dependencies=[Depends(conditionnel(versions.CONFIG, versions.CLOTURES, auth=get_current_user, par_participant=True))])
+async def get_participant_kpi(annee: Optional[int] = None, user: Dict[str, Any] = Depends(get_current_user)):
+    annee_actuelle = datetime.now(timezone.utc).year
+    if annee is not None and annee != annee_actuelle:
+        # Closed year: from its snapshot
+        lignes = await clotures.figures_participants(db, user['cagnotte_id'], annee, user['id'])
+        return KPIResponse(
+            total_confirme_annee=sum(ligne['confirme'] for ligne in lignes),
+            en_attente_annee=sum(ligne['en_attente'] for ligne in lignes),
+            reste_mois=0
+        )
+    
     # Get config for montant mensuel
-    config_montant = await db.config.find_one({"key": "montant_mensuel"})
-    montant_mensuel = float(config_montant['value']) if config_montant else 50.0
+    montant_mensuel = (await config_cache.get(db, user['cagnotte_id'])).montant_mensuel
     
-    annee_actuelle = datetime.now(timezone.utc).year
     mois_actuel = datetime.now(timezone.utc).strftime("%Y-%m")
     
-    # Get all paiements for current year
-    paiements = await db.paiements.find({
+    # Monthly rollups for current year (at most 12 documents)
+    rollups_annee = await db.paiement_rollups.find({
+        "cagnotte_id": user['cagnotte_id'],
         "participant_id": user['id'],
-        "mois": {"$regex": f"^{annee_actuelle}"}
-    }, {"_id": 0}).to_list(1000)
+        "mois": filtre_annee(annee_actuelle)
+    }, {"_id": 0}).to_list(12)
     
-    total_confirme_annee = sum(p['montant'] for p in paiements if p['statut'] == 'confirme')
-    en_attente_annee = sum(p['montant'] for p in paiements if p['statut'] == 'en_attente')
+    total_confirme_annee = sum(r.get('montants', {}).get('confirme', 0) for r in rollups_annee)
+    en_attente_annee = sum(r.get('montants', {}).get('en_attente', 0) for r in rollups_annee)
     
     # Calculate reste mois
-    paiements_mois = [p for p in paiements if p['mois'] == mois_actuel and p['statut'] == 'confirme']
-    total_mois = sum(p['montant'] for p in paiements_mois)
+    total_mois = sum(r.get('montants', {}).get('confirme', 0) for r in rollups_annee if r['mois'] == mois_actuel)
     reste_mois = max(0, montant_mensuel - total_mois)
     
     return KPIResponse(
@@ -423,130 +874,97 @@ async def get_participant_kpi(user: Dict[str, Any] = Depends(get_current_user)):
         reste_mois=reste_mois
     )
 
-@api_router.get("/kpi/admin", response_model=List[KPIParticipant])
-async def get_admin_kpi(_: Dict[str, Any] = Depends(require_admin)):
-    # Get config
-    config_montant = await db.config.find_one({"key": "montant_mensuel"})
-    montant_mensuel = float(config_montant['value']) if config_montant else 50.0
-    
-    annee_actuelle = datetime.now(timezone.utc).year
-    mois_actuel_num = datetime.now(timezone.utc).month
-    
-    participants = await db.participants.find({"actif": True}, {"_id": 0, "password": 0}).to_list(1000)
-    kpis = []
+@api_router.get("/kpi/admin", response_model=List[KPIParticipant],
+                dependencies=[Depends(conditionnel(versions.PAIEMENTS, versions.PARTICIPANTS, versions.CONFIG, versions.CLOTURES, auth=require_admin))])
+async def get_admin_kpi(annee: Optional[int] = None, user: Dict[str, Any] = Depends(require_admin)):
+    cagnotte_id = user['cagnotte_id']
+    maintenant = datetime.now(timezone.utc)
+    if annee is not None and annee != maintenant.year:
+        # Closed year: one snapshot row per participant, no rollup read
+        return [
+            KPIParticipant(
+                participant_id=ligne['participant_id'],
+                nom=ligne['nom'],
+                confirme_annee=ligne['confirme'],
+                en_attente=ligne['en_attente'],
+                manquant=ligne['manquant'],
+                progression=ligne['progression'],
+                en_retard=ligne['mois_en_retard'] > 0
+            )
+            for ligne in await clotures.figures_participants(db, cagnotte_id, annee)
+        ]
     
-    for participant in participants:
-        paiements = await db.paiements.find({
-            "participant_id": participant['id'],
-            "mois": {"$regex": f"^{annee_actuelle}"}
-        }, {"_id": 0}).to_list(1000)
-        
-        confirme_annee = sum(p['montant'] for p in paiements if p['statut'] == 'confirme')
-        en_attente = sum(p['montant'] for p in paiements if p['statut'] == 'en_attente')
-        
-        # Get participant start month
-        mois_debut = participant.get('mois_debut', f"{annee_actuelle}-01")
-        mois_debut_year, mois_debut_month = map(int, mois_debut.split('-'))
-        
-        # Calculate expected amount from start month to current month
-        if mois_debut_year == annee_actuelle:
-            start_month = mois_debut_month
-        elif mois_debut_year < annee_actuelle:
-            start_month = 1
-        else:
-            start_month = mois_actuel_num + 1  # Start in future, no expectation yet
-        
-        nb_mois_attendus = max(0, mois_actuel_num - start_month + 1)
-        attendu = montant_mensuel * nb_mois_attendus
-        manquant = max(0, attendu - confirme_annee)
-        progression = (confirme_annee / attendu * 100) if attendu > 0 else 0
-        
-        # Check for retard (any past month after start without confirmation)
-        en_retard = False
-        for mois_num in range(start_month, mois_actuel_num):
-            mois_str = f"{annee_actuelle}-{mois_num:02d}"
-            paiement_mois = next((p for p in paiements if p['mois'] == mois_str), None)
-            if not paiement_mois or paiement_mois['statut'] != 'confirme':
-                en_retard = True
-                break
-        
-        kpis.append(KPIParticipant(
+    # Get config
+    montant_mensuel = (await config_cache.get(db, cagnotte_id)).montant_mensuel
+    
+    debut_annee = f"{maintenant.year}-01"
+    mois_actuel = maintenant.strftime("%Y-%m")
+    
+    participants = await db.participants.find(
+        {"cagnotte_id": cagnotte_id, "actif": True}, {"_id": 0, "password": 0}
+    ).to_list(1000)
+    matrice = await matrice_annee(cagnotte_id, participants, maintenant)
+    
+    confirme_annee = matrice.total_confirme(debut_annee)
+    en_attente = matrice.total_en_attente(debut_annee)
+    # Expected amount from start month (at the earliest January) to current month
+    attendu = matrice.nb_mois_attendus(debut_annee, mois_actuel) * montant_mensuel
+    manquant = np.maximum(0, attendu - confirme_annee)
+    progression = np.divide(confirme_annee * 100, attendu, out=np.zeros_like(attendu, dtype=float), where=attendu > 0)
+    # Any past month since start without confirmation, previous years included
+    en_retard = matrice.en_retard(mois_actuel)
+    
+    return [
+        KPIParticipant(
             participant_id=participant['id'],
             nom=participant['nom'],
-            confirme_annee=confirme_annee,
-            en_attente=en_attente,
-            manquant=manquant,
-            progression=progression,
-            en_retard=en_retard
-        ))
-    
-    return kpis
+            confirme_annee=colonnes[0],
+            en_attente=colonnes[1],
+            manquant=colonnes[2],
+            progression=colonnes[3],
+            en_retard=colonnes[4]
+        )
+        for participant, *colonnes in zip(participants, confirme_annee.tolist(), en_attente.tolist(),
+                                          manquant.tolist(), progression.tolist(), en_retard.tolist())
+    ]
 
-@api_router.get("/kpi/dashboard")
-async def get_dashboard_stats(_: Dict[str, Any] = Depends(require_admin)):
+@api_router.get("/kpi/dashboard",
+                dependencies=[Depends(conditionnel(versions.PAIEMENTS, versions.PARTICIPANTS, auth=require_admin))])
+async def get_dashboard_stats(user: Dict[str, Any] = Depends(require_admin)):
     """Get advanced dashboard statistics"""
-    config_montant = await db.config.find_one({"key": "montant_mensuel"})
-    montant_mensuel = float(config_montant['value']) if config_montant else 50.0
-    
-    annee_actuelle = datetime.now(timezone.utc).year
-    participants = await db.participants.find({"actif": True}, {"_id": 0}).to_list(1000)
-    
-    # Monthly evolution (last 12 months)
-    monthly_data = []
-    from datetime import timedelta
-    
+    cagnotte_id = user['cagnotte_id']
+    maintenant = datetime.now(timezone.utc)
+    annee_actuelle = maintenant.year
+    mois_actuel_num = maintenant.month
+    participants = await db.participants.find({"cagnotte_id": cagnotte_id, "actif": True}, {"_id": 0}).to_list(1000)
+    
+    # Monthly evolution (last 12 months), summed by a single grouped query
+    derniers_mois = []
     for i in range(11, -1, -1):
-        current_date = datetime.now(timezone.utc)
-        # Go back i months
-        target_month = current_date.month - i
-        target_year = current_date.year
-        
+        target_month = mois_actuel_num - i
+        target_year = annee_actuelle
         while target_month <= 0:
             target_month += 12
             target_year -= 1
-        
-        mois_str = f"{target_year}-{target_month:02d}"
-        
-        paiements_mois = await db.paiements.find({
-            "mois": mois_str,
-            "statut": "confirme"
-        }, {"_id": 0}).to_list(1000)
-        
-        total = sum(p['montant'] for p in paiements_mois)
-        monthly_data.append({
-            "month": mois_str,
-            "total": total
-        })
+        derniers_mois.append(f"{target_year}-{target_month:02d}")
     
-    # Calculate stats
-    all_paiements = await db.paiements.find({"mois": {"$regex": f"^{annee_actuelle}"}}, {"_id": 0}).to_list(10000)
+    totaux_mois = {}
+    async for row in db.paiement_rollups.aggregate([
+        {"$match": {"cagnotte_id": cagnotte_id, "mois": {"$in": derniers_mois}}},
+        {"$group": {"_id": "$mois", "total": {"$sum": "$montants.confirme"}}}
+    ]):
+        totaux_mois[row['_id']] = row['total']
+    monthly_data = [{"month": mois_str, "total": totaux_mois.get(mois_str, 0)} for mois_str in derniers_mois]
     
-    total_participants = len(participants)
-    on_time_count = 0
+    matrice = await matrice_annee(cagnotte_id, participants, maintenant)
     
-    for participant in participants:
-        participant_paiements = [p for p in all_paiements if p['participant_id'] == participant['id']]
-        mois_debut = participant.get('mois_debut', f"{annee_actuelle}-01")
-        mois_debut_year, mois_debut_month = map(int, mois_debut.split('-'))
-        
-        start_month = mois_debut_month if mois_debut_year == annee_actuelle else 1
-        mois_actuel_num = datetime.now(timezone.utc).month
-        
-        is_on_time = True
-        for mois_num in range(start_month, mois_actuel_num):
-            mois_str = f"{annee_actuelle}-{mois_num:02d}"
-            paiement_mois = next((p for p in participant_paiements if p['mois'] == mois_str), None)
-            if not paiement_mois or paiement_mois['statut'] != 'confirme':
-                is_on_time = False
-                break
-        
-        if is_on_time:
-            on_time_count += 1
+    total_participants = len(participants)
+    on_time_count = int((~matrice.en_retard(maintenant.strftime("%Y-%m"))).sum())
     
     ponctuality_rate = (on_time_count / total_participants * 100) if total_participants > 0 else 0
     
-    confirmes = [p for p in all_paiements if p['statut'] == 'confirme']
-    moyenne_par_participant = sum(p['montant'] for p in confirmes) / total_participants if total_participants > 0 else 0
+    total_confirme = float(matrice.total_confirme(f"{annee_actuelle}-01").sum())
+    moyenne_par_participant = total_confirme / total_participants if total_participants > 0 else 0
     
     return {
         "monthly_evolution": monthly_data,
@@ -556,162 +974,286 @@ async def get_dashboard_stats(_: Dict[str, Any] = Depends(require_admin)):
         "on_time_count": on_time_count
     }
 
+@api_router.get("/kpi/matrix",
+                dependencies=[Depends(conditionnel(versions.PAIEMENTS, versions.PARTICIPANTS, versions.CONFIG, auth=require_admin))])
+async def get_kpi_matrix(
+    debut: Optional[str] = Query(None, alias="from", description="Premier mois (YYYY-MM), janvier de l'année en cours par défaut"),
+    fin: Optional[str] = Query(None, alias="to", description="Dernier mois (YYYY-MM), mois en cours par défaut"),
+    actif: Optional[bool] = True,
+    user: Dict[str, Any] = Depends(require_admin)
+):
+    """Participant × month statuts and amounts over any range of months"""
+    cagnotte_id = user['cagnotte_id']
+    maintenant = datetime.now(timezone.utc)
+    mois_actuel = maintenant.strftime("%Y-%m")
+    debut = valider_mois(debut or f"{maintenant.year}-01")
+    fin = valider_mois(fin or mois_actuel)
+    nb_mois = kpi_matrice.index_mois(fin) - kpi_matrice.index_mois(debut) + 1
+    if nb_mois < 1:
+        raise HTTPException(status_code=400, detail="La période est vide (from > to)")
+    if nb_mois > KPI_MATRIX_MAX_MOIS:
+        raise HTTPException(status_code=400, detail=f"Période limitée à {KPI_MATRIX_MAX_MOIS} mois")
+    
+    montant_mensuel = (await config_cache.get(db, cagnotte_id)).montant_mensuel
+    filtre: Dict[str, Any] = {"cagnotte_id": cagnotte_id}
+    if actif is not None:
+        filtre["actif"] = actif
+    participants = await db.participants.find(filtre, {"_id": 0, "id": 1, "nom": 1, "mois_debut": 1}).sort([("nom", 1), ("id", 1)]).to_list(None)
+    matrice = await kpi_matrice.charger(db, cagnotte_id, participants, debut, fin)
+    
+    # Months after the current one are not due yet
+    attendu = matrice.nb_mois_attendus(fin=mois_actuel) * montant_mensuel
+    paye = matrice.total_confirme()
+    manquant = np.maximum(0, attendu - paye)
+    mois_en_retard = matrice.retards(mois_actuel)
+    
+    return {
+        "mois": matrice.mois,
+        "legende": kpi_matrice.LEGENDE,
+        "participants": [
+            {
+                "id": p['id'],
+                "nom": p['nom'],
+                "mois_debut": p.get('mois_debut'),
+                "attendu": float(attendu[i]),
+                "paye": float(paye[i]),
+                "en_attente": float(en_attente),
+                "manquant": float(manquant[i]),
+                "mois_en_retard": int(mois_en_retard[i])
+            }
+            for i, (p, en_attente) in enumerate(zip(participants, matrice.total_en_attente()))
+        ],
+        "statuts": matrice.codes(mois_actuel).tolist(),
+        "montants": matrice.confirme.tolist()
+    }
+
 # ============ EXPORT ROUTES ============
 
+EXPORT_PROJECTION = {"_id": 0, "participant_id": 1, "mois": 1, "montant": 1, "methode": 1, "statut": 1, "date": 1, "raison": 1}
+
+async def source_export(cagnotte_id: str, annee: Optional[int]) -> Tuple[Any, Dict[str, Any]]:
+    """Collection and filter for the paiements of ``annee``; without a year, the open years"""
+    if annee is None:
+        return db.paiements, {"cagnotte_id": cagnotte_id}
+    cloturees = await clotures.annees_cloturees(db, cagnotte_id, terminees=True)
+    collection = db.paiements_archive if annee in cloturees else db.paiements
+    return collection, {"cagnotte_id": cagnotte_id, "mois": filtre_annee(annee)}
+
 @api_router.get("/export/csv/{participant_id}")
-async def export_csv_participant(participant_id: str, user: Dict[str, Any] = Depends(get_current_user)):
+async def export_csv_participant(participant_id: str, request: Request, annee: Optional[int] = None,
+                                 user: Dict[str, Any] = Depends(get_current_user)):
     # Check access
-    admin_emails_str = os.environ.get('ADMIN_EMAILS', 'eric.savary@lausanne.ch')
-    admin_emails = [e.strip() for e in admin_emails_str.split(',')]
-    is_admin = user['email'] in admin_emails
+    is_admin = est_admin(user)
     
     if not is_admin and user['id'] != participant_id:
         raise HTTPException(status_code=403, detail="Accès refusé")
     
-    paiements = await db.paiements.find({"participant_id": participant_id}, {"_id": 0}).to_list(10000)
+    collection, filtre = await source_export(user['cagnotte_id'], annee)
+    cursor = collection.find({"participant_id": participant_id, **filtre}, EXPORT_PROJECTION).sort([("mois", 1), ("date", 1)])
     
-    # Generate CSV
-    csv_lines = ["Mois,Montant,Méthode,Statut,Date,Raison"]
-    for p in paiements:
-        raison = p.get('raison', '').replace(',', ';') if p.get('raison') else ''
-        csv_lines.append(f"{p['mois']},{p['montant']},{p['methode']},{p['statut']},{p['date']},{raison}")
+    async def lignes():
+        async for p in cursor:
+            yield [p['mois'], p['montant'], p['methode'], p['statut'], p['date'], p.get('raison')]
     
-    return {"csv": "\n".join(csv_lines)}
+    return csv_response(request, ["Mois", "Montant", "Méthode", "Statut", "Date", "Raison"], lignes(),
+                        filename=f"paiements_{participant_id}_{annee}.csv" if annee else f"paiements_{participant_id}.csv")
 
 @api_router.get("/export/csv-all")
-async def export_csv_all(_: Dict[str, Any] = Depends(require_admin)):
+async def export_csv_all(request: Request, annee: Optional[int] = None, user: Dict[str, Any] = Depends(require_admin)):
     # Get all participants
     participants_dict = {}
-    participants = await db.participants.find({}, {"_id": 0}).to_list(1000)
-    for p in participants:
+    async for p in db.participants.find({"cagnotte_id": user['cagnotte_id']}, {"_id": 0, "id": 1, "nom": 1}):
         participants_dict[p['id']] = p['nom']
     
-    # Get all paiements
-    paiements = await db.paiements.find({}, {"_id": 0}).to_list(10000)
+    # Paiements sorted by the server, streamed row by row
+    collection, filtre = await source_export(user['cagnotte_id'], annee)
+    cursor = collection.find(filtre, EXPORT_PROJECTION).sort([("mois", 1), ("date", 1)])
     
-    # Sort by date
-    paiements_sorted = sorted(paiements, key=lambda x: (x['mois'], x['date']))
+    async def lignes():
+        async for p in cursor:
+            participant_nom = participants_dict.get(p['participant_id'], 'Inconnu')
+            yield [participant_nom, p['mois'], p['montant'], p['methode'], p['statut'], p['date'], p.get('raison')]
     
-    # Generate CSV
-    csv_lines = ["Participant,Mois,Montant,Méthode,Statut,Date,Raison"]
-    for p in paiements_sorted:
-        participant_nom = participants_dict.get(p['participant_id'], 'Inconnu')
-        raison = p.get('raison', '').replace(',', ';') if p.get('raison') else ''
-        csv_lines.append(f"{participant_nom},{p['mois']},{p['montant']},{p['methode']},{p['statut']},{p['date']},{raison}")
-    
-    return {"csv": "\n".join(csv_lines)}
+    return csv_response(request, ["Participant", "Mois", "Montant", "Méthode", "Statut", "Date", "Raison"], lignes(),
+                        filename=f"tous_paiements_{annee}.csv" if annee else "tous_paiements.csv")
 
 # ============ NOTIFICATION ROUTES ============
 
+async def destinataires_rappel(cagnotte_id: str, mois: str) -> List[Dict[str, Any]]:
+    """Active participants started on or before ``mois`` with no paiement for it (two queries)"""
+    deja_payes = await db.paiements.distinct("participant_id", {"cagnotte_id": cagnotte_id, "mois": mois})
+    return await db.participants.find({
+        "cagnotte_id": cagnotte_id,
+        "actif": True,
+        "id": {"$nin": deja_payes},
+        "$or": [{"mois_debut": {"$lte": mois}}, {"mois_debut": None}]
+    }, {"_id": 0, "id": 1, "nom": 1, "email": 1}).to_list(None)
+
+def valider_mois(mois: Optional[str]) -> str:
+    """The given YYYY-MM month, or the current month"""
+    if mois is None:
+        return datetime.now(timezone.utc).strftime("%Y-%m")
+    if not re.fullmatch(r"\d{4}-\d{2}", mois):
+        raise HTTPException(status_code=400, detail="Mois invalide (YYYY-MM)")
+    return mois
+
+@api_router.get("/notifications/reminders-preview")
+async def preview_reminders(mois: Optional[str] = None, user: Dict[str, Any] = Depends(require_admin)):
+    """List who would receive a payment reminder, without sending anything"""
+    mois = valider_mois(mois)
+    destinataires = await destinataires_rappel(user['cagnotte_id'], mois)
+    return {"mois": mois, "total": len(destinataires), "destinataires": destinataires}
+
 @api_router.post("/notifications/send-reminders")
-async def send_reminders(_: Dict[str, Any] = Depends(require_admin)):
+async def send_reminders(mois: Optional[str] = None, user: Dict[str, Any] = Depends(require_admin)):
     """Send payment reminders to participants with missing payments"""
     # Get config
-    config_montant = await db.config.find_one({"key": "montant_mensuel"})
-    montant_mensuel = float(config_montant['value']) if config_montant else 50.0
-    config_devise = await db.config.find_one({"key": "devise"})
-    devise = config_devise['value'] if config_devise else 'CHF'
-    
-    mois_actuel = datetime.now(timezone.utc).strftime("%Y-%m")
-    participants = await db.participants.find({"actif": True}, {"_id": 0}).to_list(1000)
-    
-    sent_count = 0
-    errors = []
-    
-    for participant in participants:
-        # Check if payment exists for current month
-        paiement = await db.paiements.find_one({
-            "participant_id": participant['id'],
-            "mois": mois_actuel
-        })
-        
-        # Check if participant should have paid (mois_debut check)
-        mois_debut = participant.get('mois_debut', '2000-01')
-        if mois_debut > mois_actuel:
-            continue  # Not started yet
-        
-        if not paiement:
-            # Send reminder
-            success = send_payment_reminder(
-                participant['nom'],
-                participant['email'],
-                mois_actuel,
-                montant_mensuel,
-                devise
-            )
-            if success:
-                sent_count += 1
-            else:
-                errors.append(participant['email'])
+    config = await config_cache.get(db, user['cagnotte_id'])
+    montant_mensuel = config.montant_mensuel
+    devise = config.devise
+    
+    mois_actuel = valider_mois(mois)
+    destinataires = await destinataires_rappel(user['cagnotte_id'], mois_actuel)
+    
+    # Reminders are sent by the background job worker
+    job = await jobs.enqueue(db, user['cagnotte_id'], "rappels", [
+        {"email": p['email'], "params": {
+            "participant_name": p['nom'],
+            "participant_email": p['email'],
+            "mois": mois_actuel,
+            "montant": montant_mensuel,
+            "devise": devise
+        }}
+        for p in destinataires
+    ], cree_par=user['id'])
+    job_worker.notify()
     
     return {
         "success": True,
-        "sent": sent_count,
-        "errors": errors
+        "job_id": job['id'],
+        "total": len(destinataires)
     }
 
 @api_router.post("/notifications/send-admin-summary")
 async def send_admin_summary(user: Dict[str, Any] = Depends(require_admin)):
     """Send monthly summary to admin"""
     # Get all KPIs
-    config_montant = await db.config.find_one({"key": "montant_mensuel"})
-    montant_mensuel = float(config_montant['value']) if config_montant else 50.0
-    
-    annee_actuelle = datetime.now(timezone.utc).year
-    mois_actuel_num = datetime.now(timezone.utc).month
-    
-    participants = await db.participants.find({"actif": True}, {"_id": 0}).to_list(1000)
-    
-    total_confirme = 0
-    total_en_attente = 0
-    nb_retards = 0
-    details_html = ""
+    maintenant = datetime.now(timezone.utc)
+    debut_annee = f"{maintenant.year}-01"
     
-    for participant in participants:
-        paiements = await db.paiements.find({
-            "participant_id": participant['id'],
-            "mois": {"$regex": f"^{annee_actuelle}"}
-        }, {"_id": 0}).to_list(1000)
-        
-        confirme = sum(p['montant'] for p in paiements if p['statut'] == 'confirme')
-        en_attente = sum(p['montant'] for p in paiements if p['statut'] == 'en_attente')
-        
-        total_confirme += confirme
-        total_en_attente += en_attente
-        
-        # Check retard
-        mois_debut = participant.get('mois_debut', f"{annee_actuelle}-01")
-        mois_debut_year, mois_debut_month = map(int, mois_debut.split('-'))
-        start_month = mois_debut_month if mois_debut_year == annee_actuelle else 1
-        
-        en_retard = False
-        for mois_num in range(start_month, mois_actuel_num):
-            mois_str = f"{annee_actuelle}-{mois_num:02d}"
-            paiement_mois = next((p for p in paiements if p['mois'] == mois_str), None)
-            if not paiement_mois or paiement_mois['statut'] != 'confirme':
-                en_retard = True
-                break
-        
-        if en_retard:
-            nb_retards += 1
-        
-        statut_badge = "✅ À jour" if not en_retard else "⚠️ En retard"
-        details_html += f"<tr><td>{participant['nom']}</td><td>{statut_badge}</td></tr>"
+    participants = await db.participants.find({"cagnotte_id": user['cagnotte_id'], "actif": True}, {"_id": 0}).to_list(1000)
+    matrice = await matrice_annee(user['cagnotte_id'], participants, maintenant)
+    en_retard = matrice.en_retard(maintenant.strftime("%Y-%m"))
     
     stats = {
-        'total_confirme': total_confirme,
-        'total_en_attente': total_en_attente,
-        'nb_retards': nb_retards,
-        'details_html': details_html
+        'total_confirme': float(matrice.total_confirme(debut_annee).sum()),
+        'total_en_attente': float(matrice.total_en_attente(debut_annee).sum()),
+        'nb_retards': int(en_retard.sum()),
+        'details': [
+            {'nom': participant['nom'], 'en_retard': retard}
+            for participant, retard in zip(participants, en_retard.tolist())
+        ]
     }
     
-    success = send_admin_monthly_summary(user['email'], stats)
+    job = await jobs.enqueue(db, user['cagnotte_id'], "resume_admin", [
+        {"email": user['email'], "params": {"admin_email": user['email'], "stats": stats}}
+    ], cree_par=user['id'])
+    job_worker.notify()
     
     return {
-        "success": success,
-        "message": "Résumé envoyé" if success else "Erreur lors de l'envoi"
+        "success": True,
+        "job_id": job['id'],
+        "message": "Envoi du résumé programmé"
     }
 
+# ============ CLOTURE ROUTES ============
+
+@api_router.get("/clotures", dependencies=[Depends(conditionnel(versions.CLOTURES, auth=require_admin))])
+async def list_clotures(user: Dict[str, Any] = Depends(require_admin)):
+    """Closed years with their totals"""
+    return await db.clotures.find(
+        {"cagnotte_id": user['cagnotte_id']}, {"_id": 0, "cagnotte_id": 0, "mois": 0}
+    ).sort("annee", -1).to_list(None)
+
+@api_router.get("/clotures/{annee}", dependencies=[Depends(conditionnel(versions.CLOTURES, auth=require_admin))])
+async def get_cloture(annee: int, user: Dict[str, Any] = Depends(require_admin)):
+    """Snapshot of a closed year: totals, months and participants"""
+    cloture = await db.clotures.find_one({"cagnotte_id": user['cagnotte_id'], "annee": annee}, {"_id": 0, "cagnotte_id": 0})
+    if not cloture:
+        raise HTTPException(status_code=404, detail="Clôture non trouvée")
+    return {**cloture, "participants": await clotures.figures_participants(db, user['cagnotte_id'], annee)}
+
+@api_router.post("/clotures/{annee}")
+async def close_year(annee: int, user: Dict[str, Any] = Depends(require_admin)):
+    """Close a past year: snapshot its figures, archive its paiements, make it read-only"""
+    montant_mensuel = (await config_cache.get(db, user['cagnotte_id'])).montant_mensuel
+    cloture = await clotures.cloturer(db, user['cagnotte_id'], annee, montant_mensuel, par=user['id'])
+    # Every admin view of the cagnotte may have changed; with a change
+    # stream, each worker sends this when it sees the close end
+    if events.EVENTS_SOURCE != "change_stream":
+        event_bus.publier("resync", {}, user['cagnotte_id'])
+    return cloture
+
+# ============ EVENT ROUTES ============
+
+@api_router.post("/events/ticket")
+async def ticket_events(principal: Principal = Depends(get_current_principal)):
+    """Ticket for EventSource, which cannot send the Authorization header.
+
+    It goes in the URL, so it is valid for ``EVENTS_TICKET_SECONDS`` and for
+    the event stream only; the session token never appears in access logs.
+    """
+    return {"ticket": create_ticket_evenements(principal.user), "expires_in": EVENTS_TICKET_SECONDS}
+
+@api_router.get("/events")
+async def stream_events(
+    request: Request,
+    ticket: Optional[str] = Query(None, description="Ticket de POST /api/events/ticket, pour EventSource"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security_optionnelle)
+):
+    """Server-sent events: paiement deltas and KPI changes (own records only for participants)"""
+    if credentials:
+        principal = await principal_depuis_token(credentials.credentials, cagnottes.du_chemin(request))
+    elif ticket:
+        principal = await principal_depuis_token(ticket, cagnottes.du_chemin(request), usage="events")
+    else:
+        raise HTTPException(status_code=401, detail="Token manquant")
+    abonne = event_bus.abonner(principal.user['cagnotte_id'], principal.user['id'], principal.is_admin)
+    if abonne is None:
+        raise HTTPException(status_code=503, detail="Trop de connexions en direct, réessayez plus tard")
+    return StreamingResponse(
+        events.flux_sse(request, event_bus, abonne),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ============ JOB ROUTES ============
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str, user: Dict[str, Any] = Depends(require_admin)):
+    job = await db.jobs.find_one({"id": job_id, "cagnotte_id": user['cagnotte_id']}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job non trouvé")
+    return jobs.resume_job(job)
+
+# ============ METRICS ============
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security_optionnelle)
+):
+    """Per-route request metrics, Prometheus text format (ADMIN_EMAILS or METRICS_ALLOWED_IPS)"""
+    if not (request.client and request.client.host in METRICS_ALLOWED_IPS):
+        if not credentials:
+            raise HTTPException(status_code=401, detail="Token manquant")
+        # Figures cover every cagnotte: admins of a single pot do not see them
+        user = (await principal_depuis_token(credentials.credentials)).user
+        if user['cagnotte_id'] != cagnottes.CAGNOTTE_DEFAUT or user['email'] not in ADMIN_EMAILS:
+            raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    return PlainTextResponse(metriques.registre.exposer() + limitation.limiteur.exposer() + idempotence.memoire.exposer(),
+                             media_type="text/plain; version=0.0.4")
+
 # Include the router
 app.include_router(api_router)
 
@@ -722,6 +1264,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(traces.TracesMiddleware)
+# Outermost, so that the figures include the other middlewares
+app.add_middleware(metriques.MetriquesMiddleware)
+# Before anything else sees the path: /api/c/<cagnotte_id>/... is served by the /api routes
+app.add_middleware(cagnottes.PrefixeMiddleware)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -731,29 +1278,52 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 async def startup_event():
+    # Attach data written before multi-tenancy to the default cagnotte, then index it
+    await cagnottes.migrer(db)
+    if not await ensure_indexes(db):
+        logger.warning("Certains index MongoDB sont absents, voir les erreurs ci-dessus")
+    
+    # Build the monthly rollups on first start after an upgrade
+    if not await db.paiement_rollups.find_one() and await db.paiements.find_one():
+        derives = 0
+        for cagnotte_id in await cagnottes.lister(db):
+            derives += len(await rollups.recalculer(db, cagnotte_id))
+        logger.info(f"Rollups des paiements initialisés ({derives} mois)")
+    
     # Initialize default config
-    config_exists = await db.config.find_one({"key": "montant_mensuel"})
-    if not config_exists:
-        await db.config.insert_one({"key": "montant_mensuel", "value": "50"})
-        await db.config.insert_one({"key": "devise", "value": "CHF"})
-        await db.config.insert_one({"key": "titre", "value": "Cagnotte Cadre SIC"})
+    await cagnottes.initialiser_config(db, cagnottes.CAGNOTTE_DEFAUT)
+    config_cache.invalidate(cagnottes.CAGNOTTE_DEFAUT)
     
     # Create default admin if not exists
     admin_email = "eric.savary@lausanne.ch"
-    admin_exists = await db.participants.find_one({"email": admin_email})
+    admin_exists = await db.participants.find_one({"cagnotte_id": cagnottes.CAGNOTTE_DEFAUT, "email": admin_email})
     if not admin_exists:
         admin_data = {
             "id": str(uuid.uuid4()),
+            "cagnotte_id": cagnottes.CAGNOTTE_DEFAUT,
             "nom": "Eric Savary",
             "email": admin_email,
-            "password": hash_password("admin123"),
+            "password": await hash_password("admin123"),
             "actif": True,
             "mois_debut": datetime.now(timezone.utc).strftime("%Y-%m"),
             "created_at": datetime.now(timezone.utc).isoformat()
         }
         await db.participants.insert_one(admin_data)
         logger.info(f"Admin créé: {admin_email} / password: admin123")
+    
+    # Start the notification worker (resumes jobs left unfinished)
+    job_worker.start()
+    
+    global change_stream_task
+    if events.EVENTS_SOURCE == "change_stream":
+        change_stream_task = asyncio.create_task(events.suivre_change_stream(db, event_bus))
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    event_bus.fermer()
+    if change_stream_task:
+        change_stream_task.cancel()
+    await job_worker.stop()
+    client.close()
+    passwords.shutdown()
+    email_service.smtp_pool.close()
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""Per-request MongoDB command tracing and query budgets.
+
+``ecouteur`` is a PyMongo command listener given to the Motor client. It
+attributes every command to the request being served through a
+contextvar: Motor runs PyMongo in threads but copies the caller's context
+into them, so the listener sees the ``Trace`` set by ``TracesMiddleware``.
+A trace counts the queries (cursor ``getMore`` batches apart), their total
+server time and the slowest one.
+
+A request issuing more than ``MONGO_BUDGET_REQUETES`` queries or spending
+more than ``MONGO_BUDGET_MS`` in MongoDB is logged with its breakdown (0
+disables a budget). ``tracer`` / ``mesurer`` / ``verifier_budget`` do the
+same in tests, and ``python traces.py`` checks ``BUDGETS`` against a real
+MongoDB at two dataset sizes, so an N+1 pattern fails the build::
+
+    python traces.py --mongo-url mongodb://localhost:27017 --tailles 20,200
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+MONGO_BUDGET_REQUETES = int(os.environ.get('MONGO_BUDGET_REQUETES', '10'))
+MONGO_BUDGET_MS = float(os.environ.get('MONGO_BUDGET_MS', '250'))
+
+# Cursor continuations: their number grows with the result size, not with the code path
+SUITES = frozenset({"getMore", "killCursors"})
+
+
+class Trace:
+    """MongoDB commands issued while serving one request"""
+
+    def __init__(self):
+        self.requetes = 0
+        self.suites = 0
+        self.duree_ms = 0.0
+        self.plus_lente: Optional[Tuple[str, float]] = None
+        self.par_commande: Dict[str, int] = {}
+        self._en_vol: Dict[Tuple[Any, int], str] = {}
+        self._verrou = threading.Lock()  # commands of one request may run in several threads
+
+    def debut(self, event: monitoring.CommandStartedEvent) -> None:
+        cible = event.command.get(event.command_name)
+        description = f"{event.command_name} {cible}" if isinstance(cible, str) else event.command_name
+        with self._verrou:
+            self._en_vol[(event.connection_id, event.request_id)] = description
+
+    def fin(self, event) -> None:
+        duree_ms = event.duration_micros / 1000
+        with self._verrou:
+            description = self._en_vol.pop((event.connection_id, event.request_id), event.command_name)
+            if event.command_name in SUITES:
+                self.suites += 1
+            else:
+                self.requetes += 1
+                self.par_commande[description] = self.par_commande.get(description, 0) + 1
+            self.duree_ms += duree_ms
+            if self.plus_lente is None or duree_ms > self.plus_lente[1]:
+                self.plus_lente = (description, duree_ms)
+
+    def resume(self) -> str:
+        detail = ", ".join(f"{d} ×{n}" for d, n in sorted(self.par_commande.items(), key=lambda x: -x[1]))
+        resume = f"{self.requetes} requêtes (+{self.suites} suites), {self.duree_ms:.1f} ms"
+        if self.plus_lente:
+            resume += f", plus lente: {self.plus_lente[0]} {self.plus_lente[1]:.1f} ms"
+        return f"{resume} [{detail}]"
+
+
+_trace_courante: ContextVar[Optional[Trace]] = ContextVar("trace_mongo", default=None)
+
+
+class EcouteurCommandes(monitoring.CommandListener):
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        trace = _trace_courante.get()
+        if trace is not None:
+            trace.debut(event)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        trace = _trace_courante.get()
+        if trace is not None:
+            trace.fin(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        trace = _trace_courante.get()
+        if trace is not None:
+            trace.fin(event)
+
+
+ecouteur = EcouteurCommandes()
+
+
+@contextmanager
+def tracer() -> Iterator[Trace]:
+    """Trace the commands issued inside the block (and the tasks it starts)"""
+    trace = Trace()
+    jeton = _trace_courante.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace_courante.reset(jeton)
+
+
+def depasse(trace: Trace, max_requetes: int = MONGO_BUDGET_REQUETES, max_ms: float = MONGO_BUDGET_MS) -> bool:
+    return (max_requetes > 0 and trace.requetes > max_requetes) or (max_ms > 0 and trace.duree_ms > max_ms)
+
+
+class TracesMiddleware:
+    """Traces each HTTP request and logs the ones over budget"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # A trace already open (``tracer`` in a test) collects the request itself
+        if scope["type"] != "http" or _trace_courante.get() is not None:
+            await self.app(scope, receive, send)
+            return
+        with tracer() as trace:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                if depasse(trace):
+                    logger.warning(f"Budget Mongo dépassé: {scope['method']} {scope['path']}: {trace.resume()}")
+
+
+# ============ TEST HELPERS ============
+
+async def mesurer(app, methode: str, chemin: str, **kwargs: Any) -> Tuple[Any, Trace]:
+    """Call ``app`` in-process and return the response with the trace of its commands"""
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://traces") as client:
+        with tracer() as trace:
+            reponse = await client.request(methode, chemin, **kwargs)
+    return reponse, trace
+
+
+def verifier_budget(trace: Trace, max_requetes: int, contexte: str = "") -> None:
+    """AssertionError when ``trace`` issued more than ``max_requetes`` queries"""
+    if trace.requetes > max_requetes:
+        raise AssertionError(f"{contexte}: {trace.requetes} requêtes > {max_requetes} autorisées. {trace.resume()}")
+
+
+# (method, path, caller, max queries), caches warm; must not depend on the number of participants
+BUDGETS: List[Tuple[str, str, str, int]] = [
+    ("GET", "/api/config", "admin", 1),
+    ("GET", "/api/participants", "admin", 3),
+    ("GET", "/api/paiements", "participant", 2),
+    ("GET", "/api/paiements/all", "admin", 3),
+    ("GET", "/api/kpi/participant", "participant", 2),
+    ("GET", "/api/kpi/admin", "admin", 3),
+    ("GET", "/api/kpi/dashboard", "admin", 4),
+    ("GET", "/api/kpi/matrix", "admin", 3),
+    ("GET", "/api/notifications/reminders-preview", "admin", 2),
+    ("GET", "/api/export/csv-all", "admin", 2),
+]
+
+
+async def _verifier_budgets(server, loadtest, base, tailles: List[int]) -> List[str]:
+    from datetime import datetime, timezone
+
+    import cagnottes
+
+    mois = datetime.now(timezone.utc).strftime("%Y-%m")
+    echecs: List[str] = []
+    comptes: Dict[Tuple[str, str], Dict[int, int]] = {}
+    for taille in tailles:
+        loadtest.seed(base, taille, 12, mois)
+        server.config_cache.invalidate(cagnottes.CAGNOTTE_DEFAUT)
+        participant = base.participants.find_one({"actif": True, "email": {"$ne": loadtest.ADMIN_EMAIL}})
+        jetons = {}
+        for qui, email in (("admin", loadtest.ADMIN_EMAIL), ("participant", participant['email'])):
+            reponse, _ = await mesurer(server.app, "POST", "/api/auth/login",
+                                       json={"email": email, "password": loadtest.MOT_DE_PASSE})
+            jetons[qui] = {"Authorization": f"Bearer {reponse.json()['token']}"}
+        for methode, chemin, qui, budget in BUDGETS:
+            await mesurer(server.app, methode, chemin, headers=jetons[qui])  # warm the caches
+            reponse, trace = await mesurer(server.app, methode, chemin, headers=jetons[qui])
+            contexte = f"{methode} {chemin} ({taille} participants)"
+            if reponse.status_code != 200:
+                echecs.append(f"{contexte}: HTTP {reponse.status_code}")
+                continue
+            comptes.setdefault((methode, chemin), {})[taille] = trace.requetes
+            print(f"{contexte}: {trace.resume()}")
+            try:
+                verifier_budget(trace, budget, contexte)
+            except AssertionError as e:
+                echecs.append(str(e))
+    for (methode, chemin), par_taille in comptes.items():
+        if len(set(par_taille.values())) > 1:
+            echecs.append(f"{methode} {chemin}: le nombre de requêtes dépend du nombre de participants {par_taille}")
+    return echecs
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Vérifie les budgets de requêtes Mongo par route")
+    parser.add_argument("--mongo-url", default=os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    parser.add_argument("--db-name", default="cagnotte_traces")
+    parser.add_argument("--tailles", default="20,200", help="Nombres de participants à comparer")
+    args = parser.parse_args(argv)
+
+    import loadtest
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    # server reads its settings at import time
+    os.environ['MONGO_URL'] = args.mongo_url
+    os.environ['DB_NAME'] = args.db_name
+    os.environ['ADMIN_EMAILS'] = loadtest.ADMIN_EMAIL
+    import server
+
+    client = MongoClient(args.mongo_url, serverSelectionTimeoutMS=5000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError as e:
+        print(f"MongoDB injoignable ({args.mongo_url}): {e}")
+        return 2
+    try:
+        echecs = asyncio.run(_verifier_budgets(
+            server, loadtest, client[args.db_name], [int(t) for t in args.tailles.split(',')]
+        ))
+    finally:
+        client.drop_database(args.db_name)
+        client.close()
+    for echec in echecs:
+        print(f"ÉCHEC {echec}")
+    return 1 if echecs else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
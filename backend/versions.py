@@ -0,0 +1,84 @@
+"""Version counters for conditional GETs (ETag / If-None-Match).
+
+The ``versions`` collection holds one monotonically increasing counter per
+cagnotte and key: a collection name (``config``, ``participants``,
+``paiements``, ``clotures``) or ``paiements:<participant_id>`` for the
+paiements of one participant, stored as ``<cagnotte_id>:<key>``. Every
+mutating route bumps the keys it touches; read routes hash the counters
+they depend on into an ETag and answer a matching ``If-None-Match`` with a
+bodiless 304, before any data is read.
+"""
+import hashlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException, Request, Response
+from pymongo import UpdateOne
+
+CONFIG = "config"
+PARTICIPANTS = "participants"
+PAIEMENTS = "paiements"
+CLOTURES = "clotures"
+
+
+def cle_participant(participant_id: str) -> str:
+    return f"{PAIEMENTS}:{participant_id}"
+
+
+def _cle(cagnotte_id: str, cle: str) -> str:
+    return f"{cagnotte_id}:{cle}"
+
+
+async def bump(db, cagnotte_id: str, *cles: str) -> None:
+    """Increment the counters of ``cles`` (created on first use)"""
+    operations = [
+        UpdateOne({"key": _cle(cagnotte_id, cle)}, {"$inc": {"version": 1}}, upsert=True)
+        for cle in dict.fromkeys(cles)
+    ]
+    if operations:
+        await db.versions.bulk_write(operations, ordered=False)
+
+
+async def bump_paiements(db, cagnotte_id: str, paiements: Iterable[Dict[str, Any]]) -> None:
+    """Bump the paiements counter of the cagnotte and the counters of the participants concerned"""
+    await bump(db, cagnotte_id, PAIEMENTS, *(cle_participant(p['participant_id']) for p in paiements))
+
+
+async def lire(db, cagnotte_id: str, cles: List[str]) -> Dict[str, int]:
+    prefixe = len(_cle(cagnotte_id, ""))
+    return {
+        v['key'][prefixe:]: v['version']
+        async for v in db.versions.find(
+            {"key": {"$in": [_cle(cagnotte_id, cle) for cle in cles]}}, {"_id": 0, "key": 1, "version": 1}
+        )
+    }
+
+
+def calculer_etag(request: Request, cagnotte_id: str, versions: Dict[str, int], cles: List[str],
+                  user_id: Optional[str]) -> str:
+    # The current month is part of the tag: KPIs depend on it even when no data changed
+    mois = datetime.now(timezone.utc).strftime("%Y-%m")
+    source = "|".join([
+        cagnotte_id, request.url.path, str(request.url.query), user_id or "", mois,
+        *(f"{cle}={versions.get(cle, 0)}" for cle in cles)
+    ])
+    return f'W/"{hashlib.sha1(source.encode("utf-8")).hexdigest()[:20]}"'
+
+
+def correspond(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    # Weak comparison, as required for If-None-Match
+    valeurs = {v.strip().removeprefix('W/') for v in if_none_match.split(',')}
+    return '*' in valeurs or etag.removeprefix('W/') in valeurs
+
+
+async def conditionnel(db, cagnotte_id: str, request: Request, response: Response, cles: List[str],
+                       user_id: Optional[str] = None) -> None:
+    """Set the ETag of the response, or raise a 304 if the client's copy is current"""
+    etag = calculer_etag(request, cagnotte_id, await lire(db, cagnotte_id, cles), cles, user_id)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if correspond(request, etag):
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
@@ -9,7 +9,14 @@ import { Toaster } from "@/components/ui/sonner";
 import { ThemeProvider } from "./contexts/ThemeContext";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
-const API = `${BACKEND_URL}/api`;
+
+// Cagnotte chosen with ?cagnotte=<id>, remembered for the next visits
+const cagnotteUrl = new URLSearchParams(window.location.search).get('cagnotte');
+if (cagnotteUrl) {
+  localStorage.setItem('cagnotte', cagnotteUrl);
+}
+const CAGNOTTE = localStorage.getItem('cagnotte');
+const API = CAGNOTTE ? `${BACKEND_URL}/api/c/${encodeURIComponent(CAGNOTTE)}` : `${BACKEND_URL}/api`;
 
 // Setup axios defaults
 axios.interceptors.request.use((config) => {
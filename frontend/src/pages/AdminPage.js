@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { API } from '../App';
 import { useNavigate } from 'react-router-dom';
@@ -13,13 +13,23 @@ import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle, Di
 import { Checkbox } from '@/components/ui/checkbox';
 import { User, LogOut, Plus, Edit, Trash2, CheckCircle, Download, BarChart3, FileText, Moon, Sun } from 'lucide-react';
 import { exportMonthlyReportPDF } from '../utils/pdfExport';
+import { suivreEvenements } from '../utils/events';
 import { useTheme } from '../contexts/ThemeContext';
 
+const PAGE_PAIEMENTS = 50;
+const METHODES = ['TWINT', 'VIREMENT', 'AUTRE', 'DEPENSE'];
+// Follow-up of a queued notification job: every 2 s, for at most 2 minutes
+const JOB_SUIVI_MS = 2000;
+const JOB_SUIVI_TENTATIVES = 60;
+
 function AdminPage() {
   const { theme, toggleTheme } = useTheme();
   const [user, setUser] = useState(null);
   const [participants, setParticipants] = useState([]);
   const [paiements, setPaiements] = useState([]);
+  const [paiementsCursor, setPaiementsCursor] = useState(null);
+  const [paiementsTotal, setPaiementsTotal] = useState(0);
+  const [monthlyStats, setMonthlyStats] = useState({});
   const [kpis, setKpis] = useState([]);
   const [config, setConfig] = useState({ montant_mensuel: '50', devise: 'CHF', titre: 'Cagnotte Cadre SIC' });
   const [loading, setLoading] = useState(false);
@@ -27,7 +37,9 @@ function AdminPage() {
   // Filters
   const [filterYear, setFilterYear] = useState(new Date().getFullYear().toString());
   const [filterMonth, setFilterMonth] = useState('ALL');
-  const [searchTerm, setSearchTerm] = useState('');
+  const [filterStatut, setFilterStatut] = useState('ALL');
+  const [filterMethode, setFilterMethode] = useState('ALL');
+  const [filterParticipant, setFilterParticipant] = useState('ALL');
   
   // Dialogs
   const [showAddParticipant, setShowAddParticipant] = useState(false);
@@ -55,20 +67,82 @@ function AdminPage() {
     if (storedUser) {
       setUser(JSON.parse(storedUser));
     }
-    loadData();
   }, []);
 
-  const loadData = async () => {
+  useEffect(() => {
+    loadOverview();
+  }, [filterYear]);
+
+  useEffect(() => {
+    loadPaiements();
+  }, [filterYear, filterMonth, filterStatut, filterMethode, filterParticipant]);
+
+  // Live updates: reload shortly after the server reports a change, with the current filters
+  const reload = useRef(null);
+  reload.current = () => loadData();
+  useEffect(() => {
+    if (!localStorage.getItem('token')) return undefined;
+    let timer = null;
+    const arreter = suivreEvenements(() => {
+      clearTimeout(timer);
+      timer = setTimeout(() => reload.current(), 500);
+    });
+    return () => {
+      clearTimeout(timer);
+      arreter();
+    };
+  }, []);
+
+  // Follow the pagination cursors of a list endpoint
+  const fetchAllPages = async (url, params = {}) => {
+    const items = [];
+    let after = null;
+    do {
+      const response = await axios.get(url, { params: { ...params, limit: 1000, ...(after ? { after } : {}) } });
+      items.push(...response.data.items);
+      after = response.data.next_cursor;
+    } while (after);
+    return items;
+  };
+
+  // One page of the paiements table, filtered by the server; `after` appends the next page
+  const loadPaiements = async (after = null) => {
+    const params = { mois: filterMonth !== 'ALL' ? filterMonth : filterYear, limit: PAGE_PAIEMENTS };
+    if (filterStatut !== 'ALL') params.statut = filterStatut;
+    if (filterMethode !== 'ALL') params.methode = filterMethode;
+    if (filterParticipant !== 'ALL') params.participant_id = filterParticipant;
+    if (after) params.after = after;
+    try {
+      const response = await axios.get(`${API}/paiements/all`, { params });
+      setPaiements(prev => (after ? [...prev, ...response.data.items] : response.data.items));
+      setPaiementsCursor(response.data.next_cursor);
+      if (!after) setPaiementsTotal(response.data.total);  // only counted on the first page
+    } catch (error) {
+      toast.error('Erreur de chargement');
+    }
+  };
+
+  // Confirmed total per month of the year, summed from the participant × month matrix
+  const loadMonthlyStats = async () => {
+    const response = await axios.get(`${API}/kpi/matrix`, { params: { from: `${filterYear}-01`, to: `${filterYear}-12` } });
+    const stats = {};
+    response.data.mois.forEach((mois, j) => {
+      const total = response.data.montants.reduce((sum, ligne) => sum + ligne[j], 0);
+      if (total > 0) stats[mois] = total;
+    });
+    setMonthlyStats(stats);
+  };
+
+  const loadOverview = async () => {
     try {
-      const [participantsRes, paiementsRes, kpisRes, configRes] = await Promise.all([
-        axios.get(`${API}/participants`),
-        axios.get(`${API}/paiements/all`),
+      const [participantsData, kpisRes, configRes] = await Promise.all([
+        fetchAllPages(`${API}/participants`),
         axios.get(`${API}/kpi/admin`),
-        axios.get(`${API}/config`)
+        axios.get(`${API}/config`),
+        loadMonthlyStats()
       ]);
       
-      setParticipants(participantsRes.data);
-      setPaiements(paiementsRes.data);
+      setParticipants(participantsData);
       setKpis(kpisRes.data);
       
       const configObj = {};
@@ -81,6 +155,9 @@ function AdminPage() {
     }
   };
 
+  // Everything on the page, after a change or a live event
+  const loadData = () => Promise.all([loadOverview(), loadPaiements()]);
+
   const handleAddParticipant = async (e) => {
     e.preventDefault();
     setLoading(true);
@@ -205,9 +282,8 @@ function AdminPage() {
 
   const handleExportAllCSV = async () => {
     try {
-      const response = await axios.get(`${API}/export/csv-all`);
-      const blob = new Blob([response.data.csv], { type: 'text/csv' });
-      const url = window.URL.createObjectURL(blob);
+      const response = await axios.get(`${API}/export/csv-all`, { responseType: 'blob' });
+      const url = window.URL.createObjectURL(response.data);
       const a = document.createElement('a');
       a.href = url;
       a.download = `tous_paiements_${new Date().toISOString().split('T')[0]}.csv`;
@@ -218,21 +294,47 @@ function AdminPage() {
     }
   };
 
+  // Poll a notification job until the worker has finished it
+  // The finished job, or null if it is still running after JOB_SUIVI_TENTATIVES polls
+  const waitForJob = async (jobId) => {
+    for (let tentative = 0; tentative < JOB_SUIVI_TENTATIVES; tentative++) {
+      await new Promise(resolve => setTimeout(resolve, JOB_SUIVI_MS));
+      const response = await axios.get(`${API}/jobs/${jobId}`);
+      if (response.data.statut === 'termine') return response.data;
+    }
+    return null;
+  };
+
   const handleSendReminders = async () => {
     if (!window.confirm('Envoyer un email de rappel à tous les participants avec un paiement manquant pour le mois en cours ?')) return;
     
     setLoading(true);
+    let jobId;
     try {
       const response = await axios.post(`${API}/notifications/send-reminders`);
-      toast.success(`${response.data.sent} email(s) envoyé(s)`);
-      if (response.data.errors.length > 0) {
-        toast.error(`Erreurs pour: ${response.data.errors.join(', ')}`);
-      }
+      jobId = response.data.job_id;
+      toast.info(`Rappels programmés pour ${response.data.total} participant(s)`);
     } catch (error) {
       toast.error('Erreur lors de l\'envoi des rappels');
+      return;
     } finally {
       setLoading(false);
     }
+    
+    // The emails are sent in the background; report the outcome without blocking the page
+    try {
+      const job = await waitForJob(jobId);
+      if (!job) {
+        toast.warning('Envoi des rappels toujours en cours, résultat non disponible pour le moment');
+        return;
+      }
+      toast.success(`${job.sent} email(s) envoyé(s)`);
+      if (job.errors.length > 0) {
+        toast.error(`Erreurs pour: ${job.errors.join(', ')}`);
+      }
+    } catch (error) {
+      toast.error('Impossible de suivre l\'envoi des rappels');
+    }
   };
 
   const handleExportPDF = async () => {
@@ -360,26 +462,6 @@ function AdminPage() {
     navigate('/login');
   };
 
-  // Filter paiements
-  const filteredPaiements = paiements.filter(p => {
-    if (searchTerm) {
-      const participant = participants.find(part => part.id === p.participant_id);
-      if (participant && !participant.nom.toLowerCase().includes(searchTerm.toLowerCase())) {
-        return false;
-      }
-    }
-    if (filterYear && !p.mois.startsWith(filterYear)) return false;
-    if (filterMonth && filterMonth !== 'ALL' && p.mois !== filterMonth) return false;
-    return true;
-  });
-
-  // Calculate monthly stats for chart
-  const monthlyStats = {};
-  paiements.filter(p => p.statut === 'confirme' && p.mois.startsWith(filterYear)).forEach(p => {
-    if (!monthlyStats[p.mois]) monthlyStats[p.mois] = 0;
-    monthlyStats[p.mois] += p.montant;
-  });
-
   const years = Array.from({ length: 5 }, (_, i) => new Date().getFullYear() - i);
   const months = Array.from({ length: 12 }, (_, i) => {
     const month = i + 1;
@@ -459,14 +541,47 @@ function AdminPage() {
               </div>
               
               <div>
-                <Label htmlFor="search">Rechercher participant</Label>
-                <Input
-                  id="search"
-                  placeholder="Nom..."
-                  value={searchTerm}
-                  onChange={(e) => setSearchTerm(e.target.value)}
-                  data-testid="search-participant-input"
-                />
+                <Label htmlFor="filterParticipant">Participant</Label>
+                <Select value={filterParticipant} onValueChange={setFilterParticipant}>
+                  <SelectTrigger id="filterParticipant" data-testid="filter-participant-select">
+                    <SelectValue placeholder="Tous les participants" />
+                  </SelectTrigger>
+                  <SelectContent>
+                    <SelectItem value="ALL">Tous les participants</SelectItem>
+                    {participants.map(p => (
+                      <SelectItem key={p.id} value={p.id}>{p.nom}</SelectItem>
+                    ))}
+                  </SelectContent>
+                </Select>
+              </div>
+              
+              <div>
+                <Label htmlFor="filterStatut">Statut</Label>
+                <Select value={filterStatut} onValueChange={setFilterStatut}>
+                  <SelectTrigger id="filterStatut" data-testid="filter-statut-select">
+                    <SelectValue />
+                  </SelectTrigger>
+                  <SelectContent>
+                    <SelectItem value="ALL">Tous les statuts</SelectItem>
+                    <SelectItem value="en_attente">En Attente</SelectItem>
+                    <SelectItem value="confirme">Confirmé</SelectItem>
+                  </SelectContent>
+                </Select>
+              </div>
+              
+              <div>
+                <Label htmlFor="filterMethode">Méthode</Label>
+                <Select value={filterMethode} onValueChange={setFilterMethode}>
+                  <SelectTrigger id="filterMethode" data-testid="filter-methode-select">
+                    <SelectValue />
+                  </SelectTrigger>
+                  <SelectContent>
+                    <SelectItem value="ALL">Toutes les méthodes</SelectItem>
+                    {METHODES.map(methode => (
+                      <SelectItem key={methode} value={methode}>{methode}</SelectItem>
+                    ))}
+                  </SelectContent>
+                </Select>
               </div>
               
               <div className="flex items-end">
@@ -983,7 +1098,7 @@ function AdminPage() {
             <div className="flex flex-col sm:flex-row justify-between items-start sm:items-center gap-4">
               <div>
                 <CardTitle>Tous les Paiements</CardTitle>
-                <CardDescription>{filteredPaiements.length} paiement(s)</CardDescription>
+                <CardDescription>{paiementsTotal} paiement(s)</CardDescription>
               </div>
               <Button onClick={handleExportAllCSV} variant="outline" size="sm" data-testid="export-all-csv-button">
                 <Download className="w-4 h-4 mr-2" />
@@ -1007,14 +1122,14 @@ function AdminPage() {
                   </tr>
                 </thead>
                 <tbody>
-                  {filteredPaiements.length === 0 ? (
+                  {paiements.length === 0 ? (
                     <tr>
                       <td colSpan="8" className="text-center text-gray-500 py-8">
                         Aucun paiement trouvé
                       </td>
                     </tr>
                   ) : (
-                    filteredPaiements.map(p => {
+                    paiements.map(p => {
                       const participant = participants.find(part => part.id === p.participant_id);
                       return (
                         <tr key={p.id} data-testid={`paiement-row-${p.id}`}>
@@ -1062,6 +1177,13 @@ function AdminPage() {
                 </tbody>
               </table>
             </div>
+            {paiementsCursor && (
+              <div className="flex justify-center mt-4">
+                <Button variant="outline" onClick={() => loadPaiements(paiementsCursor)} data-testid="load-more-paiements-button">
+                  Charger plus ({paiements.length} / {paiementsTotal})
+                </Button>
+              </div>
+            )}
           </CardContent>
         </Card>
 
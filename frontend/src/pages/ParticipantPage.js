@@ -1,7 +1,8 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { API } from '../App';
 import { useNavigate } from 'react-router-dom';
+import { suivreEvenements } from '../utils/events';
 import { toast } from 'sonner';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
@@ -26,6 +27,8 @@ function ParticipantPage() {
   const [mois, setMois] = useState('');
   const [montant, setMontant] = useState('');
   const [methode, setMethode] = useState('TWINT');
+  // Idempotency-Key of the declaration being sent, reused when the same form is submitted again
+  const declaration = useRef(null);
   
   // Filters
   const [filterYear, setFilterYear] = useState(new Date().getFullYear().toString());
@@ -58,6 +61,20 @@ function ParticipantPage() {
     loadData();
   }, []);
 
+  // Live updates: reload shortly after the server reports a change
+  useEffect(() => {
+    if (!localStorage.getItem('token')) return undefined;
+    let timer = null;
+    const arreter = suivreEvenements(() => {
+      clearTimeout(timer);
+      timer = setTimeout(loadData, 500);
+    });
+    return () => {
+      clearTimeout(timer);
+      arreter();
+    };
+  }, []);
+
   // Update montant when config changes
   useEffect(() => {
     if (config.montant_mensuel && !montant) {
@@ -101,13 +118,18 @@ function ParticipantPage() {
     e.preventDefault();
     setLoading(true);
     
+    const corps = { mois, montant: parseFloat(montant), methode, raison: null };
+    const empreinte = JSON.stringify(corps);
+    if (declaration.current?.empreinte !== empreinte) {
+      const cle = window.crypto?.randomUUID ? window.crypto.randomUUID() : `${Date.now()}-${Math.random()}`;
+      declaration.current = { empreinte, cle };
+    }
+    
     try {
-      await axios.post(`${API}/paiements`, {
-        mois,
-        montant: parseFloat(montant),
-        methode,
-        raison: null
+      await axios.post(`${API}/paiements`, corps, {
+        headers: { 'Idempotency-Key': declaration.current.cle }
       });
+      declaration.current = null;
       
       toast.success('Versement déclaré avec succès');
       loadData();
@@ -130,9 +152,8 @@ function ParticipantPage() {
 
   const handleExportCSV = async () => {
     try {
-      const response = await axios.get(`${API}/export/csv/${user.id}`);
-      const blob = new Blob([response.data.csv], { type: 'text/csv' });
-      const url = window.URL.createObjectURL(blob);
+      const response = await axios.get(`${API}/export/csv/${user.id}`, { responseType: 'blob' });
+      const url = window.URL.createObjectURL(response.data);
       const a = document.createElement('a');
       a.href = url;
       a.download = `paiements_${user.nom}_${new Date().toISOString().split('T')[0]}.csv`;
@@ -0,0 +1,40 @@
+import axios from 'axios';
+import { API } from '../App';
+
+const RECONNEXION_MS = 5000;
+
+// Follow the server-sent events of the cagnotte. EventSource cannot send the
+// Authorization header, so each connection uses a short-lived ticket from
+// POST /events/ticket instead of the session token. When the stream closes
+// (e.g. the ticket expired before a reconnection), a new ticket is fetched.
+// Returns a function that stops listening.
+export function suivreEvenements(onMessage) {
+  let source = null;
+  let timer = null;
+  let arrete = false;
+
+  const ouvrir = async () => {
+    try {
+      const response = await axios.post(`${API}/events/ticket`);
+      if (arrete) return;
+      source = new EventSource(`${API}/events?ticket=${encodeURIComponent(response.data.ticket)}`);
+      source.onmessage = onMessage;
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+          timer = setTimeout(ouvrir, RECONNEXION_MS);
+        }
+      };
+    } catch (error) {
+      if (!arrete && error.response?.status !== 401) {
+        timer = setTimeout(ouvrir, RECONNEXION_MS);
+      }
+    }
+  };
+
+  ouvrir();
+  return () => {
+    arrete = true;
+    clearTimeout(timer);
+    if (source) source.close();
+  };
+}
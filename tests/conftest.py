@@ -0,0 +1,161 @@
+"""Shared fixtures.
+
+Tests that need MongoDB take the ``api`` fixture: the FastAPI app, started
+once against the ``TEST_DB_NAME`` database of ``MONGO_URL`` and emptied
+before each test. They are skipped when no MongoDB server answers.
+"""
+import functools
+import os
+import sys
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import pytest
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND)
+
+# The backend modules read their settings at import time. DB_NAME is
+# never taken from the environment: the test database is dropped.
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ["DB_NAME"] = os.environ.get("TEST_DB_NAME", "cagnotte_tests")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("JWT_SECRET", "tests")
+# Nothing listens there: no test email can leave the machine
+os.environ["SMTP_HOST"] = "127.0.0.1"
+os.environ["SMTP_PORT"] = "9"
+os.environ["SMTP_STARTTLS"] = "false"
+ADMIN_EMAIL = "eric.savary@lausanne.ch"
+ADMIN_PASSWORD = "admin123"
+os.environ["ADMIN_EMAILS"] = ADMIN_EMAIL
+
+
+@pytest.fixture(scope="session")
+def mongo_url() -> str:
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    url = os.environ["MONGO_URL"]
+    client = MongoClient(url, serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command("ping")
+    except PyMongoError as e:
+        pytest.skip(f"MongoDB injoignable ({url}): {e}")
+    finally:
+        client.close()
+    return url
+
+
+def _supprimer_base(url: str) -> None:
+    from pymongo import MongoClient
+
+    client = MongoClient(url)
+    client.drop_database(os.environ["DB_NAME"])
+    client.close()
+
+
+@pytest.fixture(scope="session")
+def _application(mongo_url):
+    from fastapi.testclient import TestClient
+
+    _supprimer_base(mongo_url)
+    import server
+    with TestClient(server.app) as client:
+        yield server, client
+    _supprimer_base(mongo_url)
+
+
+class Api:
+    """The app under test, with helpers to seed the database and call the routes"""
+
+    def __init__(self, server, client):
+        self.server = server
+        self.client = client
+        self.db = server.db
+        self.admin: Dict[str, Any] = {}
+
+    def appeler(self, fonction, *args, **kwargs):
+        """Run a coroutine function on the app's event loop"""
+        return self.client.portal.call(functools.partial(fonction, *args, **kwargs))
+
+    def entetes(self, user: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+        user = user or self.admin
+        return {"Authorization": f"Bearer {self.server.create_token(user['id'], user['email'], user['cagnotte_id'])}"}
+
+    def participant(self, nom: str, mois_debut: str = "2024-01", **champs) -> Dict[str, Any]:
+        import cagnottes
+        import passwords
+
+        doc = {
+            "id": str(uuid.uuid4()),
+            "cagnotte_id": cagnottes.CAGNOTTE_DEFAUT,
+            "nom": nom,
+            "email": f"{nom.lower()}@example.ch",
+            "password": passwords.hash_password_sync("secret"),
+            "actif": True,
+            "mois_debut": mois_debut,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            **champs,
+        }
+        self.appeler(self.db.participants.insert_one, dict(doc))
+        return doc
+
+    def paiement(self, participant: Dict[str, Any], mois: str, montant: float = 50.0,
+                 statut: str = "confirme", methode: str = "TWINT", **champs) -> Dict[str, Any]:
+        """Insert a paiement and its rollup, as the routes do"""
+        import rollups
+
+        doc = self.server.marquer_versement({
+            "id": str(uuid.uuid4()),
+            "cagnotte_id": participant['cagnotte_id'],
+            "participant_id": participant['id'],
+            "mois": mois,
+            "montant": montant,
+            "methode": methode,
+            "raison": None,
+            "statut": statut,
+            "date": f"{mois}-05T10:00:00+00:00",
+            **champs,
+        })
+        self.appeler(self.db.paiements.insert_one, dict(doc))
+        self.appeler(rollups.appliquer, self.db, ajoutes=[doc])
+        return doc
+
+    def get(self, url: str, user: Optional[Dict[str, Any]] = None, **kwargs):
+        return self.client.get(url, headers={**self.entetes(user), **kwargs.pop("headers", {})}, **kwargs)
+
+    def post(self, url: str, user: Optional[Dict[str, Any]] = None, **kwargs):
+        return self.client.post(url, headers={**self.entetes(user), **kwargs.pop("headers", {})}, **kwargs)
+
+    def put(self, url: str, user: Optional[Dict[str, Any]] = None, **kwargs):
+        return self.client.put(url, headers={**self.entetes(user), **kwargs.pop("headers", {})}, **kwargs)
+
+    def delete(self, url: str, user: Optional[Dict[str, Any]] = None, **kwargs):
+        return self.client.delete(url, headers={**self.entetes(user), **kwargs.pop("headers", {})}, **kwargs)
+
+
+@pytest.fixture
+def api(_application, monkeypatch) -> Api:
+    import cagnottes
+    import idempotence
+    import limitation
+    import passwords
+
+    server, client = _application
+    api = Api(server, client)
+
+    async def reinitialiser():
+        for nom in await server.db.list_collection_names():
+            if not nom.startswith("system."):
+                await server.db[nom].delete_many({})
+        await cagnottes.initialiser_config(server.db, cagnottes.CAGNOTTE_DEFAUT)
+
+    api.appeler(reinitialiser)
+    server.config_cache._entrees.clear()
+    server.principal_cache.clear()
+    monkeypatch.setattr(limitation, "limiteur", limitation.Limiteur())
+    monkeypatch.setattr(idempotence, "memoire", idempotence.Idempotence())
+    api.admin = api.participant("Admin", mois_debut=datetime.now(timezone.utc).strftime("%Y-%m"), email=ADMIN_EMAIL,
+                                password=passwords.hash_password_sync(ADMIN_PASSWORD))
+    return api
@@ -0,0 +1,18 @@
+"""Mongo query budgets of the key routes (see ``traces.BUDGETS``).
+
+``traces.main`` sets the environment, imports ``server`` and drops its
+database, so it runs in its own process.
+"""
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+
+def test_budgets_des_routes(mongo_url):
+    resultat = subprocess.run(
+        [sys.executable, "traces.py", "--mongo-url", mongo_url, "--db-name", "cagnotte_tests_traces", "--tailles", "20,60"],
+        cwd=BACKEND, env={**os.environ, "PYTHONPATH": BACKEND}, capture_output=True, text=True, timeout=600
+    )
+    assert resultat.returncode == 0, resultat.stdout + resultat.stderr
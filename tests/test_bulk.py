@@ -0,0 +1,87 @@
+import pytest
+
+import rollups
+
+
+def _bulk(api, *operations):
+    return api.post("/api/paiements/bulk", json={"operations": list(operations)})
+
+
+def _sans_derive(api):
+    return api.appeler(rollups.recalculer, api.db, api.admin['cagnotte_id'], None, True) == []
+
+
+@pytest.fixture
+def paiements(api):
+    alice = api.participant("Alice")
+    return {
+        "attente": api.paiement(alice, "2024-01", statut="en_attente"),
+        "modifie": api.paiement(alice, "2024-02"),
+        "supprime": api.paiement(alice, "2024-03"),
+        "depense": api.paiement(alice, "2024-03", montant=12, methode="DEPENSE"),
+    }
+
+
+def test_operations_mixtes(api, paiements):
+    reponse = _bulk(
+        api,
+        {"id": paiements["attente"]['id'], "action": "confirm"},
+        {"id": paiements["modifie"]['id'], "action": "update", "champs": {"montant": 45}},
+        {"id": paiements["supprime"]['id'], "action": "delete"},
+    ).json()
+    assert (reponse['success'], reponse['total'], reponse['erreurs']) == (True, 3, 0)
+    confirme, modifie, supprime = reponse['resultats']
+    assert confirme['paiement']['statut'] == "confirme"
+    assert modifie['paiement']['montant'] == 45
+    assert supprime == {"id": paiements["supprime"]['id'], "action": "delete", "statut": "ok"}
+
+    restants = {p['id']: p for p in api.get("/api/paiements/all").json()['items']}
+    assert paiements["supprime"]['id'] not in restants
+    assert restants[paiements["attente"]['id']]['statut'] == "confirme"
+    assert restants[paiements["modifie"]['id']]['montant'] == 45
+    assert _sans_derive(api)
+
+
+def test_erreurs_par_operation(api, paiements):
+    reponse = _bulk(
+        api,
+        {"id": "inconnu", "action": "confirm"},
+        {"id": paiements["attente"]['id'], "action": "archiver"},
+        {"id": paiements["modifie"]['id'], "action": "update"},
+        {"id": paiements["supprime"]['id'], "action": "delete"},
+        {"id": paiements["supprime"]['id'], "action": "confirm"},
+    ).json()
+    assert (reponse['success'], reponse['erreurs']) == (False, 4)
+    assert [r['statut'] for r in reponse['resultats']] == ["erreur", "erreur", "erreur", "ok", "erreur"]
+    assert reponse['resultats'][0]['detail'] == "Paiement non trouvé"
+    assert reponse['resultats'][4]['detail'] == "Opération en double pour ce paiement"
+    assert _sans_derive(api)
+
+
+def test_doublon_de_versement(api, paiements):
+    # Turning the DEPENSE of March into a versement collides with the one already declared
+    reponse = _bulk(
+        api,
+        {"id": paiements["depense"]['id'], "action": "update", "champs": {"methode": "TWINT"}},
+        {"id": paiements["attente"]['id'], "action": "confirm"},
+    ).json()
+    doublon, confirme = reponse['resultats']
+    assert doublon['statut'] == "erreur" and "paiement" not in doublon
+    assert doublon['detail'] == api.server.DOUBLON_VERSEMENT
+    assert confirme['statut'] == "ok"
+    assert _sans_derive(api)
+
+
+def test_annee_cloturee(api):
+    alice = api.participant("Alice", mois_debut="2023-01")
+    ancien = api.paiement(alice, "2023-01")
+    assert api.post("/api/clotures/2023").status_code == 200
+    reponse = _bulk(api, {"id": ancien['id'], "action": "delete"}).json()
+    assert reponse['resultats'][0]['detail'] == "Ce paiement appartient à une année clôturée"
+
+
+def test_limites(api, monkeypatch):
+    assert _bulk(api).status_code == 400
+    monkeypatch.setattr(api.server, "PAIEMENTS_BULK_MAX", 2)
+    assert _bulk(api, *({"id": str(n), "action": "delete"} for n in range(3))).status_code == 400
+    assert api.post("/api/paiements/bulk", api.participant("Alice"), json={"operations": []}).status_code == 403
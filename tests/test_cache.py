@@ -0,0 +1,97 @@
+import time
+from types import SimpleNamespace
+
+import cache as cache_module
+import cagnottes
+from cache import ConfigCache, ConfigCagnotte, Principal, PrincipalCache
+
+DEFAUT = cagnottes.CAGNOTTE_DEFAUT
+
+
+def test_config_depuis_documents():
+    config = ConfigCagnotte.depuis_documents([
+        {"key": "montant_mensuel", "value": "20.5"}, {"key": "devise", "value": "EUR"}, {"key": "autre", "value": "x"}
+    ])
+    assert (config.montant_mensuel, config.devise, config.titre) == (20.5, "EUR", "Cagnotte Cadre SIC")
+    assert len(config.items) == 3
+    assert ConfigCagnotte.depuis_documents([{"key": "montant_mensuel", "value": "abc"}]).montant_mensuel == 50.0
+
+
+def _changer_montant(api, valeur):
+    api.appeler(api.db.config.update_one, {"cagnotte_id": DEFAUT, "key": "montant_mensuel"}, {"$set": {"value": valeur}})
+
+
+def test_config_gardee_jusqu_a_invalidation(api):
+    cache = ConfigCache(ttl=3600)
+    assert api.appeler(cache.get, api.db, DEFAUT).montant_mensuel == 50
+    _changer_montant(api, "30")
+    assert api.appeler(cache.get, api.db, DEFAUT).montant_mensuel == 50
+    cache.invalidate(DEFAUT)
+    assert api.appeler(cache.get, api.db, DEFAUT).montant_mensuel == 30
+
+
+def test_config_relue_apres_ttl(api):
+    cache = ConfigCache(ttl=0)
+    api.appeler(cache.get, api.db, DEFAUT)
+    _changer_montant(api, "30")
+    assert api.appeler(cache.get, api.db, DEFAUT).montant_mensuel == 30
+
+
+def test_cagnotte_inconnue_non_retenue(api):
+    cache = ConfigCache(ttl=3600)
+    assert api.appeler(cache.get, api.db, "inconnue").montant_mensuel == 50
+    assert "inconnue" not in cache._entrees
+
+
+def test_ecriture_de_la_config_invalide_le_cache(api):
+    alice = api.participant("Alice")
+    assert api.get("/api/kpi/participant", user=alice).json()['reste_mois'] == 50
+    assert api.put("/api/config/montant_mensuel", params={"value": "20"}).status_code == 200
+    assert api.get("/api/kpi/participant", user=alice).json()['reste_mois'] == 20
+    config = {c['key']: c['value'] for c in api.client.get("/api/config").json()}
+    assert config['montant_mensuel'] == "20"
+
+
+def _principal(nom):
+    return Principal(user={"id": nom}, is_admin=False)
+
+
+def test_principaux_par_cagnotte(monkeypatch):
+    cache = PrincipalCache(maxsize=2, ttl=30)
+    for nom in ("a", "b", "c"):
+        cache.put("c1", nom, _principal(nom))
+    cache.put("c2", "a", _principal("a2"))
+    assert cache.get("c1", "a") is None  # least recently used of c1
+    assert cache.get("c1", "c").user['id'] == "c"
+    assert cache.get("c2", "a").user['id'] == "a2"  # other cagnottes keep their users
+
+    instant = time.monotonic() + 31
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(monotonic=lambda: instant))
+    assert cache.get("c1", "c") is None
+
+
+def test_principal_charge_avant_eviction_ignore():
+    cache = PrincipalCache()
+    generation = cache.generation
+    cache.evict("c1", "a")
+    cache.put("c1", "a", _principal("a"), generation)
+    assert cache.get("c1", "a") is None
+    cache.put("c1", "a", _principal("a"), cache.generation)
+    assert cache.get("c1", "a") is not None
+
+
+def test_participant_desactive_refuse_aussitot(api):
+    alice = api.participant("Alice")
+    assert api.get("/api/auth/me", user=alice).status_code == 200
+    assert api.delete(f"/api/participants/{alice['id']}").status_code == 200
+    assert api.get("/api/auth/me", user=alice).status_code == 401
+
+
+def test_droits_admin_relus_apres_modification(api):
+    bob = api.participant("Bob")
+    assert api.get("/api/participants", user=bob).status_code == 403
+    reponse = api.put(f"/api/participants/{api.admin['id']}",
+                      json={"nom": "Admin", "email": "autre@example.ch", "actif": True})
+    assert reponse.status_code == 200
+    # No longer in ADMIN_EMAILS
+    assert api.get("/api/participants").status_code == 403
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+import cagnottes
+
+
+def _scope_transmis(chemin):
+    recus = []
+
+    async def app(scope, receive, send):
+        recus.append(scope)
+
+    asyncio.run(cagnottes.PrefixeMiddleware(app)({"type": "http", "path": chemin}, None, None))
+    return recus[0]
+
+
+def test_prefixe_reecrit():
+    scope = _scope_transmis("/api/c/club-42/paiements/all")
+    assert (scope["path"], scope["raw_path"], scope["cagnotte_id"]) == ("/api/paiements/all", b"/api/paiements/all", "club-42")
+
+
+@pytest.mark.parametrize("chemin", ["/api/paiements", "/api/c/Club/config", "/api/c/club"])
+def test_prefixe_ignore(chemin):
+    scope = _scope_transmis(chemin)
+    assert scope["path"] == chemin and "cagnotte_id" not in scope
+
+
+@pytest.fixture
+def club(api):
+    api.appeler(cagnottes.creer, api.db, "club", "Club de lecture", "admin@club.ch", "secret")
+    reponse = api.client.post("/api/c/club/auth/login", json={"email": "admin@club.ch", "password": "secret"})
+    assert reponse.status_code == 200 and reponse.json()['is_admin']
+    return {"Authorization": f"Bearer {reponse.json()['token']}"}
+
+
+def test_creer_refuse_id_invalide_ou_existant(api, club):
+    with pytest.raises(ValueError):
+        api.appeler(cagnottes.creer, api.db, "Club!", "Club", "a@club.ch", "secret")
+    with pytest.raises(ValueError):
+        api.appeler(cagnottes.creer, api.db, "club", "Club", "a@club.ch", "secret")
+    assert api.appeler(cagnottes.lister, api.db) == ["club", cagnottes.CAGNOTTE_DEFAUT]
+
+
+def test_donnees_isolees(api, club):
+    alice = api.participant("Alice")
+    paiement = api.paiement(alice, "2024-01")
+
+    participants = api.client.get("/api/participants", headers=club).json()['items']
+    assert [p['email'] for p in participants] == ["admin@club.ch"]
+    assert api.client.get("/api/paiements/all", headers=club).json()['items'] == []
+    assert api.client.put(f"/api/paiements/{paiement['id']}", headers=club, json={"montant": 1}).status_code == 404
+    # Deleting is idempotent: nothing to delete in this cagnotte
+    api.client.delete(f"/api/paiements/{paiement['id']}", headers=club)
+    assert api.get("/api/paiements/all").json()['items'][0]['montant'] == 50
+
+    config = {c['key']: c['value'] for c in api.client.get("/api/c/club/config").json()}
+    assert config['titre'] == "Club de lecture"
+    config = {c['key']: c['value'] for c in api.client.get("/api/config").json()}
+    assert config['titre'] == cagnottes.CONFIG_DEFAUT['titre']
+
+
+def test_jeton_d_une_autre_cagnotte_refuse(api, club):
+    assert api.client.get("/api/c/club/auth/me", headers=club).status_code == 200
+    assert api.client.get(f"/api/c/{cagnottes.CAGNOTTE_DEFAUT}/auth/me", headers=club).status_code == 403
+    assert api.get("/api/c/club/auth/me").status_code == 403
+
+
+def test_meme_email_dans_deux_cagnottes(api, club):
+    api.participant("Double", email="admin@club.ch")
+    # Each cagnotte checks its own participant
+    assert api.client.post("/api/auth/login", json={"email": "admin@club.ch", "password": "secret"}).json()['is_admin'] is False
+    moi = api.client.get("/api/auth/me", headers=club).json()
+    assert moi['nom'] == "Administrateur"
+
+
+def test_admin_d_une_cagnotte_sans_metriques(api, club):
+    assert api.client.get("/metrics", headers=club).status_code == 403
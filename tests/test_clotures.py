@@ -0,0 +1,99 @@
+import pytest
+
+import clotures
+
+DECLARATION = {"mois": "2023-05", "montant": 50, "methode": "TWINT"}
+
+
+@pytest.fixture
+def annee_2023(api):
+    alice = api.participant("Alice", mois_debut="2023-01")
+    for mois in ("2023-01", "2023-02", "2023-03"):
+        api.paiement(alice, mois)
+    bob = api.participant("Bob", mois_debut="2023-06")
+    api.paiement(bob, "2023-06", montant=30)
+    api.paiement(bob, "2024-01")
+    return alice, bob
+
+
+def _compter(api, collection, **filtre):
+    return api.appeler(api.db[collection].count_documents, filtre)
+
+
+def test_cloture(api, annee_2023):
+    alice, bob = annee_2023
+    reponse = api.post("/api/clotures/2023")
+    assert reponse.status_code == 200
+    cloture = reponse.json()
+    assert cloture['statut'] == clotures.CLOTUREE
+    assert cloture['totaux'] == {"confirme": 180, "en_attente": 0, "paiements": 4, "participants": 2,
+                                 "montant_mensuel": 50}
+
+    # The hot collection only keeps the open years
+    assert _compter(api, "paiements_archive") == 4
+    assert _compter(api, "paiements", mois={"$regex": "^2023"}) == 0
+    assert _compter(api, "paiements") == 1
+
+    figures = {l['nom']: l for l in api.get("/api/clotures/2023").json()['participants']}
+    assert (figures["Alice"]['confirme'], figures["Alice"]['attendu'], figures["Alice"]['mois_en_retard']) == (150, 600, 9)
+    assert (figures["Bob"]['mois_attendus'], figures["Bob"]['mois_regles']) == (7, 1)
+    assert [c['annee'] for c in api.get("/api/clotures").json()] == [2023]
+
+    page = api.get("/api/paiements/all", params={"mois": "2023"}).json()
+    assert len(page['items']) == 4
+
+
+def test_annee_cloturee_en_lecture_seule(api, annee_2023):
+    alice, _ = annee_2023
+    assert api.post("/api/clotures/2023").status_code == 200
+    paiement_id = api.get("/api/paiements/all", params={"mois": "2023"}).json()['items'][0]['id']
+
+    assert api.post("/api/paiements", alice, json=DECLARATION).status_code == 400
+    assert api.put(f"/api/paiements/{paiement_id}", json={"montant": 10}).status_code == 400
+    assert api.delete(f"/api/paiements/{paiement_id}").status_code == 400
+    assert api.post("/api/paiements/confirm-month", params={"mois": "2023-05"}).status_code == 400
+    assert api.post("/api/clotures/2023").status_code == 400
+
+
+def test_paiements_en_attente_refusent_la_cloture(api, annee_2023):
+    alice, _ = annee_2023
+    api.paiement(alice, "2023-04", statut="en_attente")
+    reponse = api.post("/api/clotures/2023")
+    assert reponse.status_code == 400
+    assert "1 paiement(s) en attente" in reponse.json()['detail']
+    # The marker is removed: the year stays open
+    assert _compter(api, "clotures") == 0
+    assert api.post("/api/paiements", alice, json=DECLARATION).status_code == 200
+
+
+def test_annee_en_cours_non_cloturable(api):
+    assert api.post("/api/clotures/2999").status_code == 400
+
+
+def test_cloture_interrompue_reprise(api, annee_2023):
+    api.appeler(api.db.clotures.insert_one, {"cagnotte_id": api.admin['cagnotte_id'], "annee": 2023,
+                                             "statut": clotures.EN_COURS, "debut": "2024-01-01T00:00:00+00:00"})
+    cloture = api.post("/api/clotures/2023").json()
+    assert cloture['statut'] == clotures.CLOTUREE and cloture['totaux']['paiements'] == 4
+    assert _compter(api, "paiements_archive") == 4
+
+
+def test_declaration_pendant_une_cloture_retiree(api, annee_2023, monkeypatch):
+    alice, _ = annee_2023
+    verifier_ouvert = clotures.verifier_ouvert
+    appels = []
+
+    async def cloture_concurrente(db, cagnotte_id, *mois):
+        # The close writes its marker between the check and the insert
+        if not appels:
+            await verifier_ouvert(db, cagnotte_id, *mois)
+            await db.clotures.insert_one({"cagnotte_id": cagnotte_id, "annee": 2023, "statut": clotures.EN_COURS})
+        appels.append(mois)
+        if len(appels) > 1:
+            await verifier_ouvert(db, cagnotte_id, *mois)
+
+    monkeypatch.setattr(clotures, "verifier_ouvert", cloture_concurrente)
+    assert api.post("/api/paiements", alice, json=DECLARATION).status_code == 400
+    assert len(appels) == 2
+    assert _compter(api, "paiements", mois="2023-05") == 0
+    assert _compter(api, "paiement_rollups", mois="2023-05") == 0
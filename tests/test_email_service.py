@@ -0,0 +1,99 @@
+import asyncio
+import base64
+import email
+import email.header
+import socket
+
+import pytest
+from aiosmtpd.controller import Controller
+
+import email_service
+from email_service import OutgoingMessage, SMTPPool, build_message
+
+
+class Boite:
+    """aiosmtpd handler keeping the messages; some recipients are refused"""
+
+    def __init__(self, temporaires=(), definitifs=()):
+        self.temporaires = dict.fromkeys(temporaires, 1)  # refused once with a 451
+        self.definitifs = set(definitifs)
+        self.messages = []
+        self.connexions = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connexions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.definitifs:
+            return "550 Boîte inconnue"
+        if self.temporaires.get(address):
+            self.temporaires[address] -= 1
+            return "451 Réessayez plus tard"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos[0], envelope.content))
+        return "250 Message accepted"
+
+
+def _port_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp():
+    boite = Boite(temporaires=["lent@example.ch"], definitifs=["inconnu@example.ch"])
+    controleur = Controller(boite, hostname="127.0.0.1", port=_port_libre())
+    controleur.start()
+    pool = SMTPPool("127.0.0.1", controleur.port, None, None, starttls=False, size=2, backoff=0.01)
+    yield boite, pool
+    pool.close()
+    controleur.stop()
+
+
+def _message(to):
+    return build_message(to, "Rappel", f"<p>{to}</p>")
+
+
+def test_envoi_par_lots_concurrents(smtp):
+    boite, pool = smtp
+    destinataires = [f"p{i}@example.ch" for i in range(7)]
+    resultats = asyncio.run(pool.send_many([_message(to) for to in destinataires], batch_size=2))
+    assert resultats == [True] * 7
+    assert sorted(to for to, _ in boite.messages) == sorted(destinataires)
+    assert boite.connexions <= 4  # one connection per batch at most, reused when idle
+
+
+def test_echec_temporaire_reessaye_echec_definitif_isole(smtp):
+    boite, pool = smtp
+    messages = [_message(to) for to in ("a@example.ch", "lent@example.ch", "inconnu@example.ch", "b@example.ch")]
+    assert pool.send_batch_sync(messages) == [True, True, False, True]
+    assert [to for to, _ in boite.messages] == ["a@example.ch", "lent@example.ch", "b@example.ch"]
+
+
+def test_est_transitoire():
+    import smtplib
+    assert email_service._est_transitoire(smtplib.SMTPResponseException(421, b"busy"))
+    assert not email_service._est_transitoire(smtplib.SMTPResponseException(554, b"no"))
+    assert email_service._est_transitoire(smtplib.SMTPServerDisconnected())
+    assert not email_service._est_transitoire(smtplib.SMTPRecipientsRefused({"a": (550, b"no")}))
+
+
+def test_message_construit():
+    message = build_message("alice@example.ch", "Rappel de paiement – Mars 2024", "<p>Bonjour Zoé</p>")
+    assert isinstance(message, OutgoingMessage) and message.to == "alice@example.ch"
+    analyse = email.message_from_bytes(message.data)
+    assert analyse["To"] == "alice@example.ch"
+    assert str(email.header.make_header(email.header.decode_header(analyse["Subject"]))) == "Rappel de paiement – Mars 2024"
+    partie = analyse.get_payload()[0]
+    assert base64.b64decode(partie.get_payload()).decode("utf-8") == "<p>Bonjour Zoé</p>"
+
+
+def test_adresse_avec_saut_de_ligne_refusee():
+    with pytest.raises(ValueError):
+        build_message("a@example.ch\r\nBcc: b@example.ch", "Sujet", "")
@@ -0,0 +1,60 @@
+import base64
+import email
+import email.header
+
+import pytest
+
+import email_service
+from email_templates import Template
+
+
+def test_valeurs_echappees():
+    t = Template("<p>Bonjour {{ nom }}</p>")
+    assert t.render({"nom": "<b>Tom & \"Jerry\"</b>"}) == \
+        "<p>Bonjour &lt;b&gt;Tom &amp; &quot;Jerry&quot;&lt;/b&gt;</p>"
+
+
+def test_safe_non_echappe():
+    t = Template("<ul>{{ lignes|safe }}</ul><p>{{ titre }}</p>")
+    assert t.render({"lignes": "<li>a</li>", "titre": "<i>"}) == "<ul><li>a</li></ul><p>&lt;i&gt;</p>"
+
+
+def test_format():
+    t = Template("{{montant:.2f}} CHF, {{ n:>3 }}|")
+    assert t.render({"montant": 12.5, "n": 7}) == "12.50 CHF,   7|"
+
+
+def test_parties_statiques_intactes():
+    source = "<style>.a { color: red; }</style>{{ x }}{ pas un champ }"
+    assert Template(source).render({"x": 1}) == "<style>.a { color: red; }</style>1{ pas un champ }"
+
+
+def test_valeur_manquante():
+    with pytest.raises(KeyError):
+        Template("{{ absent }}").render({})
+
+
+def test_render_many():
+    assert Template("{{ a }};").render_many([{"a": 1}, {"a": "<"}]) == ["1;", "&lt;;"]
+
+
+def test_sujet_non_echappe():
+    assert Template("Rappel ({{ mois }})", html=False).render({"mois": "Mars & Avril l'an <2>"}) == \
+        "Rappel (Mars & Avril l'an <2>)"
+
+
+def test_sujets_des_emails_en_texte_brut():
+    message = email_service.build_payment_reminder("Zoé & Léa", "zoe@example.ch", "Mars d'été", 50.0, "CHF")
+    analyse = email.message_from_bytes(message.data)
+    sujet = str(email.header.make_header(email.header.decode_header(analyse["Subject"])))
+    assert sujet == "Rappel - Paiement Cagnotte Cadre SIC (Mars d'été)"
+    html = base64.b64decode(analyse.get_payload()[0].get_payload()).decode("utf-8")
+    assert "Bonjour Zoé &amp; Léa," in html
+
+
+def test_lot_de_rappels_avec_adresse_invalide():
+    lot = email_service.build_payment_reminders([
+        {"participant_name": n, "participant_email": e, "mois": "2024-03", "montant": 50.0, "devise": "CHF"}
+        for n, e in (("A", "a@example.ch"), ("Zoé", "zoé@example.ch"), ("B", "b@example.ch"))
+    ])
+    assert [m.to if m else None for m in lot] == ["a@example.ch", None, "b@example.ch"]
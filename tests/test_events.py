@@ -0,0 +1,136 @@
+import pytest
+
+import events
+from events import EventBus
+
+
+def _recus(abonne):
+    recus = []
+    while not abonne.file.empty():
+        evenement = abonne.file.get_nowait()
+        recus.append(evenement and (evenement.type, evenement.data))
+    return recus
+
+
+def test_bus_filtre_par_cagnotte_et_participant():
+    bus = EventBus()
+    admin = bus.abonner("a", "admin", is_admin=True)
+    alice = bus.abonner("a", "alice", is_admin=False)
+    autre = bus.abonner("b", "admin-b", is_admin=True)
+
+    bus.publier("kpi", {"n": 1}, "a", "alice")
+    bus.publier("kpi", {"n": 2}, "a", "bob")
+    bus.publier("resync", {}, "a")
+    bus.publier("annonce", {}, None, "alice")
+
+    assert _recus(admin) == [("kpi", {"n": 1}), ("kpi", {"n": 2}), ("resync", {}), ("annonce", {})]
+    assert _recus(alice) == [("kpi", {"n": 1}), ("annonce", {})]
+    assert _recus(autre) == [("annonce", {})]
+
+
+def test_file_pleine_vide_le_retard():
+    bus = EventBus(taille_file=2)
+    abonne = bus.abonner("a", "admin", is_admin=True)
+    for n in range(3):
+        bus.publier("kpi", {"n": n}, "a")
+    assert _recus(abonne) == [("resync", {})]
+
+
+def test_limites_d_abonnes():
+    bus = EventBus(max_abonnes=3, max_par_cagnotte=2)
+    premiers = [bus.abonner("a", f"u{n}", is_admin=False) for n in range(2)]
+    assert bus.abonner("a", "u2", is_admin=False) is None
+    assert bus.abonner("b", "v0", is_admin=False) is not None
+    assert bus.abonner("c", "w0", is_admin=False) is None
+
+    bus.desabonner(premiers[0])
+    bus.desabonner(premiers[0])
+    assert len(bus) == 2
+    assert bus.abonner("a", "u3", is_admin=False) is not None
+
+
+def test_fermer_termine_les_flux():
+    bus = EventBus()
+    abonne = bus.abonner("a", "admin", is_admin=True)
+    bus.fermer()
+    assert _recus(abonne) == [None]
+
+
+def test_publier_paiements():
+    bus = EventBus()
+    admin = bus.abonner("a", "admin", is_admin=True)
+    paiements = [
+        {"id": "p1", "cagnotte_id": "a", "participant_id": "alice", "mois": "2024-02", "montant": 50,
+         "statut": "confirme", "methode": "TWINT", "versement": True},
+        {"id": "p2", "cagnotte_id": "a", "participant_id": "alice", "mois": "2024-01", "montant": 50,
+         "statut": "confirme", "methode": "TWINT"},
+    ]
+    events.publier_paiements(bus, "confirmed", paiements)
+    recus = _recus(admin)
+    assert [t for t, _ in recus] == ["paiement.confirmed", "paiement.confirmed", "kpi"]
+    assert "versement" not in recus[0][1] and "cagnotte_id" not in recus[0][1]
+    assert recus[2][1] == {"participant_id": "alice", "mois": ["2024-01", "2024-02"]}
+
+
+def test_formater():
+    evenement = events.Evenement(7, "resync", {"raison": "clôture"}, "a", None)
+    assert events.formater(evenement) == 'id: 7\ndata: {"type":"resync","raison":"clôture"}\n\n'
+
+
+@pytest.mark.parametrize("change, attendu", [
+    ({"operationType": "insert", "fullDocument": {"id": "p1"}}, ("created", {"id": "p1"})),
+    ({"operationType": "update", "fullDocument": {"id": "p1"},
+      "updateDescription": {"updatedFields": {"statut": "confirme"}}}, ("confirmed", {"id": "p1"})),
+    ({"operationType": "update", "fullDocument": {"id": "p1"},
+      "updateDescription": {"updatedFields": {"montant": 40}}}, ("updated", {"id": "p1"})),
+    ({"operationType": "update", "fullDocument": None}, None),
+    ({"operationType": "delete", "fullDocumentBeforeChange": {"id": "p1"}}, ("deleted", {"id": "p1"})),
+    ({"operationType": "delete"}, None),
+])
+def test_depuis_changement(change, attendu):
+    assert events._depuis_changement(change) == attendu
+
+
+@pytest.mark.parametrize("change, attendu", [
+    ({"operationType": "update", "fullDocument": {"cagnotte_id": "a"},
+      "updateDescription": {"updatedFields": {"statut": "cloturee"}}}, "a"),
+    ({"operationType": "update", "fullDocument": {"cagnotte_id": "a"},
+      "updateDescription": {"updatedFields": {"totaux": {}}}}, None),
+    ({"operationType": "insert", "fullDocument": {"cagnotte_id": "a", "statut": "en_cours"}}, None),
+])
+def test_cagnotte_cloturee(change, attendu):
+    assert events._cagnotte_cloturee(change) == attendu
+
+
+@pytest.fixture
+def abonne_admin(api):
+    abonne = api.server.event_bus.abonner(api.admin['cagnotte_id'], api.admin['id'], is_admin=True)
+    yield abonne
+    api.server.event_bus.desabonner(abonne)
+
+
+def test_cloture_envoie_resync(api, abonne_admin):
+    assert api.post("/api/clotures/2023").status_code == 200
+    assert ("resync", {}) in _recus(abonne_admin)
+
+
+def test_cloture_sans_resync_locale_avec_change_stream(api, abonne_admin, monkeypatch):
+    # Each worker's change stream sends it when the close ends
+    monkeypatch.setattr(events, "EVENTS_SOURCE", "change_stream")
+    assert api.post("/api/clotures/2023").status_code == 200
+    assert _recus(abonne_admin) == []
+
+
+def test_ticket_d_evenements(api):
+    reponse = api.post("/api/events/ticket")
+    assert reponse.status_code == 200
+    ticket = reponse.json()['ticket']
+
+    principal = api.appeler(api.server.principal_depuis_token, ticket, usage="events")
+    assert principal.user['id'] == api.admin['id'] and principal.is_admin
+
+    # A ticket is not a session token, and the other way round
+    assert api.client.get("/api/paiements", headers={"Authorization": f"Bearer {ticket}"}).status_code == 401
+    session = api.entetes()["Authorization"].removeprefix("Bearer ")
+    assert api.client.get("/api/events", params={"ticket": session}).status_code == 401
+    assert api.client.get("/api/events").status_code == 401
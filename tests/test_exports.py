@@ -0,0 +1,65 @@
+import asyncio
+import csv
+import gzip
+import io
+
+import exports
+
+
+async def _lignes(lignes):
+    for ligne in lignes:
+        yield ligne
+
+
+async def _liste(chunks):
+    return [chunk async for chunk in chunks]
+
+
+def test_csv_par_morceaux(monkeypatch):
+    monkeypatch.setattr(exports, "LIGNES_PAR_CHUNK", 2)
+    lignes = [["Dupont, Jean", 50.0], ['Il a dit "oui"', None], ["Zoé", 12.35]]
+    chunks = asyncio.run(_liste(exports.iter_csv(["Nom", "Montant"], _lignes(lignes))))
+    assert len(chunks) == 2
+    texte = b"".join(chunks).decode("utf-8")
+    assert list(csv.reader(io.StringIO(texte))) == [["Nom", "Montant"], ["Dupont, Jean", "50.0"],
+                                                    ['Il a dit "oui"', ""], ["Zoé", "12.35"]]
+
+
+def test_gzip_en_flux():
+    morceaux = [b"a,b\n" * 1000, b"c,d\n" * 1000]
+    compresse = b"".join(asyncio.run(_liste(exports.iter_gzip(_lignes(morceaux)))))
+    assert gzip.decompress(compresse) == b"".join(morceaux)
+
+
+def test_export_sans_plafond(api):
+    alice = api.participant("Alice")
+    paiements = [
+        {"id": f"p{i}", "cagnotte_id": alice['cagnotte_id'], "participant_id": alice['id'], "mois": "2024-01",
+         "montant": 1.0, "methode": "TWINT", "raison": None, "statut": "confirme", "date": f"2024-01-01T00:00:{i:08d}"}
+        for i in range(10_050)
+    ]
+    api.appeler(api.db.paiements.insert_many, paiements)
+
+    reponse = api.get("/api/export/csv-all", headers={"Accept-Encoding": "gzip"})
+    assert reponse.status_code == 200
+    assert reponse.headers["content-encoding"] == "gzip"
+    assert reponse.headers["content-type"].startswith("text/csv")
+    lignes = list(csv.reader(io.StringIO(reponse.text)))
+    assert lignes[0][0] == "Participant"
+    assert len(lignes) == 10_051
+    assert lignes[1][:3] == ["Alice", "2024-01", "1.0"]
+
+    reponse = api.get("/api/export/csv-all", params={"annee": 2023}, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in reponse.headers
+    assert reponse.text.count("\n") == 1
+    assert 'filename="tous_paiements_2023.csv"' in reponse.headers["content-disposition"]
+
+
+def test_export_d_un_participant(api):
+    alice = api.participant("Alice")
+    bob = api.participant("Bob")
+    api.paiement(alice, "2024-02")
+    api.paiement(bob, "2024-02")
+    reponse = api.get(f"/api/export/csv/{alice['id']}", user=alice)
+    assert reponse.text.count("\n") == 2
+    assert api.get(f"/api/export/csv/{alice['id']}", user=bob).status_code == 403
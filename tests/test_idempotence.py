@@ -0,0 +1,156 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import idempotence
+from idempotence import Idempotence
+
+
+def _compteur():
+    appels = []
+
+    async def fonction():
+        appels.append(1)
+        await asyncio.sleep(0)
+        return {"id": len(appels)}
+    return appels, fonction
+
+
+def test_rejoue_le_premier_resultat():
+    memoire = Idempotence()
+    appels, fonction = _compteur()
+
+    async def scenario():
+        premier = await memoire.executer("k", "corps", fonction)
+        second = await memoire.executer("k", "corps", fonction)
+        return premier, second
+    assert asyncio.run(scenario()) == ({"id": 1}, {"id": 1})
+    assert len(appels) == 1
+    assert memoire.rejoues == 1
+
+
+def test_sans_cle_toujours_execute():
+    memoire = Idempotence()
+    appels, fonction = _compteur()
+    asyncio.run(memoire.executer(None, "corps", fonction))
+    asyncio.run(memoire.executer(None, "corps", fonction))
+    assert len(appels) == 2
+    assert len(memoire) == 0
+
+
+def test_cle_reutilisee_pour_un_autre_corps():
+    memoire = Idempotence()
+    _, fonction = _compteur()
+    asyncio.run(memoire.executer("k", "corps", fonction))
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(memoire.executer("k", "autre", fonction))
+    assert e.value.status_code == 400
+
+
+def test_expiration(monkeypatch):
+    instant = [0.0]
+    monkeypatch.setattr(idempotence, "time", SimpleNamespace(monotonic=lambda: instant[0]))
+    memoire = Idempotence(ttl=10)
+    appels, fonction = _compteur()
+    asyncio.run(memoire.executer("k", "corps", fonction))
+    instant[0] = 9.9
+    asyncio.run(memoire.executer("k", "corps", fonction))
+    instant[0] = 10.0
+    assert asyncio.run(memoire.executer("k", "autre corps", fonction)) == {"id": 2}
+    assert len(appels) == 2
+
+
+def test_cles_les_plus_anciennes_oubliees():
+    memoire = Idempotence(max_cles=2)
+    appels, fonction = _compteur()
+    for cle in ("a", "b", "c"):
+        asyncio.run(memoire.executer(cle, "corps", fonction))
+    assert len(memoire) == 2
+    asyncio.run(memoire.executer("c", "corps", fonction))
+    asyncio.run(memoire.executer("a", "corps", fonction))
+    assert len(appels) == 4
+
+
+def test_requetes_simultanees_executees_une_fois():
+    memoire = Idempotence()
+    appels, fonction = _compteur()
+
+    async def scenario():
+        return await asyncio.gather(*[memoire.executer("k", "corps", fonction) for _ in range(5)])
+    assert asyncio.run(scenario()) == [{"id": 1}] * 5
+    assert len(appels) == 1
+    assert memoire._verrous == {}
+
+
+def test_echec_non_retenu():
+    memoire = Idempotence()
+    appels = []
+
+    async def fonction():
+        appels.append(1)
+        if len(appels) == 1:
+            raise HTTPException(status_code=400, detail="refus")
+        return "ok"
+    with pytest.raises(HTTPException):
+        asyncio.run(memoire.executer("k", "corps", fonction))
+    assert asyncio.run(memoire.executer("k", "corps", fonction)) == "ok"
+    assert len(appels) == 2
+
+
+@pytest.mark.parametrize("valeur", ["", "x" * (idempotence.IDEMPOTENCE_LONGUEUR_MAX + 1)])
+def test_cle_invalide(valeur):
+    with pytest.raises(HTTPException) as e:
+        Idempotence.cle("c1", "p1", valeur)
+    assert e.value.status_code == 400
+
+
+def test_cle_par_cagnotte_et_participant():
+    assert Idempotence.cle("c1", "p1", "abc") != Idempotence.cle("c2", "p1", "abc")
+
+
+DECLARATION = {"mois": "2024-02", "montant": 50, "methode": "TWINT"}
+
+
+def _declarer(api, user, cle=None, **champs):
+    entetes = {"Idempotency-Key": cle} if cle else {}
+    return api.post("/api/paiements", user, json={**DECLARATION, **champs}, headers=entetes)
+
+
+def _declarations(api, user):
+    return api.appeler(api.db.paiements.count_documents, {"participant_id": user['id']})
+
+
+def test_declaration_rejouee(api):
+    alice = api.participant("Alice")
+    premiere = _declarer(api, alice, "cle-1")
+    seconde = _declarer(api, alice, "cle-1")
+    assert premiere.status_code == seconde.status_code == 200
+    assert premiere.json() == seconde.json()
+    assert _declarations(api, alice) == 1
+    assert idempotence.memoire.rejoues == 1
+
+    # Same key, other body
+    assert _declarer(api, alice, "cle-1", montant=40).status_code == 400
+    # Same key, other participant
+    assert _declarer(api, api.participant("Bob"), "cle-1").status_code == 200
+
+
+def test_une_declaration_par_mois(api):
+    alice = api.participant("Alice")
+    assert _declarer(api, alice).status_code == 200
+    for cle in (None, "cle-2"):
+        reponse = _declarer(api, alice, cle, montant=40)
+        assert reponse.status_code == 400
+        assert reponse.json()['detail'] == api.server.DOUBLON_VERSEMENT
+    assert _declarations(api, alice) == 1
+    assert _declarer(api, alice, mois="2024-03").status_code == 200
+
+
+def test_depenses_hors_contrainte(api):
+    alice = api.participant("Alice")
+    api.paiement(alice, "2024-02", montant=12, methode="DEPENSE")
+    api.paiement(alice, "2024-02", montant=8, methode="DEPENSE")
+    assert _declarer(api, alice).status_code == 200
+    assert _declarations(api, alice) == 3
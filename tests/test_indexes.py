@@ -0,0 +1,41 @@
+import indexes
+from indexes import filtre_annee
+
+
+def _dans(mois, filtre):
+    return filtre["$gte"] <= mois < filtre["$lt"]
+
+
+def test_filtre_annee():
+    filtre = filtre_annee(2024)
+    assert [m for m in ("2023-12", "2024-01", "2024-12", "2025-01") if _dans(m, filtre)] == ["2024-01", "2024-12"]
+
+
+def test_plans_collscan():
+    explain_find = {"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}},
+                                     "rejectedPlans": [{"stage": "COLLSCAN"}]}}
+    explain_aggregate = {"stages": [{"$cursor": {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}}]}
+    assert not any(indexes._contient_collscan(p) for p in indexes._plans_retenus(explain_find))
+    assert any(indexes._contient_collscan(p) for p in indexes._plans_retenus(explain_aggregate))
+
+
+def test_index_crees_au_demarrage(api):
+    for collection, specs in indexes.INDEXES.items():
+        existants = api.appeler(api.db[collection].index_information)
+        for nom, cles, _ in specs:
+            assert list(existants[nom]['key']) == cles
+    assert api.appeler(indexes.ensure_indexes, api.db)  # idempotent
+
+
+def test_requetes_critiques_sans_collscan(api):
+    assert api.appeler(indexes.verifier_plans, api.db, 2024) == []
+
+
+def test_paiements_filtres_par_annee(api):
+    alice = api.participant("Alice")
+    for mois in ("2023-12", "2024-01", "2024-12", "2025-01"):
+        api.paiement(alice, mois)
+    page = api.get("/api/paiements/all", params={"mois": "2024"}).json()
+    assert sorted(p['mois'] for p in page['items']) == ["2024-01", "2024-12"]
+    assert page['total'] == 2
+    assert api.get("/api/paiements/all", params={"mois": "24"}).status_code == 400
@@ -0,0 +1,127 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import jobs
+from jobs import JobWorker
+
+
+class Envois:
+    """Stand-in for send_emails: results given per address, recorded in order"""
+
+    def __init__(self, echecs=()):
+        self.echecs = set(echecs)
+        self.adresses = []
+
+    async def __call__(self, messages):
+        self.adresses += [m.to for m in messages]
+        return [m.to not in self.echecs for m in messages]
+
+
+@pytest.fixture
+def envois(monkeypatch):
+    envois = Envois(echecs=["ko@example.ch"])
+    monkeypatch.setattr(jobs, "send_emails", envois)
+    monkeypatch.setattr(jobs, "JOB_RETRY_SECONDS", 0)
+    return envois
+
+
+@pytest.fixture
+def sans_worker(api):
+    """Stop the app's own worker, which would race the workers of the test"""
+    api.appeler(api.server.job_worker.stop)
+    yield
+
+    async def redemarrer():
+        api.server.job_worker.start()
+    api.appeler(redemarrer)
+
+
+def _rappel(email):
+    return {"email": email, "params": {"participant_name": "P", "participant_email": email, "mois": "2024-03",
+                                       "montant": 50.0, "devise": "CHF"}}
+
+
+def _job(api, job_id):
+    return api.appeler(api.db.jobs.find_one, {"id": job_id}, {"_id": 0})
+
+
+def _traiter(api, worker):
+    job = api.appeler(worker._reclamer)
+    assert job is not None
+    api.appeler(worker.traiter, job)
+    return _job(api, job['id'])
+
+
+def test_type_inconnu(api):
+    with pytest.raises(ValueError):
+        api.appeler(jobs.enqueue, api.db, "defaut", "inconnu", [])
+
+
+def test_job_traite_avec_reessais(api, envois, sans_worker):
+    job = api.appeler(jobs.enqueue, api.db, "defaut", "rappels", [_rappel(e) for e in ("a@example.ch", "ko@example.ch")])
+    job = _traiter(api, JobWorker(api.db, lot=10))
+    assert job['statut'] == "termine" and job['lease_until'] is None
+    assert envois.adresses.count("a@example.ch") == 1
+    assert envois.adresses.count("ko@example.ch") == jobs.JOB_MAX_TENTATIVES
+    resume = jobs.resume_job(job)
+    assert (resume['total'], resume['sent'], resume['failed'], resume['pending']) == (2, 1, 1, 0)
+    assert resume['errors'] == ["ko@example.ch"]
+
+
+def test_envoi_interrompu_non_renvoye(api, envois, sans_worker):
+    job = api.appeler(jobs.enqueue, api.db, "defaut", "rappels", [_rappel(e) for e in ("a@example.ch", "b@example.ch")])
+    api.appeler(api.db.jobs.update_one, {"id": job['id']}, {"$set": {"destinataires.0.statut": "envoi"}})
+    job = _traiter(api, JobWorker(api.db))
+    assert envois.adresses == ["b@example.ch"]
+    assert [d['statut'] for d in job['destinataires']] == ["echoue", "envoye"]
+
+
+def test_bail_expire_repris(api, envois, sans_worker):
+    job = api.appeler(jobs.enqueue, api.db, "defaut", "rappels", [_rappel("a@example.ch")])
+    premier, second = JobWorker(api.db), JobWorker(api.db)
+    assert api.appeler(premier._reclamer)['id'] == job['id']
+    assert api.appeler(second._reclamer) is None  # lease still running
+    expire = (datetime.now(timezone.utc) - timedelta(seconds=1)).isoformat()
+    api.appeler(api.db.jobs.update_one, {"id": job['id']}, {"$set": {"lease_until": expire}})
+    assert api.appeler(second._reclamer)['worker_id'] == second.worker_id
+
+
+def test_bail_perdu_arrete_le_worker(api, envois, sans_worker):
+    job = api.appeler(jobs.enqueue, api.db, "defaut", "rappels", [_rappel("a@example.ch")])
+    worker = JobWorker(api.db)
+    job = api.appeler(worker._reclamer)
+    api.appeler(api.db.jobs.update_one, {"id": job['id']}, {"$set": {"worker_id": "autre"}})
+    api.appeler(worker.traiter, job)
+    assert envois.adresses == []
+    assert _job(api, job['id'])['statut'] == "en_cours"
+
+
+def test_rappels_envoyes_en_arriere_plan(api, envois):
+    api.participant("Alice", email="a@example.ch", mois_debut="2024-01")
+    reponse = api.post("/api/notifications/send-reminders", params={"mois": "2024-03"}).json()
+    assert reponse['total'] == 1  # the admin only starts this month
+
+    limite = time.monotonic() + 10
+    while (job := api.get(f"/api/jobs/{reponse['job_id']}").json())['statut'] != "termine":
+        assert time.monotonic() < limite, job
+        time.sleep(0.05)
+    assert (job['sent'], job['failed']) == (1, 0)
+    assert envois.adresses == ["a@example.ch"]
+
+
+def test_adresse_accentuee_n_echoue_que_son_message(api, envois):
+    reponse = api.post("/api/participants", json={"nom": "Zoé", "email": "zoé@example.ch", "mois_debut": "2024-01"})
+    assert reponse.status_code == 200
+    api.participant("Alice", email="a@example.ch", mois_debut="2024-01")
+    job_id = api.post("/api/notifications/send-reminders", params={"mois": "2024-03"}).json()['job_id']
+
+    limite = time.monotonic() + 10
+    while (job := api.get(f"/api/jobs/{job_id}").json())['statut'] != "termine":
+        assert time.monotonic() < limite, job
+        time.sleep(0.05)
+    assert (job['sent'], job['failed'], job['errors']) == (1, 1, ["zoé@example.ch"])
+    assert envois.adresses == ["a@example.ch"]
+    destinataires = _job(api, job_id)['destinataires']
+    assert [d['erreur'] for d in destinataires if d['statut'] == "echoue"] == ["Adresse email invalide"]
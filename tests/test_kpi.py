@@ -0,0 +1,73 @@
+"""KPI routes, computed from the rollups of the current year"""
+from datetime import datetime, timezone
+
+import pytest
+
+MAINTENANT = datetime.now(timezone.utc)
+ANNEE = MAINTENANT.year
+MOIS_ACTUEL = MAINTENANT.strftime("%Y-%m")
+MOIS_ANNEE = [f"{ANNEE}-{m:02d}" for m in range(1, MAINTENANT.month + 1)]
+
+
+@pytest.fixture
+def cagnotte(api):
+    """Alice is up to date, Bob never paid since last year, Carol's paiement of the month is pending"""
+    alice = api.participant("Alice", mois_debut=f"{ANNEE}-01")
+    for mois in MOIS_ANNEE:
+        api.paiement(alice, mois)
+    api.paiement(alice, f"{ANNEE}-01", montant=12.5, methode="DEPENSE")
+    bob = api.participant("Bob", mois_debut=f"{ANNEE - 1}-06")
+    carol = api.participant("Carol", mois_debut=MOIS_ACTUEL)
+    api.paiement(carol, MOIS_ACTUEL, statut="en_attente")
+    ancien = api.participant("Ancien", mois_debut=f"{ANNEE}-01", actif=False)
+    api.paiement(ancien, MOIS_ACTUEL)
+    return {"alice": alice, "bob": bob, "carol": carol, "ancien": ancien}
+
+
+def test_kpi_admin(api, cagnotte):
+    reponse = api.get("/api/kpi/admin")
+    assert reponse.status_code == 200
+    kpis = {k['participant_id']: k for k in reponse.json()}
+    assert cagnotte["ancien"]['id'] not in kpis
+    nb_mois = len(MOIS_ANNEE)
+
+    alice = kpis[cagnotte["alice"]['id']]
+    assert alice['confirme_annee'] == 50 * nb_mois + 12.5
+    assert alice['manquant'] == 0
+    assert alice['progression'] == pytest.approx(100 + 12.5 * 100 / (50 * nb_mois))
+    assert not alice['en_retard']
+
+    bob = kpis[cagnotte["bob"]['id']]
+    assert (bob['confirme_annee'], bob['manquant'], bob['progression']) == (0, 50 * nb_mois, 0)
+    assert bob['en_retard']  # months of last year are unpaid
+
+    carol = kpis[cagnotte["carol"]['id']]
+    assert (carol['confirme_annee'], carol['en_attente'], carol['manquant']) == (0, 50, 50)
+    assert not carol['en_retard']  # the current month is not late yet
+
+
+def test_kpi_admin_suit_les_ecritures(api, cagnotte):
+    api.put("/api/config/montant_mensuel", params={"value": "20"})
+    paiement = api.get("/api/paiements/all", params={"participant_id": cagnotte["carol"]['id']}).json()['items'][0]
+    assert api.put(f"/api/paiements/{paiement['id']}", json={"statut": "confirme", "montant": 30}).status_code == 200
+
+    carol = next(k for k in api.get("/api/kpi/admin").json() if k['participant_id'] == cagnotte["carol"]['id'])
+    assert (carol['confirme_annee'], carol['en_attente'], carol['manquant'], carol['progression']) == (30, 0, 0, 150)
+
+
+
+def test_kpi_dashboard(api, cagnotte):
+    stats = api.get("/api/kpi/dashboard").json()
+
+    evolution = stats['monthly_evolution']
+    assert len(evolution) == 12 and evolution[-1]['month'] == MOIS_ACTUEL
+    attendus = {mois: 50.0 for mois in MOIS_ANNEE}
+    attendus[f"{ANNEE}-01"] += 12.5
+    attendus[MOIS_ACTUEL] += 50  # inactive participants' paiements still count
+    assert {e['month']: e['total'] for e in evolution} == {e['month']: attendus.get(e['month'], 0) for e in evolution}
+
+    # Admin, Alice, Bob and Carol; only Bob is late
+    assert stats['total_participants'] == 4
+    assert stats['on_time_count'] == 3
+    assert stats['ponctuality_rate'] == 75
+    assert stats['average_per_participant'] == pytest.approx((50 * len(MOIS_ANNEE) + 12.5) / 4)
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from kpi_matrice import EN_ATTENTE, MANQUANT, NON_ATTENDU, REGLE, Matrice, index_mois, mois_depuis_index, premier_mois
+
+
+def _rollup(participant_id, mois, confirme=0.0, en_attente=0.0):
+    return {
+        "participant_id": participant_id, "mois": mois,
+        "montants": {"confirme": confirme, "en_attente": en_attente},
+        "nombres": {"confirme": int(confirme > 0), "en_attente": int(en_attente > 0)},
+    }
+
+
+def _matrice():
+    participants = [{"id": "a", "mois_debut": "2023-11"}, {"id": "b", "mois_debut": "2024-01"}, {"id": "c"}]
+    rollups = [
+        _rollup("a", "2023-11", confirme=50),
+        _rollup("a", "2023-12", confirme=50),
+        _rollup("a", "2024-01", en_attente=50),
+        _rollup("b", "2024-01", confirme=30),
+        _rollup("b", "2024-02", confirme=30),
+        _rollup("inconnu", "2023-12", confirme=99),
+        _rollup("c", "2025-06", confirme=99),  # outside the range
+    ]
+    return Matrice(participants, "2023-11", "2024-02", rollups, defaut_debut="2023-12")
+
+
+def test_index_mois_aller_retour():
+    assert index_mois("2024-01") - index_mois("2023-12") == 1
+    assert index_mois("2024-03-15") == index_mois("2024-03")
+    for mois in ("2023-12", "2024-01", "1999-07"):
+        assert mois_depuis_index(index_mois(mois)) == mois
+
+
+def test_colonnes_sur_plusieurs_annees():
+    m = _matrice()
+    assert m.mois == ["2023-11", "2023-12", "2024-01", "2024-02"]
+    assert m.colonnes("2024-01") == slice(2, 4)
+    assert m.colonnes(fin="2023-12") == slice(0, 2)
+    assert m.mois[m.colonnes("2020-01", "2030-01")] == m.mois
+
+
+def test_totaux():
+    m = _matrice()
+    np.testing.assert_array_equal(m.total_confirme(), [100, 60, 0])
+    np.testing.assert_array_equal(m.total_en_attente(), [50, 0, 0])
+    np.testing.assert_array_equal(m.total_confirme("2024-01"), [0, 60, 0])
+    np.testing.assert_array_equal(m.nb_mois_attendus(), [4, 2, 3])
+
+
+def test_retards():
+    m = _matrice()
+    # before 2024-02: a has 2024-01 pending, b is settled, c paid nothing since 2023-12
+    np.testing.assert_array_equal(m.retards("2024-02"), [1, 0, 2])
+    np.testing.assert_array_equal(m.en_retard("2024-02"), [True, False, True])
+
+
+def test_codes():
+    m = _matrice()
+    np.testing.assert_array_equal(m.codes(jusqu_a="2024-01"), [
+        [REGLE, REGLE, EN_ATTENTE, NON_ATTENDU],
+        [NON_ATTENDU, NON_ATTENDU, REGLE, REGLE],
+        [NON_ATTENDU, MANQUANT, MANQUANT, NON_ATTENDU],
+    ])
+
+
+def test_premier_mois():
+    assert premier_mois([{"mois_debut": "2023-05"}, {}], "2024-01") == "2023-05"
+    assert premier_mois([{"mois_debut": "2024-05"}], "2024-01") == "2024-01"
+
+
+def test_route_matrice_sur_deux_annees(api):
+    alice = api.participant("Alice", mois_debut="2023-12")
+    api.paiement(alice, "2023-12")
+    api.paiement(alice, "2024-01", statut="en_attente")
+    bob = api.participant("Bob", mois_debut="2023-01")
+    api.paiement(bob, "2024-02", montant=30)
+    api.participant("Ancien", mois_debut="2023-01", actif=False)
+
+    matrice = api.get("/api/kpi/matrix", params={"from": "2023-11", "to": "2024-02"}).json()
+    assert matrice['mois'] == ["2023-11", "2023-12", "2024-01", "2024-02"]
+    assert matrice['legende'] == ["non_attendu", "manquant", "en_attente", "regle"]
+    lignes = {p['nom']: i for i, p in enumerate(matrice['participants'])}
+    assert list(lignes) == ["Admin", "Alice", "Bob"]
+
+    assert matrice['statuts'][lignes["Alice"]] == [NON_ATTENDU, REGLE, EN_ATTENTE, MANQUANT]
+    assert matrice['statuts'][lignes["Bob"]] == [MANQUANT, MANQUANT, MANQUANT, REGLE]
+    assert matrice['statuts'][lignes["Admin"]] == [NON_ATTENDU] * 4
+    assert matrice['montants'][lignes["Bob"]] == [0, 0, 0, 30]
+
+    alice = matrice['participants'][lignes["Alice"]]
+    assert (alice['attendu'], alice['paye'], alice['en_attente'], alice['manquant'], alice['mois_en_retard']) == \
+        (150, 50, 50, 100, 2)
+
+    inactifs = api.get("/api/kpi/matrix", params={"from": "2023-11", "to": "2024-02", "actif": "false"}).json()
+    assert [p['nom'] for p in inactifs['participants']] == ["Ancien"]
+
+
+@pytest.mark.parametrize("params", [
+    {"from": "2024-03", "to": "2024-02"},
+    {"from": "2000-01", "to": "2024-02"},
+    {"from": "2024-1", "to": "2024-02"},
+])
+def test_route_matrice_periode_invalide(api, params):
+    assert api.get("/api/kpi/matrix", params=params).status_code == 400
@@ -0,0 +1,133 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import limitation
+from limitation import Limiteur, SeauxJetons
+
+
+def test_rafale_puis_recharge():
+    seaux = SeauxJetons(3, 60)  # one token per second
+    assert [seaux.prendre("ip", 0.0) for _ in range(3)] == [0, 0, 0]
+    assert seaux.prendre("ip", 0.0) == pytest.approx(1.0)
+    assert seaux.prendre("ip", 0.5) == pytest.approx(0.5)
+    assert seaux.prendre("ip", 1.5) == 0
+    assert seaux.prendre("autre", 1.5) == 0
+
+
+def test_recharge_plafonnee():
+    seaux = SeauxJetons(2, 60)
+    seaux.prendre("ip", 0.0)
+    seaux.prendre("ip", 0.0)
+    assert [seaux.prendre("ip", 1000.0) for _ in range(2)] == [0, 0]
+    assert seaux.prendre("ip", 1000.0) > 0
+
+
+def test_debit_nul_desactive():
+    seaux = SeauxJetons(0, 0)
+    assert not seaux.actif()
+    assert all(seaux.prendre("ip", 0.0) == 0 for _ in range(10))
+    assert len(seaux) == 0
+
+
+def test_cles_les_moins_recentes_oubliees():
+    seaux = SeauxJetons(1, 60, max_cles=2)
+    seaux.prendre("a", 0.0)
+    seaux.prendre("b", 0.0)
+    seaux.prendre("a", 0.0)
+    seaux.prendre("c", 0.0)
+    assert len(seaux) == 2
+    assert seaux.prendre("b", 0.0) == 0  # forgotten: full bucket again
+    assert seaux.prendre("c", 0.0) > 0
+
+
+def test_echecs_doublent_le_delai(monkeypatch):
+    instant = [100.0]
+    monkeypatch.setattr(limitation, "time", SimpleNamespace(monotonic=lambda: instant[0]))
+    monkeypatch.setattr(limitation, "LOGIN_DELAI_BASE", 1.0)
+    monkeypatch.setattr(limitation, "LOGIN_DELAI_MAX", 5.0)
+    limiteur = Limiteur()
+    cle = Limiteur.cle_email("c1", " Marie@Example.ch ")
+    assert cle == "c1:marie@example.ch"
+
+    delais = []
+    for _ in range(4):
+        limiteur.echec(cle)
+        delais.append(limiteur._echecs[cle][1] - instant[0])
+    assert delais == [1.0, 2.0, 4.0, 5.0]
+
+    with pytest.raises(HTTPException) as e:
+        limiteur.verifier(cle, "10.0.0.1")
+    assert e.value.status_code == 429
+    assert e.value.headers["Retry-After"] == "5"
+    assert limiteur.refus["delai"] == 1
+
+    instant[0] += 5
+    limiteur.verifier(cle, "10.0.0.1")
+    limiteur.succes(cle)
+    assert cle not in limiteur._echecs
+
+
+def test_verifier_refuse_l_email_en_rafale(monkeypatch):
+    monkeypatch.setattr(limitation, "time", SimpleNamespace(monotonic=lambda: 0.0))
+    limiteur = Limiteur()
+    limiteur.emails = SeauxJetons(2, 60)
+    limiteur.verifier("c1:a@x.ch", None)
+    limiteur.verifier("c1:a@x.ch", None)
+    with pytest.raises(HTTPException) as e:
+        limiteur.verifier("c1:a@x.ch", None)
+    assert e.value.status_code == 429
+    assert limiteur.refus["email"] == 1
+
+
+def _connexion(api, password, email="alice@example.ch"):
+    return api.client.post("/api/auth/login", json={"email": email, "password": password})
+
+
+def test_login_bloque_apres_un_echec(api, monkeypatch):
+    instant = [100.0]
+    monkeypatch.setattr(limitation, "time", SimpleNamespace(monotonic=lambda: instant[0]))
+    api.participant("Alice")
+
+    assert _connexion(api, "faux").status_code == 401
+    reponse = _connexion(api, "secret")
+    assert reponse.status_code == 429
+    assert reponse.headers["Retry-After"] == "1"
+    assert limitation.limiteur.refus["delai"] == 1
+
+    instant[0] += 1
+    assert _connexion(api, "secret").status_code == 200
+    assert not limitation.limiteur._echecs
+
+
+def test_login_email_inconnu_compte_comme_echec(api):
+    assert _connexion(api, "secret", email="personne@example.ch").status_code == 401
+    assert _connexion(api, "secret", email="personne@example.ch").status_code == 429
+    assert limitation.limiteur.echecs_total == 1
+
+
+def test_login_rafale_par_ip(api):
+    api.participant("Alice")
+    limitation.limiteur.ips = SeauxJetons(2, 60)
+    assert _connexion(api, "secret").status_code == 200
+    assert _connexion(api, "secret").status_code == 200
+    # Another email from the same client is refused too
+    reponse = _connexion(api, "secret", email=api.admin['email'])
+    assert reponse.status_code == 429 and int(reponse.headers["Retry-After"]) >= 1
+    assert limitation.limiteur.refus["ip"] == 1
+
+
+def test_login_sature(api, monkeypatch):
+    api.participant("Alice")
+    monkeypatch.setattr(limitation, "LOGIN_MAX_VERIFICATIONS", 0)
+    reponse = _connexion(api, "secret")
+    assert reponse.status_code == 503 and reponse.headers["Retry-After"] == "1"
+
+
+def test_refus_dans_les_metriques(api):
+    _connexion(api, "faux")
+    _connexion(api, "faux")
+    texte = api.get("/metrics").text
+    assert 'login_rejections_total{reason="delai"} 1' in texte
+    assert "login_failures_total 1" in texte
@@ -0,0 +1,83 @@
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+import metriques
+
+
+@pytest.fixture
+def petite_app():
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        if item_id == "absent":
+            raise HTTPException(status_code=404)
+        return {"id": item_id}
+
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    registre = metriques.Registre()
+    app.add_middleware(metriques.MetriquesMiddleware, registre=registre)
+    with TestClient(app, raise_server_exceptions=False) as client:
+        yield client, registre
+
+
+def test_series_par_modele_de_route(petite_app):
+    client, registre = petite_app
+    for item_id in ("a", "b", "absent"):
+        client.get(f"/items/{item_id}")
+    client.get("/nulle/part")
+
+    serie = registre.series[("GET", "/items/{item_id}")]
+    assert serie.statuts == {200: 2, 404: 1}
+    assert sum(serie.durees.comptes) == 3 and serie.erreurs == 0
+    assert registre.series[("GET", metriques.ROUTE_INCONNUE)].statuts == {404: 1}
+    assert not registre.en_cours
+
+
+def test_exceptions_comptees_en_erreur(petite_app):
+    client, registre = petite_app
+    assert client.get("/boom").status_code == 500
+    serie = registre.series[("GET", "/boom")]
+    assert serie.erreurs == 1 and serie.statuts == {500: 1}
+
+
+def test_exposition(petite_app):
+    client, registre = petite_app
+    client.get("/items/a")
+    texte = registre.exposer()
+    assert 'http_requests_total{method="GET",route="/items/{item_id}",status="200"} 1' in texte
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/items/{item_id}",le="+Inf"} 1' in texte
+    assert 'http_response_size_bytes_count{method="GET",route="/items/{item_id}"} 1' in texte
+    assert "# TYPE http_requests_in_flight gauge" in texte
+
+
+def test_histogramme_cumule():
+    histogramme = metriques.Histogramme((1, 10))
+    for valeur in (0.5, 1, 5, 50):
+        histogramme.observer(valeur)
+    assert list(histogramme.cumules()) == [("1", 2), ("10", 3), ("+Inf", 4)]
+    assert histogramme.somme == 56.5
+
+
+def test_labels_echappes():
+    assert metriques._labels("GET", 'a"b\\c') == '{method="GET",route="a\\"b\\\\c"}'
+
+
+def test_route_metrics(api):
+    assert api.client.get("/metrics").status_code == 401
+    assert api.get("/metrics", api.participant("Alice")).status_code == 403
+
+    api.get("/api/paiements/all")
+    reponse = api.get("/metrics")
+    assert reponse.status_code == 200
+    assert reponse.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="GET",route="/api/paiements/all",status="200"}' in reponse.text
+
+
+def test_route_metrics_depuis_ip_autorisee(api, monkeypatch):
+    monkeypatch.setattr(api.server, "METRICS_ALLOWED_IPS", frozenset({"testclient"}))
+    assert api.client.get("/metrics").status_code == 200
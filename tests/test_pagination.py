@@ -0,0 +1,77 @@
+import pytest
+from fastapi import HTTPException
+
+from pagination import decode_cursor, encode_cursor, filtre_apres
+
+
+def test_curseur_aller_retour():
+    valeurs = ["2024-03", "Dupont é", 12]
+    curseur = encode_cursor(valeurs)
+    assert "=" not in curseur
+    assert decode_cursor(curseur, 3) == valeurs
+
+
+@pytest.mark.parametrize("curseur", ["pas un curseur!", encode_cursor(["a"]), encode_cursor(["a", "b", "c"])])
+def test_curseur_invalide(curseur):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(curseur, 2)
+    assert e.value.status_code == 400
+
+
+def test_curseur_pas_une_liste():
+    import base64
+    curseur = base64.urlsafe_b64encode(b'{"a": 1}').decode().rstrip("=")
+    with pytest.raises(HTTPException):
+        decode_cursor(curseur, 1)
+
+
+def test_filtre_apres():
+    assert filtre_apres(["nom", "id"], ["Dupont", "p7"]) == {"$or": [
+        {"nom": {"$gt": "Dupont"}},
+        {"nom": "Dupont", "id": {"$gt": "p7"}},
+    ]}
+
+
+def _pages(api, url, **params):
+    items, after, totaux = [], None, []
+    while True:
+        page = api.get(url, params={**params, **({"after": after} if after else {})}).json()
+        items += page['items']
+        totaux.append(page['total'])
+        after = page['next_cursor']
+        if not after:
+            return items, totaux
+
+
+def test_pages_de_paiements(api):
+    alice = api.participant("Alice")
+    bob = api.participant("Bob")
+    for m in range(1, 8):
+        api.paiement(alice, f"2024-{m:02d}", statut="confirme" if m % 2 else "en_attente")
+        api.paiement(bob, f"2024-{m:02d}", methode="VIREMENT")
+    api.paiement(alice, "2023-12")
+
+    items, totaux = _pages(api, "/api/paiements/all", limit=3, mois="2024")
+    assert len(items) == 14 and len({p['id'] for p in items}) == 14
+    assert [p['mois'] for p in items] == sorted(p['mois'] for p in items)
+    assert totaux == [14, None, None, None, None]
+
+    items, totaux = _pages(api, "/api/paiements/all", limit=2, statut="en_attente", participant_id=alice['id'])
+    assert [p['mois'] for p in items] == ["2024-02", "2024-04", "2024-06"]
+    assert totaux[0] == 3
+    items, _ = _pages(api, "/api/paiements/all", methode="VIREMENT", mois="2024-03")
+    assert [p['participant_id'] for p in items] == [bob['id']]
+
+
+def test_pages_de_participants(api):
+    for nom in ("Emma", "Bob", "Dora", "Carl"):
+        api.participant(nom)
+    api.participant("Zed", actif=False)
+    items, totaux = _pages(api, "/api/participants", limit=2, actif=True)
+    assert [p['nom'] for p in items] == ["Admin", "Bob", "Carl", "Dora", "Emma"]
+    assert totaux == [5, None, None]
+    assert all("password" not in p for p in items)
+
+
+def test_curseur_invalide_refuse(api):
+    assert api.get("/api/paiements/all", params={"after": "xyz"}).status_code == 400
@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import bcrypt
+import httpx
+import pytest
+
+import passwords
+
+ROUNDS_LENT = 10  # about 0.1 s per verification, enough to see a blocked loop
+
+
+def test_hash_et_verification():
+    async def scenario():
+        hashed = await passwords.hash_password("secret")
+        return hashed, await passwords.verify_password("secret", hashed), await passwords.verify_password("autre", hashed)
+    hashed, bon, mauvais = asyncio.run(scenario())
+    assert hashed.startswith(f"$2b${passwords.BCRYPT_ROUNDS:02d}$")
+    assert (bon, mauvais) == (True, False)
+
+
+@pytest.mark.parametrize("ecart, attendu", [(-1, True), (0, False), (1, False)])
+def test_needs_rehash_seulement_si_plus_faible(ecart, attendu):
+    hashed = f"$2b${passwords.BCRYPT_ROUNDS + ecart:02d}$" + "x" * 53
+    assert passwords.needs_rehash(hashed) is attendu
+
+
+def test_needs_rehash_hash_illisible():
+    assert passwords.needs_rehash("pas un hash bcrypt")
+
+
+async def _retard_max(travail, pas=0.005):
+    """Largest delay of a 5 ms ticker on the event loop while ``travail`` runs"""
+    retard = 0.0
+    fini = asyncio.Event()
+
+    async def ticker():
+        nonlocal retard
+        while not fini.is_set():
+            debut = time.perf_counter()
+            await asyncio.sleep(pas)
+            retard = max(retard, time.perf_counter() - debut - pas)
+
+    tache = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    try:
+        await travail()
+    finally:
+        fini.set()
+        await tache
+    return retard
+
+
+def _hash_lent():
+    """A slow hash, and how long verifying it takes"""
+    hashed = bcrypt.hashpw(b"secret", bcrypt.gensalt(ROUNDS_LENT)).decode()
+    debut = time.perf_counter()
+    passwords.verify_password_sync("secret", hashed)
+    return hashed, time.perf_counter() - debut
+
+
+def test_verifications_concurrentes_ne_bloquent_pas_la_boucle():
+    hashed, duree = _hash_lent()
+
+    async def connexions():
+        resultats = await asyncio.gather(*[passwords.verify_password("secret", hashed) for _ in range(8)])
+        assert all(resultats)
+
+    # Run on the loop, a single verification would delay the ticker by ``duree``
+    assert asyncio.run(_retard_max(connexions)) < duree / 2
+
+
+def test_connexions_concurrentes_ne_bloquent_pas_la_boucle(api):
+    hashed, duree = _hash_lent()
+    emails = [api.participant(f"P{i}", password=hashed)['email'] for i in range(4)]
+
+    async def connexions():
+        transport = httpx.ASGITransport(app=api.server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            reponses = await asyncio.gather(*[
+                client.post("/api/auth/login", json={"email": email, "password": "secret"}) for email in emails
+            ])
+        assert [r.status_code for r in reponses] == [200] * len(emails)
+
+    assert api.appeler(_retard_max, connexions) < duree / 2
@@ -0,0 +1,21 @@
+def test_destinataires_des_rappels(api):
+    alice = api.participant("Alice", mois_debut="2024-01")
+    bob = api.participant("Bob", mois_debut="2024-01")
+    api.paiement(bob, "2024-03", statut="en_attente")
+    api.participant("Carol", mois_debut="2024-04")
+    api.participant("Dan", mois_debut="2024-01", actif=False)
+    eve = api.participant("Eve", mois_debut=None)
+    fred = api.participant("Fred", mois_debut="2023-06")
+    api.paiement(fred, "2024-02")
+    api.participant("Gina", mois_debut="2024-01", cagnotte_id="autre")
+
+    apercu = api.get("/api/notifications/reminders-preview", params={"mois": "2024-03"}).json()
+    assert apercu['mois'] == "2024-03"
+    assert sorted(d['id'] for d in apercu['destinataires']) == sorted([alice['id'], eve['id'], fred['id']])
+    assert apercu['total'] == 3
+    assert set(apercu['destinataires'][0]) == {"id", "nom", "email"}
+
+
+def test_mois_invalide(api):
+    assert api.get("/api/notifications/reminders-preview", params={"mois": "2024-3"}).status_code == 400
+    assert api.post("/api/notifications/send-reminders", params={"mois": "mars"}).status_code == 400
@@ -0,0 +1,85 @@
+import json
+from typing import List
+
+import pytest
+from fastapi import Response
+from pydantic import BaseModel, ConfigDict, TypeAdapter
+
+import reponses
+
+MODES = ["adapter", "confiance", "off"]
+CHAMPS_PRIVES = {"_id", "cagnotte_id", "password", "admin", "versement"}
+
+
+class Ligne(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    montant: float
+
+
+LIGNES = TypeAdapter(List[Ligne])
+
+
+def test_encoder_adapter_valide():
+    assert json.loads(reponses.encoder(LIGNES, [{"id": "a", "montant": 5, "secret": 1}], "adapter")) == \
+        [{"id": "a", "montant": 5.0}]
+
+
+def test_encoder_confiance_sans_validation():
+    # Only safe on documents projected on the model's fields
+    assert json.loads(reponses.encoder(LIGNES, [{"id": "a", "montant": 5, "secret": 1}], "confiance")) == \
+        [{"id": "a", "montant": 5, "secret": 1}]
+
+
+def test_reponse_json_garde_les_entetes(monkeypatch):
+    monkeypatch.setattr(reponses, "JSON_RAPIDE", "adapter")
+    response = Response()
+    response.headers["ETag"] = 'W/"abc"'
+    reponse = reponses.reponse_json(LIGNES, [{"id": "a", "montant": 5}], response)
+    assert reponse.media_type == "application/json"
+    assert reponse.headers["etag"] == 'W/"abc"'
+    assert int(reponse.headers["content-length"]) == len(reponse.body)
+
+
+def test_reponse_json_off(monkeypatch):
+    monkeypatch.setattr(reponses, "JSON_RAPIDE", "off")
+    contenu = [{"id": "a", "montant": 5}]
+    assert reponses.reponse_json(LIGNES, contenu, Response()) is contenu
+
+
+def test_projection_modele(api):
+    projection = api.server.projection_modele(api.server.Paiement)
+    assert projection["_id"] == 0
+    assert not CHAMPS_PRIVES & {k for k, v in projection.items() if v}
+
+
+@pytest.fixture
+def donnees(api):
+    alice = api.participant("Alice", admin=False)
+    api.paiement(alice, "2024-01")
+    api.paiement(alice, "2024-02", statut="en_attente", methode="DEPENSE", raison="Apéro")
+    return alice
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_listes_sans_champs_prives(api, donnees, monkeypatch, mode):
+    monkeypatch.setattr(reponses, "JSON_RAPIDE", mode)
+    listes = [
+        api.get("/api/participants").json()['items'],
+        api.get("/api/paiements/all").json()['items'],
+        api.get("/api/paiements", donnees).json(),
+    ]
+    for liste in listes:
+        assert liste
+        for element in liste:
+            assert not CHAMPS_PRIVES & set(element), element
+
+
+def test_meme_corps_dans_tous_les_modes(api, donnees, monkeypatch):
+    corps = {}
+    for mode in MODES:
+        monkeypatch.setattr(reponses, "JSON_RAPIDE", mode)
+        reponse = api.get("/api/paiements/all")
+        assert reponse.status_code == 200 and "ETag" in reponse.headers
+        corps[mode] = reponse.json()
+    assert corps["adapter"] == corps["confiance"] == corps["off"]
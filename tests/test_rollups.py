@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+
+import rollups
+
+MOIS_ACTUEL = datetime.now(timezone.utc).strftime("%Y-%m")
+
+
+def test_est_regle():
+    assert rollups.est_regle({"nombres": {"confirme": 2, "en_attente": 0}})
+    assert not rollups.est_regle({"nombres": {"confirme": 1, "en_attente": 1}})
+    assert not rollups.est_regle({"nombres": {"confirme": 0}})
+    assert not rollups.est_regle({})
+
+
+def test_inc_regroupe_par_mois():
+    paiements = [
+        {"cagnotte_id": "c", "participant_id": "a", "mois": "2024-01", "statut": "confirme", "montant": 50},
+        {"cagnotte_id": "c", "participant_id": "a", "mois": "2024-01", "statut": "confirme", "montant": 10},
+        {"cagnotte_id": "c", "participant_id": "a", "mois": "2024-02", "statut": "en_attente", "montant": 50},
+    ]
+    assert rollups._inc(paiements, -1) == {
+        ("c", "a", "2024-01"): {"montants.confirme": -60, "nombres.confirme": -2},
+        ("c", "a", "2024-02"): {"montants.en_attente": -50, "nombres.en_attente": -1},
+    }
+
+
+def _sans_derive(api):
+    return api.appeler(rollups.recalculer, api.db, api.admin['cagnotte_id'], None, True) == []
+
+
+def test_routes_tiennent_les_rollups_a_jour(api):
+    alice = api.participant("Alice")
+    bob = api.participant("Bob")
+    declare = api.post("/api/paiements", user=alice, json={"mois": MOIS_ACTUEL, "montant": 50, "methode": "TWINT"}).json()
+    api.post("/api/paiements", user=bob, json={"mois": MOIS_ACTUEL, "montant": 40, "methode": "VIREMENT"})
+    assert _sans_derive(api)
+    api.put(f"/api/paiements/{declare['id']}", json={"montant": 45})
+    assert _sans_derive(api)
+    api.post("/api/paiements/confirm-month", params={"mois": MOIS_ACTUEL})
+    assert _sans_derive(api)
+    api.post("/api/depenses", json={"participants": [alice['id'], bob['id']], "montant_total": 30,
+                                    "raison": "Cadeau", "repartition": "egale"})
+    assert _sans_derive(api)
+    api.delete(f"/api/paiements/{declare['id']}")
+    assert _sans_derive(api)
+
+    rollup = api.appeler(api.db.paiement_rollups.find_one, {"participant_id": alice['id'], "mois": MOIS_ACTUEL})
+    assert rollup['montants'] == {"confirme": 15, "en_attente": 0}
+    assert rollup['nombres'] == {"confirme": 1, "en_attente": 0}
+
+
+def test_kpi_participant_depuis_les_rollups(api):
+    alice = api.participant("Alice")
+    api.paiement(alice, MOIS_ACTUEL, montant=20)
+    api.paiement(alice, MOIS_ACTUEL, montant=50, methode="DEPENSE", statut="en_attente")
+    assert api.get("/api/kpi/participant", user=alice).json() == {
+        "total_confirme_annee": 20, "en_attente_annee": 50, "reste_mois": 30
+    }
+
+
+def test_recalculer_corrige_une_derive(api):
+    alice = api.participant("Alice")
+    api.paiement(alice, "2024-03")
+    api.appeler(api.db.paiement_rollups.update_one, {"participant_id": alice['id']}, {"$inc": {"montants.confirme": 7}})
+    api.appeler(api.db.paiement_rollups.insert_one, {
+        "cagnotte_id": alice['cagnotte_id'], "participant_id": alice['id'], "mois": "2024-04",
+        "montants": {"confirme": 5}, "nombres": {"confirme": 1}
+    })
+    cagnotte_id = alice['cagnotte_id']
+    assert len(api.appeler(rollups.recalculer, api.db, cagnotte_id, None, True)) == 2
+    assert len(api.appeler(rollups.recalculer, api.db, cagnotte_id)) == 2
+    assert api.appeler(rollups.recalculer, api.db, cagnotte_id) == []
+    assert api.appeler(api.db.paiement_rollups.count_documents, {"participant_id": alice['id']}) == 1
@@ -0,0 +1,64 @@
+import pytest
+from starlette.requests import Request
+
+import versions
+
+
+def _requete(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "query_string": b"", "headers": headers})
+
+
+@pytest.mark.parametrize("if_none_match, attendu", [
+    (None, False),
+    ('W/"abc"', True),
+    ('"abc"', True),
+    ('"xyz", W/"abc"', True),
+    ('*', True),
+    ('"xyz"', False),
+])
+def test_correspond_comparaison_faible(if_none_match, attendu):
+    assert versions.correspond(_requete(if_none_match), 'W/"abc"') is attendu
+
+
+def test_get_conditionnel(api):
+    alice = api.participant("Alice")
+    reponse = api.get("/api/paiements", alice)
+    etag = reponse.headers["ETag"]
+    assert reponse.status_code == 200 and etag.startswith('W/"')
+
+    inchange = api.get("/api/paiements", alice, headers={"If-None-Match": etag})
+    assert inchange.status_code == 304
+    assert inchange.content == b""
+    assert inchange.headers["ETag"] == etag
+
+    # Another user's copy of the same route has its own tag
+    assert api.get("/api/paiements", api.participant("Bob")).headers["ETag"] != etag
+
+
+def test_ecriture_change_l_etag(api):
+    alice = api.participant("Alice")
+    bob = api.participant("Bob")
+    etag_alice = api.get("/api/paiements", alice).headers["ETag"]
+    etag_admin = api.get("/api/paiements/all").headers["ETag"]
+
+    # Bob's paiements leave Alice's list untouched
+    declaration = {"mois": "2024-02", "montant": 50, "methode": "TWINT"}
+    assert api.post("/api/paiements", bob, json=declaration).status_code == 200
+    assert api.get("/api/paiements", alice, headers={"If-None-Match": etag_alice}).status_code == 304
+    reponse = api.get("/api/paiements/all", headers={"If-None-Match": etag_admin})
+    assert reponse.status_code == 200 and reponse.headers["ETag"] != etag_admin
+
+    assert api.post("/api/paiements", alice, json=declaration).status_code == 200
+    reponse = api.get("/api/paiements", alice, headers={"If-None-Match": etag_alice})
+    assert reponse.status_code == 200
+    assert reponse.headers["ETag"] != etag_alice
+    assert [p['mois'] for p in reponse.json()] == ["2024-02"]
+
+
+def test_config_conditionnelle_sans_authentification(api):
+    etag = api.client.get("/api/config").headers["ETag"]
+    assert api.client.get("/api/config", headers={"If-None-Match": etag}).status_code == 304
+
+    assert api.put("/api/config/titre", params={"value": "Cagnotte"}).status_code == 200
+    assert api.client.get("/api/config", headers={"If-None-Match": etag}).status_code == 200